@@ -0,0 +1,246 @@
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from diagnostico import (DATASETS, LRU, PARAMETROS_PADRAO, CacheDatasets, load_dataset, load_holidays, prepare_bundle,
+                         resumo_analitico, resumo_json)
+
+# API HTTP local (JSON) com os números do "Resumo Analítico", sem a UI do Streamlit.
+#
+#   python api.py --porta 8765 --dados ./clientes --workers 4
+#
+#   PUT  /clientes/<id>/<dataset>?nome=arquivo.csv   corpo = arquivo exportado (guarda o cliente)
+#   GET  /resumo?cliente=<id>&dias_em_risco=2&empresas=A,B&excluir_responsaveis=C&hoje=2025-07-31&dias_uteis=1&uf=SP
+#   POST /resumo  {"cliente": "<id>"} ou {"arquivos": {"entregas": {"nome": "x.csv", "base64": "..."}},
+#                  "parametros": {...}, "filtros": {"empresas": ["A"], "responsaveis": {"excluir": ["C"]}},
+#                  "hoje": "2025-07-31", "dias_uteis": true, "uf": "SP"}
+#   GET  /saude
+#
+# <dataset>: entregas, solicitacoes, obrigacoes, processos, responsaveis
+
+_ID_VALIDO = re.compile(r"^[\w.-]+$")
+_FILTROS = ["empresas", "departamentos", "responsaveis"]
+
+class Servico:
+    def __init__(self, pasta_dados: str, cache_resultados: int = 256, memoria_mb: int = 1024):
+        self.pasta_dados = pasta_dados
+        self.resultados = LRU(cache_resultados)
+        # seções do resumo: mudar só um limite recalcula só a seção que depende dele
+        self.secoes = LRU(cache_resultados)
+        # datasets tratados: orçamento de memória, excedente vai para o disco (formato colunar)
+        self.datasets = CacheDatasets(memoria_mb=memoria_mb)
+
+    # ----- clientes guardados -----
+    def _pasta_cliente(self, cliente: str) -> str:
+        if not _ID_VALIDO.match(cliente or ""):
+            raise ValueError("id de cliente inválido")
+        return os.path.join(self.pasta_dados, cliente)
+
+    def guardar(self, cliente: str, dataset: str, nome: str, conteudo: bytes):
+        if dataset not in DATASETS:
+            raise ValueError(f"dataset desconhecido: {dataset}")
+        pasta = self._pasta_cliente(cliente)
+        os.makedirs(pasta, exist_ok=True)
+        for antigo in os.listdir(pasta):
+            if antigo.split(".")[0] == dataset:
+                os.remove(os.path.join(pasta, antigo))
+        ext = os.path.splitext(nome)[1].lower() or ".csv"
+        with open(os.path.join(pasta, dataset + ext), "wb") as f:
+            f.write(conteudo)
+
+    def arquivos_cliente(self, cliente: str) -> dict:
+        pasta = self._pasta_cliente(cliente)
+        if not os.path.isdir(pasta):
+            raise KeyError(f"cliente não encontrado: {cliente}")
+        arquivos = {}
+        for nome in os.listdir(pasta):
+            dataset = nome.split(".")[0]
+            if dataset in DATASETS:
+                with open(os.path.join(pasta, nome), "rb") as f:
+                    arquivos[dataset] = (nome, f.read())
+        return arquivos
+
+    # ----- cálculo -----
+    def _dados(self, arquivos: dict, hoje, calendario, cliente: str = None) -> tuple:
+        # calendario: None (dias corridos) ou a UF dos feriados ("" = só nacionais)
+        # cliente: guardado; a unificação de empresas dele fica na pasta dele
+        feriados = load_holidays(calendario or None) if calendario is not None else None
+        hashes = sorted((ds, hashlib.sha1(conteudo).hexdigest()) for ds, (_, conteudo) in arquivos.items())
+        chave = hashlib.sha1(json.dumps([hashes, str(hoje), calendario, cliente]).encode()).hexdigest()
+        dados = self.datasets.get(chave)
+        if dados is None:
+            brutos = {DATASETS[ds]: load_dataset(io.BytesIO(conteudo), nome, ds, hoje, feriados=feriados)
+                      for ds, (nome, conteudo) in arquivos.items()}
+            dados = prepare_bundle(brutos, hoje, feriados=feriados, cliente=cliente,
+                                   pasta_empresas=self._pasta_cliente(cliente) if cliente else None)
+            self.datasets.put(chave, dados)
+        return chave, dados, feriados
+
+    def resumo(self, arquivos: dict, params: dict, filtros: dict, hoje, calendario=None, cliente: str = None) -> dict:
+        if not arquivos:
+            raise ValueError("nenhum arquivo enviado")
+        chave_dados, dados, feriados = self._dados(arquivos, hoje, calendario, cliente)
+        chave = json.dumps([chave_dados, params, filtros, str(hoje)], sort_keys=True, default=str)
+        res = self.resultados.get(chave)
+        if res is None:
+            res = resumo_json(resumo_analitico(dados.get("dfe"), dados.get("dfs"), dados.get("dfp"), hoje, params, filtros,
+                                               feriados=feriados, memo=self.secoes,
+                                               versoes={k: chave_dados for k in ["dfe", "dfs", "dfp"]}))
+            self.resultados.put(chave, res)
+        return res
+
+def _filtro(valor):
+    # lista = só esses; {"excluir": [...]} = todos menos esses; vazio = todos
+    if isinstance(valor, dict):
+        valor = {k: list(v) for k, v in valor.items() if k in ("incluir", "excluir") and v}
+        return valor or None
+    return list(valor) or None
+
+def _params_de_query(q: dict) -> tuple:
+    params = {k: int(q[k][0]) for k in PARAMETROS_PADRAO if k in q}
+    filtros = {}
+    for k in _FILTROS:
+        incluir = [v for v in q.get(k, [""])[0].split(",") if v]
+        excluir = [v for v in q.get(f"excluir_{k}", [""])[0].split(",") if v]
+        if incluir or excluir:
+            filtros[k] = {"incluir": incluir, "excluir": excluir} if excluir else incluir
+    return params, filtros
+
+def _calendario(dias_uteis, uf):
+    if str(dias_uteis).lower() not in ("1", "true", "sim"):
+        return None
+    return (uf or "").upper()
+
+def _hoje(valor):
+    return pd.Timestamp(valor).date() if valor else date.today()
+
+def criar_handler(servico: Servico):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # cada conexão ocupa um worker do pool: uma resposta por conexão e prazo para clientes parados
+        timeout = 10
+
+        def _responder(self, status: int, corpo: dict):
+            dados = json.dumps(corpo, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(dados)))
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            self.wfile.write(dados)
+
+        def _corpo(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def _tratar(self, fn):
+            try:
+                self._responder(200, fn())
+            except KeyError as e:
+                self._responder(404, {"erro": str(e.args[0] if e.args else e)})
+            except (ValueError, TypeError, json.JSONDecodeError) as e:
+                self._responder(400, {"erro": str(e)})
+            except Exception as e:
+                self._responder(500, {"erro": f"{type(e).__name__}: {e}"})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            q = parse_qs(url.query)
+            if url.path == "/saude":
+                return self._responder(200, {"ok": True, "cache": servico.datasets.stats()})
+            if url.path == "/resumo":
+                def fn():
+                    params, filtros = _params_de_query(q)
+                    cliente = q.get("cliente", [""])[0]
+                    calendario = _calendario(q.get("dias_uteis", [""])[0], q.get("uf", [""])[0])
+                    return servico.resumo(servico.arquivos_cliente(cliente), params, filtros, _hoje(q.get("hoje", [None])[0]),
+                                          calendario, cliente)
+                return self._tratar(fn)
+            self._responder(404, {"erro": "rota não encontrada"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/resumo":
+                return self._responder(404, {"erro": "rota não encontrada"})
+            def fn():
+                req = json.loads(self._corpo() or b"{}")
+                if req.get("cliente"):
+                    arquivos = servico.arquivos_cliente(req["cliente"])
+                else:
+                    arquivos = {ds: (a["nome"], base64.b64decode(a["base64"])) for ds, a in (req.get("arquivos") or {}).items()}
+                    desconhecidos = set(arquivos) - set(DATASETS)
+                    if desconhecidos:
+                        raise ValueError(f"dataset desconhecido: {', '.join(sorted(desconhecidos))}")
+                params = {k: int(v) for k, v in (req.get("parametros") or {}).items() if k in PARAMETROS_PADRAO}
+                filtros = {k: _filtro(v) for k, v in (req.get("filtros") or {}).items() if k in _FILTROS and v}
+                return servico.resumo(arquivos, params, filtros, _hoje(req.get("hoje")), _calendario(req.get("dias_uteis"), req.get("uf")),
+                                      req.get("cliente") or None)
+            self._tratar(fn)
+
+        def do_PUT(self):
+            url = urlparse(self.path)
+            partes = url.path.strip("/").split("/")
+            if len(partes) != 3 or partes[0] != "clientes":
+                return self._responder(404, {"erro": "rota não encontrada"})
+            def fn():
+                nome = parse_qs(url.query).get("nome", [partes[2] + ".csv"])[0]
+                servico.guardar(partes[1], partes[2], nome, self._corpo())
+                return {"ok": True, "cliente": partes[1], "dataset": partes[2]}
+            self._tratar(fn)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+class PoolHTTPServer(HTTPServer):
+    # atende cada conexão num pool fixo de workers (em vez de uma thread por requisição)
+    def __init__(self, endereco, handler, workers: int):
+        super().__init__(endereco, handler)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._atender, request, client_address)
+
+    def _atender(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+def main():
+    ap = argparse.ArgumentParser(description="API local do Resumo Analítico (JSON).")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--porta", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--cache-mb", type=int, default=int(os.environ.get("ACESSORIAS_CACHE_MB", 1024)),
+                    help="memória para datasets tratados; o excedente vai para o disco")
+    ap.add_argument("--dados", default=os.environ.get("ACESSORIAS_DADOS", "clientes"), help="pasta dos clientes guardados")
+    args = ap.parse_args()
+    servidor = PoolHTTPServer((args.host, args.porta), criar_handler(Servico(args.dados, memoria_mb=args.cache_mb)), args.workers)
+    print(f"API em http://{args.host}:{args.porta} (workers={args.workers}, dados={args.dados})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,32 @@
 
+import hashlib
 import io
+import os
+import uuid
+from concurrent.futures import wait
 from datetime import date, datetime, timedelta
 import numpy as np
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 
+from diagnostico import (CARTEIRA_PASTA, DATASETS, LRU, MAPAS, METRICAS_PRAZO, PARAMETROS_PADRAO, UFS, CacheDatasets,
+                         GerenciadorTarefas, Tarefa, apply_company_ids, calendar_grid, client_summary, company_names,
+                         company_reports_zip, crunch_days, deadline_counts, enrich_entregas, expand_calendar,
+                         export_workbook, fill_departamento, filtro_busca, flag_em_risco, indice_valores, ingest,
+                         late_probability, load_holidays, load_portfolio, missing_deliveries, overloaded,
+                         portfolio_trend, read_preview, resolve_client_companies, resolve_companies, resumo_analitico,
+                         resumo_markdown, resumo_por_empresa, risk_queue, save_client_summary, top_k, workload_curves,
+                         workload_intervals)
+
 st.set_page_config(page_title="Acessórias — Diagnóstico (Resumo + Relatórios)", layout="wide")
+# identifica esta sessão junto ao pool de tarefas (cancelar vale só para quem pediu)
+sessao = st.session_state.setdefault("_sessao", uuid.uuid4().hex)
+
 st.title("📊 Acessórias — Diagnóstico por Cliente")
 st.caption("Inclui **Página de Resumo** e uma página só para **Ajuste de Métricas & Relatórios**.")
 
 # ============== Helpers ==============
-def read_any_csv(uploaded_file) -> pd.DataFrame:
-    try:
-        return pd.read_csv(uploaded_file, sep=None, engine="python")
-    except Exception:
-        uploaded_file.seek(0)
-        return pd.read_csv(uploaded_file, sep=";", engine="python", encoding="utf-8", dtype=str)
-
-def try_read_excel(uploaded_file) -> pd.DataFrame:
-    try:
-        return pd.read_excel(uploaded_file, dtype=str)
-    except Exception:
-        try:
-            return pd.read_excel(uploaded_file, engine="xlrd", dtype=str)
-        except Exception as e:
-            st.error(f"Não consegui ler o arquivo Excel: {e}")
-            raise
-
-def parse_dates(df: pd.DataFrame, cols):
-    for c in cols:
-        if c in df.columns:
-            df[c] = pd.to_datetime(df[c], errors="coerce", dayfirst=True)
-    return df
-
-def to_lower_strip(df: pd.DataFrame):
-    df.columns = [str(c).strip().lower() for c in df.columns]
-    return df
-
-def _norm_status(x: str):
-    if not isinstance(x, str):
-        return x
-    s = x.strip().lower()
-    if s in ["concluido", "concluída", "concluida", "concluído", "finalizado", "feito"]:
-        return "Concluída"
-    if s in ["pendente", "em aberto", "aberto", "em andamento"]:
-        return "Pendente"
-    return x
-
 def map_columns_ui(title, df: pd.DataFrame, required_map: dict, key_prefix: str):
     st.markdown(f"#### {title}")
     st.dataframe(df.head(5))
@@ -66,199 +45,428 @@ def map_columns_ui(title, df: pd.DataFrame, required_map: dict, key_prefix: str)
     picked = {k:v for k,v in mapped.items() if v and v != "<ignorar>"}
     return picked
 
-def apply_mapping(df: pd.DataFrame, mapping: dict):
-    return df.rename(columns=mapping)
+# Tudo que depende de "hoje" recebe a data de referência, que entra na chave do cache:
+# na mesma data, flags e agregados são reaproveitados entre reruns e sessões.
+def arquivos_de(uploads) -> tuple:
+    # ((nome, bytes), ...) — chave estável para o cache, independente da ordem de envio
+    return tuple(sorted((u.name, u.getvalue()) for u in uploads))
+
+def impressao(arquivos: tuple) -> str:
+    # identifica o conteúdo enviado (e não o upload): sessões com os mesmos arquivos dividem a tarefa
+    h = hashlib.sha1()
+    for nome, conteudo in arquivos:
+        h.update(nome.encode("utf-8"))
+        h.update(hashlib.sha1(conteudo).digest())
+    return h.hexdigest()
+
+@st.cache_data(show_spinner=False)
+def amostra_planilha(arquivos: tuple) -> pd.DataFrame:
+    # só o começo dos arquivos, para o mapeamento; a leitura completa roda em segundo plano
+    return read_preview(arquivos)
+
+@st.cache_resource
+def gerenciador() -> GerenciadorTarefas:
+    # um pool por processo, compartilhado por todas as sessões
+    return GerenciadorTarefas(workers=int(os.environ.get("ACESSORIAS_WORKERS", 4)))
+
+@st.cache_resource
+def cache_datasets() -> CacheDatasets:
+    # datasets tratados, compartilhados entre sessões; acima do orçamento vão para o disco
+    return CacheDatasets(memoria_mb=int(os.environ.get("ACESSORIAS_CACHE_MB", 1024)),
+                         pasta=os.environ.get("ACESSORIAS_CACHE_DIR"))
+
+def ingerir(cache: CacheDatasets, chave, *args, tarefa=None):
+    # o resultado vai para o cache; a tarefa devolve só a chave
+    cache.put(chave, ingest(*args, tarefa=tarefa))
+    return chave
+
+def submeter(chave, fn, *args) -> Tarefa:
+    # tarefa compartilhada entre sessões pela chave; quem cancelou só volta a acompanhar pelo "Reprocessar"
+    if chave in st.session_state.setdefault("_canceladas", set()):
+        return gerenciador().obter(chave)
+    return gerenciador().submeter(chave, fn, *args, sessao=sessao)
+
+@st.fragment(run_every=0.5)
+def progresso_tarefa(chave, key_prefix: str):
+    # só este trecho volta a rodar enquanto a tarefa anda; quando ela termina, o app inteiro roda de novo
+    tarefa = gerenciador().obter(chave)
+    if tarefa is None or tarefa.pronta:
+        st.rerun()
+    c1, c2 = st.columns([5, 1])
+    c1.progress(min(tarefa.progresso, 1.0), text=f"⏳ Processando em segundo plano — {tarefa.mensagem}")
+    if c2.button("Cancelar", key=f"{key_prefix}_cancelar"):
+        gerenciador().desistir(chave, sessao)
+        st.session_state.setdefault("_canceladas", set()).add(chave)
+        st.rerun()
+
+def acompanhar(tarefa, chave, key_prefix: str) -> bool:
+    # True quando há resultado; enquanto roda, mostra progresso + cancelar (num fragmento que se atualiza sozinho).
+    # Cancelar vale para esta sessão: a tarefa continua enquanto outra sessão estiver esperando por ela.
+    canceladas = st.session_state.setdefault("_canceladas", set())
+    if chave in canceladas or (tarefa is not None and tarefa.cancelada):
+        c1, c2 = st.columns([5, 1])
+        c1.warning("Processamento cancelado.")
+        if c2.button("Reprocessar", key=f"{key_prefix}_reprocessar"):
+            canceladas.discard(chave)
+            if tarefa is not None and tarefa.cancelada:
+                gerenciador().descartar(chave)
+            st.rerun()
+        return False
+    if tarefa is None:
+        return False
+    # tarefas rápidas (ex.: relatório já memorizado) aparecem no mesmo rerun
+    wait([tarefa.future], timeout=0.2)
+    if not tarefa.pronta:
+        progresso_tarefa(chave, key_prefix)
+        return False
+    if tarefa.falhou:
+        c1, c2 = st.columns([5, 1])
+        c1.error(f"Não consegui processar: {tarefa.future.exception()}")
+        if c2.button("Reprocessar", key=f"{key_prefix}_reprocessar"):
+            gerenciador().descartar(chave)
+            st.rerun()
+        return False
+    return True
+
+def carregar_dataset(uploads, dataset: str, titulo: str, key_prefix: str, calendario):
+    # mapeamento sobre a amostra; leitura + tratamento + qualidade + índices em segundo plano.
+    # Enquanto a nova tarefa roda, as outras abas seguem com o último resultado concluído.
+    estado = DATASETS[dataset]
+    arquivos = arquivos_de(uploads)
+    mapping = map_columns_ui(titulo, amostra_planilha(arquivos), MAPAS[dataset], key_prefix)
+    chave = (dataset, impressao(arquivos), tuple(sorted(mapping.items())), data_ref, calendario)
+    # a sessão guarda só a chave; os dados ficam no cache do processo, um exemplar por conteúdo
+    pronto = cache_datasets().get(chave)
+    if pronto is None:
+        tarefa = submeter(chave, ingerir, cache_datasets(), chave, arquivos, dataset, mapping, data_ref, feriados)
+        if acompanhar(tarefa, chave, key_prefix):
+            pronto = cache_datasets().get(chave)
+            if pronto is None:
+                # saiu do cache entre o fim da tarefa e este rerun: processa de novo
+                gerenciador().descartar(chave)
+                st.rerun()
+    if pronto is not None:
+        st.session_state[f"_{estado}_ultimo"] = chave
+        painel_qualidade(*pronto["qualidade"], dataset, key_prefix)
+    else:
+        ultima = st.session_state.get(f"_{estado}_ultimo")
+        pronto = cache_datasets().get(ultima) if ultima is not None else None
+        if pronto is None:
+            return None
+        st.caption("Mostrando o último resultado concluído até o novo processamento terminar.")
+    dados[estado] = pronto["df"]
+    dados[f"{estado}_idx"] = pronto["idx"]
+    return pronto["df"]
+
+def painel_qualidade(resumo: pd.DataFrame, linhas: pd.DataFrame, dataset: str, key_prefix: str):
+    alertas = int((resumo["linhas"] > 0).sum())
+    titulo = f"🩺 Qualidade dos dados — {alertas} alerta(s)" if alertas else "🩺 Qualidade dos dados — sem alertas"
+    with st.expander(titulo, expanded=alertas > 0):
+        st.dataframe(resumo, hide_index=True)
+        if not linhas.empty:
+            st.download_button("⬇️ CSV — linhas com problema", linhas.to_csv(index=False).encode("utf-8"),
+                               f"qualidade_{dataset}.csv", "text/csv", key=f"{key_prefix}_qualidade")
+
+def dias_em_risco_atual() -> int:
+    # o parâmetro da aba Relatórios (o widget vem depois do enriquecimento no script, então lê do estado)
+    return int(st.session_state.get("dias_em_risco", PARAMETROS_PADRAO["dias_em_risco"]))
+
+def enriquecer(dados: dict, data_ref, feriados=None) -> dict:
+    # {dfe/dfs/dfp: frame enriquecido}, só os que mudaram (os originais ficam intactos)
+    out = {}
+    if unificar_empresas:
+        carregados = [k for k in ["dfe","dfs","dfp"] if isinstance(dados.get(k), pd.DataFrame)]
+        nomes = company_names([dados[k] for k in carregados])
+        if not nomes.empty:
+            resolvidos = resolver_empresas(nomes, cliente)
+            for k in carregados:
+                out[k] = apply_company_ids(dados[k], resolvidos)
+    dfe = out.get("dfe", dados.get("dfe"))
+    if isinstance(dfe, pd.DataFrame) and (up_obrig or up_resp):
+        dfe = enrich_entregas(dfe, dados.get("dfo") if up_obrig else None, dados.get("dfr") if up_resp else None)
+        if "data_vencimento" in dfe.columns:
+            dfe["em_risco"] = flag_em_risco(dfe, pd.to_datetime(data_ref), dias_em_risco_atual(), feriados)
+        out["dfe"] = dfe
+    dfp = out.get("dfp", dados.get("dfp"))
+    if isinstance(dfp, pd.DataFrame) and up_resp:
+        out["dfp"] = fill_departamento(dfp.copy(), dados.get("dfr"), ["responsavel"])
+    return out
+
+@st.cache_data(show_spinner=False)
+def calendario_faltantes(dfo: pd.DataFrame, dfe: pd.DataFrame, inicio, fim, todas_empresas: bool, feriados=None):
+    cal = expand_calendar(dfo, dfe, inicio, fim, todas_empresas, feriados)
+    return cal, missing_deliveries(cal, dfe)
+
+@st.cache_data(show_spinner=False)
+def carga_trabalho(dfe, dfp, hoje, por: str, inicio, fim) -> pd.DataFrame:
+    return workload_curves(workload_intervals(dfe, dfp, hoje), por, inicio, fim)
+
+@st.cache_data(show_spinner=False)
+def prazos_diarios(dfe: pd.DataFrame, hoje, por: str) -> dict:
+    return deadline_counts(dfe, hoje, por)
+
+@st.cache_data(show_spinner=False)
+def previsao_atraso(dfe: pd.DataFrame, hoje) -> pd.Series:
+    return late_probability(dfe, hoje)
+
+@st.cache_data(show_spinner=False)
+def resolver_empresas_sem_cliente(nomes: pd.DataFrame) -> pd.DataFrame:
+    return resolve_companies(nomes)
+
+def resolver_empresas(nomes: pd.DataFrame, cliente: str) -> pd.DataFrame:
+    # roda só sobre nomes únicos; com cliente, usa a unificação guardada dele (só nomes novos refazem o casamento)
+    return resolve_client_companies(nomes, cliente) if cliente else resolver_empresas_sem_cliente(nomes)
+
+@st.cache_data(show_spinner=False)
+def fila_acao(dfe, dfs, dfp, data_ref, k: int = 200) -> pd.DataFrame:
+    return risk_queue(dfe, dfs, dfp, data_ref, k=k)
+
+def versoes_dados() -> dict:
+    # versão de cada dataset já enriquecido: a chave da própria carga + o que entrou no enriquecimento
+    v = {k: st.session_state.get(f"_{k}_ultimo") for k in DATASETS.values()}
+    empresas = (v["dfe"], v["dfs"], v["dfp"]) if unificar_empresas else None
+    return {
+        "dfe": (v["dfe"], empresas, v["dfo"] if up_obrig else None, v["dfr"] if up_resp else None),
+        "dfs": (v["dfs"], empresas),
+        "dfp": (v["dfp"], empresas, v["dfr"] if up_resp else None),
+    }
+
+@st.cache_resource
+def memo_relatorio() -> LRU:
+    # seções do Resumo Analítico já calculadas, compartilhadas entre sessões
+    return LRU(256)
+
+def gerar_relatorio(dfe, dfs, dfp, data_ref, params, filtros, idx, feriados, versoes, tarefa=None) -> tuple:
+    tarefa.reportar(0.1, "calculando indicadores")
+    res = resumo_analitico(dfe, dfs, dfp, hoje=data_ref, params=params, filtros=filtros, idx=idx, feriados=feriados,
+                           memo=memo_relatorio(), versoes=versoes)
+    tarefa.reportar(0.9, "montando o relatório")
+    return res, resumo_markdown(res)
+
+def planilha_relatorio(res: dict, tarefa=None) -> bytes:
+    # em memória: o resultado vive na tarefa (descartada com a próxima ou pelo limite do pool), sem arquivo para sobrar
+    buf = io.BytesIO()
+    export_workbook(res, buf, tarefa)
+    return buf.getvalue()
+
+def gerar_por_empresa(dfe, dfs, dfp, data_ref, params, filtros, idx, feriados, formato, tarefa=None) -> tuple:
+    tarefa.reportar(0.0, "agrupando por empresa")
+    resumos = resumo_por_empresa(dfe, dfs, dfp, hoje=data_ref, params=params, filtros=filtros, idx=idx, feriados=feriados)
+    buf = io.BytesIO()
+    company_reports_zip(resumos, buf, formato, tarefa)
+    return buf.getvalue(), len(resumos)
+
+def assinatura_carteira(pasta: str) -> tuple:
+    # (arquivo, mtime) de cada resumo guardado: muda quando algum cliente é salvo de novo
+    if not os.path.isdir(pasta):
+        return ()
+    return tuple(sorted((e.name, e.stat().st_mtime_ns) for e in os.scandir(pasta) if e.name.endswith(".json")))
+
+@st.cache_data(show_spinner=False)
+def carteira(pasta: str, assinatura: tuple) -> dict:
+    return load_portfolio(pasta)
 
 # ============== Sidebar uploads ==============
 with st.sidebar:
     st.header("📂 Envio de planilhas (por cliente)")
-    up_entregas = st.file_uploader("Gestão de Entregas (CSV)", type=["csv"])
-    up_solic = st.file_uploader("Solicitações (XLSX/CSV)", type=["xlsx","csv"])
-    up_obrig = st.file_uploader("Obrigações (XLSX/CSV)", type=["xlsx","csv"])
-    up_proc = st.file_uploader("Gestão de Processos (XLSX/CSV)", type=["xlsx","csv"])
-    up_resp = st.file_uploader("Responsáveis & Departamentos (XLS/XLSX/CSV)", type=["xls","xlsx","csv"])
+    cliente = st.text_input("Cliente", key="cliente",
+                            help="A unificação de empresas fica guardada por cliente (os ids não mudam de um mês para o "
+                                 "outro) e o resumo vai para a Carteira com este nome.").strip()
+    st.caption("Cada campo aceita vários arquivos (ex.: 12 exportações mensais): são lidos em paralelo e unidos. "
+               "Também aceita compactados: `.csv.gz` e `.zip` com um ou vários CSV/XLSX.")
+    up_entregas = st.file_uploader("Gestão de Entregas (CSV)", type=["csv","gz","zip"], accept_multiple_files=True)
+    up_solic = st.file_uploader("Solicitações (XLSX/CSV)", type=["xlsx","csv","gz","zip"], accept_multiple_files=True)
+    up_obrig = st.file_uploader("Obrigações (XLSX/CSV)", type=["xlsx","csv","gz","zip"], accept_multiple_files=True)
+    up_proc = st.file_uploader("Gestão de Processos (XLSX/CSV)", type=["xlsx","csv","gz","zip"], accept_multiple_files=True)
+    up_resp = st.file_uploader("Responsáveis & Departamentos (XLS/XLSX/CSV)", type=["xls","xlsx","csv","gz","zip"], accept_multiple_files=True)
+    data_ref = st.date_input("📆 Data de referência", value=date.today(), format="DD/MM/YYYY",
+                             help="Todas as flags e idades são calculadas nesta data. Use uma data passada para reproduzir um diagnóstico.")
+    dias_uteis = st.checkbox("Prazos e SLAs em dias úteis", value=False,
+                             help="Idades, atrasos e durações contam só dias úteis (feriados nacionais + UF); vencimentos do calendário de obrigações que caem em fim de semana/feriado vão para o próximo dia útil.")
+    uf = st.selectbox("UF (feriados estaduais)", ["—"] + UFS, disabled=not dias_uteis)
+    feriados = load_holidays(None if uf == "—" else uf) if dias_uteis else None
+    calendario = uf if dias_uteis else None
+    unificar_empresas = st.checkbox("Unificar nomes de empresas (CNPJ + similaridade)", value=True,
+                                    help="Ex.: 'Alpha Ltda', 'ALPHA LTDA.' e 'Alpha Ltda - Matriz' viram uma só empresa.")
     st.markdown("---")
     st.caption("Mapeie colunas nas abas. O **Resumo** e os **Relatórios** usam o que estiver carregado.")
 
 # ============== Tabs ==============
-tabs = st.tabs(["🏠 Resumo", "🧾 Entregas", "📨 Solicitações", "📅 Obrigações", "⚙️ Processos", "👤 Responsáveis", "📝 Relatórios", "📦 Exportações"])
+tabs = st.tabs(["🏠 Resumo", "🧾 Entregas", "📨 Solicitações", "📅 Obrigações", "⚙️ Processos", "👤 Responsáveis", "📝 Relatórios", "📦 Exportações", "🗂️ Carteira"])
 
-# session state holders
-for key in ["dfe","dfs","dfo","dfp","dfr"]:
-    if key not in st.session_state:
-        st.session_state[key] = None
+# datasets desta execução do script: referências aos objetos do cache do processo (a sessão guarda só as chaves)
+dados = {k: None for k in ["dfe","dfs","dfo","dfp","dfr"]}
+dados.update({f"{k}_idx": {} for k in ["dfe","dfs","dfo","dfp","dfr"]})
 
 # ---------- Entregas ----------
 with tabs[1]:
     if up_entregas:
-        df_raw = read_any_csv(up_entregas)
-        df_raw = to_lower_strip(df_raw)
-        req_map = {
-            "empresa": "empresa",
-            "cnpj": "cnpj",
-            "obrigacao": "obrigação / tarefa",
-            "departamento": "departamento",
-            "responsavel_prazo": "responsável prazo",
-            "responsavel_entrega": "responsável entrega",
-            "competencia": "competência",
-            "data_vencimento": "vencimento",
-            "data_entrega": "data entrega",
-            "status": "status",
-            "protocolo": "protocolo"
-        }
-        mapping = map_columns_ui("Mapeamento — Entregas", df_raw, req_map, "ent")
-        df_ent = apply_mapping(df_raw, mapping)
-        df_ent = parse_dates(df_ent, ["data_vencimento","data_entrega","competencia"])
-        if "status" in df_ent.columns:
-            df_ent["status"] = df_ent["status"].map(_norm_status).fillna(df_ent["status"])
-
-        today = pd.to_datetime(date.today())
-        if "data_vencimento" in df_ent.columns:
-            df_ent["atrasada_concluida"] = np.where(
-                (df_ent.get("status","").str.lower()=="concluída") & df_ent.get("data_entrega").notna() & (df_ent.get("data_entrega") > df_ent.get("data_vencimento")),
-                True, False
-            )
-            df_ent["atrasada_pendente"] = np.where(
-                (df_ent.get("status","").str.lower()!="concluída") & df_ent.get("data_vencimento").notna() & (today > df_ent.get("data_vencimento")),
-                True, False
-            )
-            df_ent["em_risco"] = np.where(
-                (df_ent.get("status","").str.lower()!="concluída") & df_ent.get("data_vencimento").notna() & ((df_ent.get("data_vencimento") - today).dt.days.between(0,2)),
-                True, False
-            )
-            df_ent["pontual"] = np.where(
-                (df_ent.get("status","").str.lower()=="concluída") & df_ent.get("data_entrega").notna() & (df_ent.get("data_entrega") <= df_ent.get("data_vencimento")),
-                True, False
-            )
-            df_ent["dias_atraso"] = np.where(
-                (df_ent.get("status","").str.lower()=="concluída") & df_ent.get("data_entrega").notna(),
-                (df_ent.get("data_entrega") - df_ent.get("data_vencimento")).dt.days.clip(lower=0),
-                np.where(
-                    (df_ent.get("status","").str.lower()!="concluída") & (df_ent.get("data_vencimento").notna()),
-                    (today - df_ent.get("data_vencimento")).dt.days.clip(lower=0),
-                    np.nan
-                )
-            )
-        st.session_state["dfe"] = df_ent
-        st.success("Entregas carregadas e mapeadas.")
+        df_ent = carregar_dataset(up_entregas, "entregas", "Mapeamento — Entregas", "ent", calendario)
+        if df_ent is not None:
+            st.success("Entregas carregadas e mapeadas.")
     else:
         st.info("Envie a planilha de **Gestão de Entregas** na barra lateral.")
 
 # ---------- Solicitações ----------
 with tabs[2]:
     if up_solic:
-        df_raw = try_read_excel(up_solic) if up_solic.name.lower().endswith(".xlsx") else read_any_csv(up_solic)
-        df_raw = to_lower_strip(df_raw)
-        req_map = {
-            "id": "id da solicitação",
-            "assunto": "assunto",
-            "empresa": "empresa",
-            "status": "status",
-            "prioridade": "prioridade",
-            "responsavel": "responsável",
-            "abertura": "abertura",
-            "prazo": "prazo",
-            "ultima_atualizacao": "última atualização",
-            "conclusao": "conclusão"
-        }
-        mapping = map_columns_ui("Mapeamento — Solicitações", df_raw, req_map, "sol")
-        dfr = apply_mapping(df_raw, mapping)
-        dfr = parse_dates(dfr, ["abertura","prazo","ultima_atualizacao","conclusao"])
-        if "status" in dfr.columns:
-            dfr["status"] = dfr["status"].map(_norm_status).fillna(dfr["status"])
-
-        today = pd.to_datetime(date.today())
-        dfr["tempo_ate_conclusao_dias"] = np.where(
-            dfr.get("conclusao").notna() & dfr.get("abertura").notna(),
-            (dfr.get("conclusao") - dfr.get("abertura")).dt.days,
-            np.nan
-        )
-        dfr["aberta_ha_dias"] = np.where(
-            dfr.get("conclusao").isna() & dfr.get("abertura").notna(),
-            (today - dfr.get("abertura")).dt.days,
-            np.nan
-        )
-        st.session_state["dfs"] = dfr
-        st.success("Solicitações carregadas e mapeadas.")
+        dfr = carregar_dataset(up_solic, "solicitacoes", "Mapeamento — Solicitações", "sol", calendario)
+        if dfr is not None:
+            st.success("Solicitações carregadas e mapeadas.")
     else:
         st.info("Envie a planilha de **Solicitações** na barra lateral.")
 
 # ---------- Obrigações ----------
 with tabs[3]:
     if up_obrig:
-        df_raw = try_read_excel(up_obrig) if up_obrig.name.lower().endswith(".xlsx") else read_any_csv(up_obrig)
-        df_raw = to_lower_strip(df_raw)
-        req_map = {
-            "obrigacao": "obrigação",
-            "mini": "mini",
-            "departamento": "departamento",
-            "responsavel": "responsável",
-            "periodicidade": "periodicidade",
-            "prazo_mensal": "prazo",
-            "alerta_dias": "alerta"
-        }
-        mapping = map_columns_ui("Mapeamento — Obrigações", df_raw, req_map, "obr")
-        dfo = apply_mapping(df_raw, mapping)
-        st.session_state["dfo"] = dfo
-        st.success("Obrigações carregadas e mapeadas.")
-        if "departamento" in dfo.columns and "obrigacao" in dfo.columns:
-            fig = px.treemap(dfo, path=["departamento","obrigacao"], title="Impacto por Departamento e Obrigação")
-            st.plotly_chart(fig, use_container_width=True)
-        st.dataframe(dfo.head(50))
+        dfo = carregar_dataset(up_obrig, "obrigacoes", "Mapeamento — Obrigações", "obr", calendario)
+        if dfo is not None:
+            st.success("Obrigações carregadas e mapeadas.")
+            if "departamento" in dfo.columns and "obrigacao" in dfo.columns:
+                fig = px.treemap(dfo, path=["departamento","obrigacao"], title="Impacto por Departamento e Obrigação")
+                st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(dfo.head(50))
+
+            st.markdown("#### 🗓️ Calendário esperado & entregas faltantes")
+            dfe = dados.get("dfe")
+            if not {"obrigacao","periodicidade","prazo_mensal"}.issubset(dfo.columns):
+                st.info("Mapeie obrigação, periodicidade e prazo para gerar o calendário.")
+            elif not (isinstance(dfe, pd.DataFrame) and {"empresa","obrigacao","data_vencimento"}.issubset(dfe.columns)):
+                st.info("Carregue **Entregas** (empresa, obrigação, vencimento) para detectar entregas faltantes.")
+            else:
+                hoje_d = data_ref
+                c1, c2 = st.columns(2)
+                with c1:
+                    horizonte = st.date_input("Horizonte", value=(hoje_d - timedelta(days=365), hoje_d), key="cal_horizonte")
+                with c2:
+                    todas = st.checkbox("Todas as empresas × todas as obrigações", value=False, key="cal_todas",
+                                        help="Desmarcado: só pares empresa × obrigação que já aparecem em Entregas.")
+                if isinstance(horizonte, (tuple, list)) and len(horizonte) == 2:
+                    cal, faltantes = calendario_faltantes(dfo, dfe, horizonte[0], horizonte[1], todas, feriados)
+                    c1, c2 = st.columns(2)
+                    c1.metric("Vencimentos esperados", f"{len(cal):,}".replace(",","."))
+                    c2.metric("Entregas faltantes", f"{len(faltantes):,}".replace(",","."))
+                    st.dataframe(faltantes.head(500))
+                    st.download_button("⬇️ CSV — entregas faltantes", faltantes.to_csv(index=False).encode("utf-8"), "entregas_faltantes.csv", "text/csv")
     else:
         st.info("Envie a planilha de **Obrigações** na barra lateral.")
 
 # ---------- Processos ----------
 with tabs[4]:
     if up_proc:
-        df_raw = try_read_excel(up_proc) if up_proc.name.lower().endswith(".xlsx") else read_any_csv(up_proc)
-        df_raw = to_lower_strip(df_raw)
-        req_map = {
-            "id_processo": "id",
-            "processo": "processo",
-            "departamento": "departamento",
-            "empresa": "empresa",
-            "responsavel": "responsável",
-            "inicio": "inicio",
-            "conclusao": "conclusão",
-            "status": "status",
-            "progresso": "progresso"
-        }
-        mapping = map_columns_ui("Mapeamento — Processos", df_raw, req_map, "pro")
-        dfp = apply_mapping(df_raw, mapping)
-        dfp = parse_dates(dfp, ["inicio","conclusao"])
-        if "status" in dfp.columns:
-            dfp["status"] = dfp["status"].map(_norm_status).fillna(dfp["status"])
-        st.session_state["dfp"] = dfp
-        st.success("Processos carregados e mapeados.")
-        st.dataframe(dfp.head(50))
+        dfp = carregar_dataset(up_proc, "processos", "Mapeamento — Processos", "pro", calendario)
+        if dfp is not None:
+            st.success("Processos carregados e mapeados.")
+            st.dataframe(dfp.head(50))
     else:
         st.info("Envie a planilha de **Gestão de Processos** na barra lateral.")
 
 # ---------- Responsáveis ----------
 with tabs[5]:
     if up_resp:
-        df_raw = try_read_excel(up_resp) if up_resp.name.lower().endswith((".xls",".xlsx")) else read_any_csv(up_resp)
-        df_raw = to_lower_strip(df_raw)
-        req_map = {
-            "responsavel": "responsavel",
-            "departamento": "departamento",
-            "email": "email",
-            "cargo": "cargo"
-        }
-        mapping = map_columns_ui("Mapeamento — Responsáveis & Departamentos", df_raw, req_map, "resp")
-        dfr = apply_mapping(df_raw, mapping)
-        st.session_state["dfr"] = dfr
-        st.success("Responsáveis/Departamentos carregados e mapeados.")
-        st.dataframe(dfr.head(50))
+        dfr = carregar_dataset(up_resp, "responsaveis", "Mapeamento — Responsáveis & Departamentos", "resp", calendario)
+        if dfr is not None:
+            st.success("Responsáveis/Departamentos carregados e mapeados.")
+            st.dataframe(dfr.head(50))
     else:
         st.info("Envie a planilha de **Responsáveis & Departamentos** na barra lateral.")
 
+# ---------- Enriquecimento (empresas/Obrigações/Responsáveis) ----------
+# Um exemplar enriquecido por versão dos dados, no cache do processo: sessões com os mesmos arquivos e
+# opções dividem os mesmos frames, e a sessão não guarda cópia nenhuma.
+if unificar_empresas or up_obrig or up_resp:
+    chave_enriquecidos = ("enriquecido", tuple(sorted(versoes_dados().items())), data_ref, calendario, cliente,
+                          dias_em_risco_atual())
+    enriquecidos = cache_datasets().get(chave_enriquecidos)
+    if enriquecidos is None:
+        enriquecidos = enriquecer(dict(dados), data_ref, feriados)
+        if enriquecidos:
+            cache_datasets().put(chave_enriquecidos, enriquecidos)
+    dados.update(enriquecidos)
+
+# ---------- 🧾 Entregas: calendário de prazos ----------
+with tabs[1]:
+    dfe = dados.get("dfe")
+    if isinstance(dfe, pd.DataFrame) and "data_vencimento" in dfe.columns:
+        st.markdown("---")
+        st.subheader("🗓️ Calendário de prazos")
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            por = st.radio("Dimensão", ["departamento","responsavel_entrega","empresa"], horizontal=True, key="prazos_por")
+        with c2:
+            metrica = st.radio("Contagem", METRICAS_PRAZO, horizontal=True, key="prazos_metrica")
+        contagens = prazos_diarios(dfe, data_ref, por).get(metrica)
+        if contagens is None:
+            st.info("Sem vencimentos válidos para montar o calendário.")
+        else:
+            totais = contagens.sum(axis=1)
+            # só os 50 maiores no seletor: a lista não cresce com o número de responsáveis/empresas
+            with c3:
+                escolha = st.selectbox(por, ["(todos)"] + totais.iloc[top_k(totais.to_numpy(), 50)].index.tolist(), key="prazos_valor")
+            diario = contagens.sum(axis=0) if escolha == "(todos)" else contagens.loc[escolha]
+            fig = px.imshow(calendar_grid(diario), aspect="auto", color_continuous_scale="Reds",
+                            labels=dict(x="Semana", y="", color=metrica), title=f"{metrica.capitalize()} por dia — {escolha}")
+            st.plotly_chart(fig, use_container_width=True)
+            st.markdown(f"**Dias de aperto ({metrica}) por {por}**")
+            st.dataframe(crunch_days(contagens if escolha == "(todos)" else contagens.loc[[escolha]], 20), hide_index=True)
+
+        st.markdown("---")
+        st.subheader("🔮 Previsão de atraso (pendentes a vencer)")
+        st.caption("Probabilidade de cada pendência ser entregue atrasada, a partir do histórico de concluídas: "
+                   "taxa de atraso na mesma faixa de dias até o vencimento, ajustada pelo responsável, obrigação e empresa.")
+        prob = previsao_atraso(dfe, data_ref)
+        a_vencer = prob.notna() & ~dfe.get("atrasada_pendente", pd.Series(False, index=dfe.index)).astype(bool)
+        if not a_vencer.any():
+            st.info("Nenhuma entrega pendente a vencer.")
+        else:
+            p = prob[a_vencer]
+            c1, c2, c3 = st.columns(3)
+            c1.metric("Pendentes a vencer", f"{len(p):,}".replace(",","."))
+            c2.metric("Atrasos esperados", f"{p.sum():,.0f}".replace(",","."))
+            c3.metric("Com chance ≥ 50%", f"{int((p >= 0.5).sum()):,}".replace(",","."))
+            cols = [c for c in ["empresa","obrigacao","responsavel_entrega","departamento","data_vencimento"] if c in dfe.columns]
+            top = dfe.loc[p.index[top_k(p.to_numpy(), 200)], cols].assign(prob_atraso=p)
+            st.dataframe(top.style.format({"prob_atraso": "{:.0%}"}), hide_index=True)   # top_k já vem ordenado
+            if "responsavel_entrega" in dfe.columns:
+                st.markdown("**Atrasos esperados por responsável**")
+                esperado = p.groupby(dfe.loc[p.index, "responsavel_entrega"]).agg(pendentes="size", atrasos_esperados="sum")
+                st.dataframe(esperado.sort_values("atrasos_esperados", ascending=False).head(30).round(1))
+
+# ---------- 👤 Responsáveis: carga de trabalho ----------
+with tabs[5]:
+    dfe = dados.get("dfe"); dfp = dados.get("dfp")
+    if isinstance(dfe, pd.DataFrame) or isinstance(dfp, pd.DataFrame):
+        st.markdown("---")
+        st.subheader("📈 Carga de trabalho (processos abertos + entregas pendentes por dia)")
+        hoje_d = data_ref
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            por = st.radio("Agrupar por", ["responsavel","departamento"], horizontal=True, key="carga_por")
+        with c2:
+            janela = st.date_input("Período", value=(hoje_d - timedelta(days=90), hoje_d), key="carga_periodo")
+        with c3:
+            capacidade = st.number_input("Capacidade (itens simultâneos)", min_value=1, max_value=500, value=20, key="carga_cap")
+        if isinstance(janela, (tuple, list)) and len(janela) == 2:
+            curvas = carga_trabalho(dfe, dfp, pd.to_datetime(hoje_d), por, janela[0], janela[1])
+            if curvas.empty:
+                st.info("Sem intervalos válidos (mapeie início/conclusão e responsáveis).")
+            else:
+                top = curvas.max().sort_values(ascending=False).index[:40]
+                fig = px.imshow(curvas[top].T, aspect="auto", color_continuous_scale="Reds",
+                                labels=dict(x="Dia", y=por, color="Itens"), title="Mapa de capacidade (top 40 por pico)")
+                st.plotly_chart(fig, use_container_width=True)
+                sobre = overloaded(curvas, capacidade)
+                st.markdown(f"**Sobrecarregados (> {capacidade} itens simultâneos)**")
+                if not sobre.empty:
+                    st.dataframe(sobre)
+                else:
+                    st.info("Ninguém acima da capacidade no período.")
+
 # ---------- 🏠 Resumo ----------
 with tabs[0]:
     c1, c2, c3, c4, c5 = st.columns(5)
-    if isinstance(st.session_state.get("dfe"), pd.DataFrame):
-        dfe = st.session_state["dfe"]
+    if isinstance(dados.get("dfe"), pd.DataFrame):
+        dfe = dados["dfe"]
         total_e = len(dfe)
         concluidas_e = int((dfe.get("status","").str.lower()=="concluída").sum()) if "status" in dfe else 0
         pendentes_e = total_e - concluidas_e
@@ -268,8 +476,8 @@ with tabs[0]:
     else:
         c1.metric("Entregas (total)", "—")
         c2.metric("Entregas atrasadas", "—")
-    if isinstance(st.session_state.get("dfs"), pd.DataFrame):
-        dfs = st.session_state["dfs"]
+    if isinstance(dados.get("dfs"), pd.DataFrame):
+        dfs = dados["dfs"]
         total_s = len(dfs)
         abertas_s = int(dfs.get("conclusao").isna().sum())
         c3.metric("Solicitações (total)", f"{total_s:,}".replace(",","."))
@@ -277,144 +485,222 @@ with tabs[0]:
     else:
         c3.metric("Solicitações (total)", "—")
         c4.metric("Solicitações abertas", "—")
-    if isinstance(st.session_state.get("dfp"), pd.DataFrame):
-        dfp = st.session_state["dfp"]
+    if isinstance(dados.get("dfp"), pd.DataFrame):
+        dfp = dados["dfp"]
         c5.metric("Processos", f"{len(dfp):,}".replace(",","."))
     else:
         c5.metric("Processos", "—")
 
+    st.markdown("---")
+    st.subheader("🎯 Fila de ação (score de risco)")
+    fila = fila_acao(dados.get("dfe"), dados.get("dfs"), dados.get("dfp"), data_ref)
+    if not fila.empty:
+        st.caption("Prazo, atraso, prioridade, tempo sem atualização e histórico de atraso do responsável/empresa — TOP 200 entre todos os datasets.")
+        st.dataframe(fila.drop(columns=["linha"]), hide_index=True)
+    else:
+        st.info("Carregue **Entregas**, **Solicitações** ou **Processos** para montar a fila de ação.")
+
 # ---------- 📝 Relatórios ----------
 with tabs[6]:
     st.subheader("⚙️ Ajuste de Métricas & Filtros")
     c1, c2, c3 = st.columns(3)
     with c1:
-        dias_em_risco = st.number_input("Entregas: 'em risco' quando faltam ≤ (dias)", min_value=0, max_value=10, value=2)
-        considerar_ultimos = st.number_input("Ranking de atrasos: últimos (dias)", min_value=7, max_value=120, value=30)
+        dias_em_risco = st.number_input("Entregas: 'em risco' quando faltam ≤ (dias)", min_value=0, max_value=10,
+                                        value=PARAMETROS_PADRAO["dias_em_risco"], key="dias_em_risco")
+        considerar_ultimos = st.number_input("Ranking de atrasos: últimos (dias)", min_value=7, max_value=120,
+                                             value=PARAMETROS_PADRAO["considerar_ultimos"])
     with c2:
-        sla_alerta = st.number_input("Solicitações: 'aberta' crítica a partir de (dias)", min_value=1, max_value=60, value=14)
-        sem_update_alerta = st.number_input("Solicitações: prioridade ALTA sem atualização ≥ (dias)", min_value=1, max_value=30, value=3)
+        sla_alerta = st.number_input("Solicitações: 'aberta' crítica a partir de (dias)", min_value=1, max_value=60,
+                                     value=PARAMETROS_PADRAO["sla_alerta"])
+        sem_update_alerta = st.number_input("Solicitações: prioridade ALTA sem atualização ≥ (dias)", min_value=1, max_value=30,
+                                            value=PARAMETROS_PADRAO["sem_update_alerta"])
     with c3:
-        proc_dias_alerta = st.number_input("Processos: em andamento crítico ≥ (dias)", min_value=7, max_value=180, value=30)
+        proc_dias_alerta = st.number_input("Processos: em andamento crítico ≥ (dias)", min_value=7, max_value=180,
+                                           value=PARAMETROS_PADRAO["proc_dias_alerta"])
 
     st.markdown("##### Filtros globais (aplicados quando possível)")
-    empresas = None; departamentos = None; responsaveis = None
-    if isinstance(st.session_state.get("dfe"), pd.DataFrame):
-        dfe = st.session_state["dfe"]
-        empresas = sorted(dfe.get("empresa", pd.Series(dtype=str)).dropna().unique().tolist())
-        departamentos = sorted(dfe.get("departamento", pd.Series(dtype=str)).dropna().unique().tolist())
-        responsaveis = sorted(dfe.get("responsavel_entrega", pd.Series(dtype=str)).dropna().unique().tolist())
+    indices = {}
+    if isinstance(dados.get("dfe"), pd.DataFrame):
+        versao = versoes_dados()["dfe"]
+        indices = {c: indice_valores(dados["dfe"], versao, c) for c in ["empresa","departamento","responsavel_entrega"]}
     c4, c5, c6 = st.columns(3)
     with c4:
-        emp_sel = st.multiselect("Empresas (opcional)", empresas or [], default=empresas or [])
+        emp_sel = filtro_busca("Empresas", indices.get("empresa"), "rel_emp")
     with c5:
-        dep_sel = st.multiselect("Departamentos (opcional)", departamentos or [], default=departamentos or [])
+        dep_sel = filtro_busca("Departamentos", indices.get("departamento"), "rel_dep")
     with c6:
-        resp_sel = st.multiselect("Responsáveis (opcional)", responsaveis or [], default=responsaveis or [])
+        resp_sel = filtro_busca("Responsáveis", indices.get("responsavel_entrega"), "rel_resp")
+    periodo = None
+    idx_venc = dados["dfe_idx"].get("data_vencimento")
+    if idx_venc is not None and len(idx_venc):
+        vmin, vmax = pd.Timestamp(idx_venc.keys[0]).date(), pd.Timestamp(idx_venc.keys[-1]).date()
+        # sem o filtro, entram também as entregas sem vencimento; com ele, só as do período (mesmo o inteiro)
+        if st.checkbox("Filtrar por vencimento", key="rel_filtrar_periodo"):
+            periodo = st.date_input("Vencimento entre", value=(vmin, vmax), min_value=vmin, max_value=vmax)
 
     st.markdown("---")
     st.subheader("🧠 Gerar Resumo Analítico")
     gerar = st.button("Gerar relatório agora")
 
     if gerar:
-        hoje = pd.to_datetime(date.today())
-        linhas = []
-        # ===== Entregas =====
-        if isinstance(st.session_state.get("dfe"), pd.DataFrame):
-            dfe = st.session_state["dfe"].copy()
-            # aplica filtros
-            if emp_sel: dfe = dfe[dfe.get("empresa").isin(emp_sel)]
-            if dep_sel: dfe = dfe[dfe.get("departamento").isin(dep_sel)]
-            if resp_sel: dfe = dfe[dfe.get("responsavel_entrega").isin(resp_sel)]
-            # recomputa flags com parâmetros
-            if "data_vencimento" in dfe.columns:
-                dfe["em_risco"] = np.where(
-                    (dfe.get("status","").str.lower()!="concluída") & dfe.get("data_vencimento").notna() & ((dfe.get("data_vencimento") - hoje).dt.days.between(0, dias_em_risco)),
-                    True, False
-                )
-                dfe["atrasada_pendente"] = np.where(
-                    (dfe.get("status","").str.lower()!="concluída") & dfe.get("data_vencimento").notna() & (hoje > dfe.get("data_vencimento")),
-                    True, False
-                )
-                dfe["atrasada_concluida"] = np.where(
-                    (dfe.get("status","").str.lower()=="concluída") & dfe.get("data_entrega").notna() & (dfe.get("data_entrega") > dfe.get("data_vencimento")),
-                    True, False
-                )
-                total = len(dfe)
-                concluidas = int((dfe.get("status","").str.lower()=="concluída").sum())
-                pendentes = total - concluidas
-                atrasadas = int((dfe["atrasada_concluida"] | dfe["atrasada_pendente"]).sum())
-                em_risco_qtd = int(dfe["em_risco"].sum())
-                # ranking últimos N dias
-                cutoff = hoje - pd.Timedelta(days=considerar_ultimos)
-                recent = dfe[dfe.get("data_vencimento") >= cutoff]
-                rank_emp = pd.DataFrame()
-                if not recent.empty:
-                    late_recent = recent[(recent["atrasada_concluida"]) | (recent["atrasada_pendente"])]
-                    if not late_recent.empty and "empresa" in late_recent.columns:
-                        rank_emp = late_recent.groupby("empresa").size().reset_index(name=f"atrasos_{considerar_ultimos}d").sort_values(f"atrasos_{considerar_ultimos}d", ascending=False).head(5)
-
-                linhas += [
-                    f"### Entregas",
-                    f"- Total: **{total}** | Concluídas: **{concluidas}** | Pendentes: **{pendentes}**",
-                    f"- Atrasadas (inclui pendentes vencidas): **{atrasadas}**",
-                    f"- Em risco (vencem em ≤ {dias_em_risco} dias): **{em_risco_qtd}**",
-                ]
-                if not rank_emp.empty:
-                    top_lines = "\n".join([f"  - {r['empresa']}: {int(r[f'atrasos_{considerar_ultimos}d'])} atrasos" for _,r in rank_emp.iterrows()])
-                    linhas += [f"- TOP atrasos (últimos {considerar_ultimos} dias):\n{top_lines}"]
-
-        # ===== Solicitações =====
-        if isinstance(st.session_state.get("dfs"), pd.DataFrame):
-            dfs = st.session_state["dfs"].copy()
-            if emp_sel and "empresa" in dfs.columns: dfs = dfs[dfs["empresa"].isin(emp_sel)]
-            if resp_sel and "responsavel" in dfs.columns: dfs = dfs[dfs["responsavel"].isin(resp_sel)]
-            hoje = pd.to_datetime(date.today())
-            long_open = pd.DataFrame()
-            sem_upd = pd.DataFrame()
-            if {"conclusao","abertura"}.issubset(dfs.columns):
-                if "aberta_ha_dias" not in dfs.columns and "abertura" in dfs.columns:
-                    dfs["aberta_ha_dias"] = np.where(dfs["conclusao"].isna() & dfs["abertura"].notna(), (hoje - dfs["abertura"]).dt.days, np.nan)
-                long_open = dfs[(dfs["conclusao"].isna()) & (dfs["aberta_ha_dias"] >= sla_alerta)]
-            if {"prioridade","ultima_atualizacao","conclusao"}.issubset(dfs.columns):
-                sem_upd = dfs[(dfs["conclusao"].isna()) & (dfs["prioridade"].str.contains("alta", case=False, na=False)) & ((hoje - dfs["ultima_atualizacao"]).dt.days >= sem_update_alerta)]
-            total_s = len(dfs)
-            abertas = int(dfs.get("conclusao").isna().sum()) if "conclusao" in dfs.columns else 0
-            linhas += [
-                f"### Solicitações",
-                f"- Total: **{total_s}** | Abertas: **{abertas}**",
-                f"- Críticas: Abertas ≥ {sla_alerta} dias: **{len(long_open)}** | Alta sem atualização ≥ {sem_update_alerta} dias: **{len(sem_upd)}**",
-            ]
-
-        # ===== Processos =====
-        if isinstance(st.session_state.get("dfp"), pd.DataFrame):
-            dfp = st.session_state["dfp"].copy()
-            if emp_sel and "empresa" in dfp.columns: dfp = dfp[dfp["empresa"].isin(emp_sel)]
-            if dep_sel and "departamento" in dfp.columns: dfp = dfp[dfp["departamento"].isin(dep_sel)]
-            if resp_sel and "responsavel" in dfp.columns: dfp = dfp[dfp["responsavel"].isin(resp_sel)]
-            hoje = pd.to_datetime(date.today())
-            if {"inicio","conclusao","status"}.issubset(dfp.columns):
-                dur = np.where(dfp["conclusao"].notna(), (dfp["conclusao"] - dfp["inicio"]).dt.days, (hoje - dfp["inicio"]).dt.days)
-                dfp["duracao_dias"] = dur
-                crit = dfp[(dfp.get("status","").str.lower()!="concluída") & (dfp["duracao_dias"] >= proc_dias_alerta)]
-                linhas += [
-                    f"### Processos",
-                    f"- Total: **{len(dfp)}**",
-                    f"- Em andamento ≥ {proc_dias_alerta} dias: **{len(crit)}**",
-                ]
-
-        if not linhas:
-            st.warning("Nenhum dataset carregado para gerar relatório.")
+        dfe = dados.get("dfe")
+        params = dict(dias_em_risco=dias_em_risco, considerar_ultimos=considerar_ultimos, sla_alerta=sla_alerta,
+                      sem_update_alerta=sem_update_alerta, proc_dias_alerta=proc_dias_alerta)
+        filtros = dict(empresas=emp_sel, departamentos=dep_sel, responsaveis=resp_sel,
+                       periodo=periodo if isinstance(periodo, (tuple, list)) and len(periodo) == 2 else None)
+        # a chave fica guardada na sessão: o relatório sobrevive aos reruns de acompanhamento;
+        # um novo clique cancela o pedido anterior ainda em andamento
+        if st.session_state.get("relatorio_chave") is not None:
+            gerenciador().descartar(st.session_state["relatorio_chave"])
+        chave = ("relatorio", uuid.uuid4().hex)
+        submeter(chave, gerar_relatorio, dfe, dados.get("dfs"), dados.get("dfp"),
+                 data_ref, params, filtros, dados["dfe_idx"] if isinstance(dfe, pd.DataFrame) else None,
+                 feriados, versoes_dados())
+        st.session_state["relatorio_chave"] = chave
+
+    chave = st.session_state.get("relatorio_chave")
+    tarefa = gerenciador().obter(chave) if chave is not None else None
+    if chave is not None and acompanhar(tarefa, chave, "rel"):
+        st.session_state["relatorio_res"], st.session_state["relatorio_md"] = tarefa.resultado()
+        st.session_state["relatorio_chave"] = None
+        st.session_state["excel_chave"] = None
+    elif tarefa is not None and st.session_state.get("relatorio_md"):
+        st.caption("Relatório anterior (o novo ainda está sendo gerado):")
+    md = st.session_state.get("relatorio_md")
+    if md == "":
+        st.warning("Nenhum dataset carregado para gerar relatório.")
+    elif md:
+        st.markdown(md)
+        st.download_button("⬇️ Baixar relatório (.md)", md.encode("utf-8"), "relatorio_resumo.md", "text/markdown")
+
+        # Excel só quando pedido: escrito em segundo plano, linha a linha, num buffer em memória
+        if st.button("📗 Preparar planilha Excel (.xlsx)"):
+            anterior = st.session_state.get("excel_chave")
+            if anterior is not None:
+                gerenciador().descartar(anterior)
+            chave = ("excel", uuid.uuid4().hex)
+            submeter(chave, planilha_relatorio, st.session_state["relatorio_res"])
+            st.session_state["excel_chave"] = chave
+        chave = st.session_state.get("excel_chave")
+        tarefa = gerenciador().obter(chave) if chave is not None else None
+        if chave is not None and acompanhar(tarefa, chave, "xlsx"):
+            st.download_button("⬇️ Baixar relatório (.xlsx)", tarefa.resultado(), "relatorio_resumo.xlsx",
+                               "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+    # ---------- Relatório por empresa ----------
+    st.markdown("---")
+    st.subheader("🏢 Relatório por empresa")
+    st.caption("Um arquivo por empresa num .zip, com os mesmos limites e filtros acima — calculado numa passada agrupada.")
+    c1, c2 = st.columns([1, 3])
+    with c1:
+        formato = st.radio("Formato", ["md", "xlsx"], horizontal=True, key="por_empresa_formato")
+    with c2:
+        gerar_zip = st.button("Gerar relatórios por empresa (.zip)")
+    if gerar_zip:
+        dfe = dados.get("dfe")
+        anterior = st.session_state.get("zip_chave")
+        if anterior is not None:
+            gerenciador().descartar(anterior)
+        chave = ("zip", uuid.uuid4().hex)
+        submeter(
+            chave, gerar_por_empresa, dfe, dados.get("dfs"), dados.get("dfp"), data_ref,
+            dict(dias_em_risco=dias_em_risco, considerar_ultimos=considerar_ultimos, sla_alerta=sla_alerta,
+                 sem_update_alerta=sem_update_alerta, proc_dias_alerta=proc_dias_alerta),
+            dict(empresas=emp_sel, departamentos=dep_sel, responsaveis=resp_sel,
+                 periodo=periodo if isinstance(periodo, (tuple, list)) and len(periodo) == 2 else None),
+            dados["dfe_idx"] if isinstance(dfe, pd.DataFrame) else None, feriados, formato)
+        st.session_state["zip_chave"] = chave
+    chave = st.session_state.get("zip_chave")
+    tarefa = gerenciador().obter(chave) if chave is not None else None
+    if chave is not None and acompanhar(tarefa, chave, "zip"):
+        conteudo, n = tarefa.resultado()
+        if not n:
+            st.warning("Nenhuma empresa encontrada nos dados carregados (mapeie a coluna empresa).")
         else:
-            md = "# Resumo Analítico\n\n" + "\n".join(linhas)
-            st.markdown(md)
-            st.download_button("⬇️ Baixar relatório (.md)", md.encode("utf-8"), "relatorio_resumo.md", "text/markdown")
+            st.download_button(f"⬇️ Baixar {n} relatório(s) por empresa (.zip)", conteudo, "relatorios_por_empresa.zip",
+                               "application/zip")
 
 # ---------- 📦 Exportações ----------
 with tabs[7]:
     st.subheader("💾 Exportações")
     for name, obj in [("entregas","dfe"), ("solicitacoes","dfs"), ("obrigacoes","dfo"), ("processos","dfp"), ("responsaveis","dfr")]:
-        df = st.session_state.get(obj)
+        df = dados.get(obj)
         if isinstance(df, pd.DataFrame):
             st.download_button(f"⬇️ CSV — {name}", df.to_csv(index=False).encode("utf-8"), f"{name}_tratado.csv", "text/csv")
         else:
             st.write(f"{name}: (nenhum dataset carregado)")
+
+# ---------- 🗂️ Carteira de clientes ----------
+RANKINGS = {  # métrica -> (rótulo, menor é pior?)
+    "pontualidade": ("Pontualidade das entregas", True),
+    "sla": ("Solicitações resolvidas no SLA", True),
+    "atrasadas_pendentes": ("Entregas atrasadas em aberto", False),
+    "pendentes": ("Backlog de entregas", False),
+    "em_risco": ("Entregas em risco", False),
+    "solicitacoes_abertas_longas": ("Solicitações abertas além do SLA", False),
+    "processos_criticos": ("Processos críticos", False),
+}
+with tabs[8]:
+    st.subheader("🗂️ Carteira de clientes")
+    st.caption(f"Cada diagnóstico guardado vira um resumo pequeno (KPIs, série mensal, obrigações que mais atrasam) em "
+               f"`{CARTEIRA_PASTA}`; a comparação entre clientes usa só esses resumos, sem reabrir exportações.")
+    c1, c2 = st.columns([3, 1])
+    with c1:
+        st.markdown(f"Cliente deste diagnóstico: **{cliente}**" if cliente else "Informe o **Cliente** na barra lateral para guardar.")
+    with c2:
+        guardar = st.button("💾 Guardar na carteira", disabled=not cliente)
+    if guardar:
+        if not any(isinstance(dados.get(k), pd.DataFrame) for k in ["dfe", "dfs", "dfp"]):
+            st.warning("Carregue ao menos um dataset antes de guardar.")
+        else:
+            params = dict(dias_em_risco=dias_em_risco, considerar_ultimos=considerar_ultimos, sla_alerta=sla_alerta,
+                          sem_update_alerta=sem_update_alerta, proc_dias_alerta=proc_dias_alerta)
+            save_client_summary(client_summary(dados.get("dfe"), dados.get("dfs"),
+                                               dados.get("dfp"), data_ref, params, feriados),
+                                cliente, CARTEIRA_PASTA)
+            st.success(f"Resumo de **{cliente}** guardado.")
+
+    cart = carteira(CARTEIRA_PASTA, assinatura_carteira(CARTEIRA_PASTA))
+    if cart["ignorados"]:
+        st.warning(f"{len(cart['ignorados'])} resumo(s) ilegível(is) ignorado(s): " + ", ".join(cart["ignorados"]))
+    kpis = cart["kpis"]
+    if kpis.empty or not any(m in kpis.columns for m in RANKINGS):
+        st.info("Nenhum cliente na carteira ainda.")
+    else:
+        st.markdown(f"**{len(kpis)} cliente(s)**")
+        disponiveis = [m for m in RANKINGS if m in kpis.columns]
+        c1, c2 = st.columns([3, 1])
+        with c1:
+            metrica = st.radio("Ranking", disponiveis, format_func=lambda m: RANKINGS[m][0], horizontal=True, key="carteira_metrica")
+        with c2:
+            n = st.number_input("Clientes no ranking", 5, 100, 20, key="carteira_n")
+        valores = kpis[metrica].astype(float)
+        # piores primeiro: menor taxa ou maior contagem
+        ordem = top_k(-valores.to_numpy() if RANKINGS[metrica][1] else valores.to_numpy(), int(n))
+        ranking = kpis.iloc[ordem].reset_index()
+        fig = px.bar(ranking, x=metrica, y="cliente", orientation="h", title=RANKINGS[metrica][0])
+        fig.update_layout(yaxis=dict(autorange="reversed"))
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(kpis.reset_index(), hide_index=True)
+
+        st.markdown("**Tendência mensal**")
+        sel = st.multiselect("Clientes (vazio = carteira toda)", kpis.index.tolist(), key="carteira_clientes")
+        mensal = cart["mensal"]
+        if not mensal.empty:
+            if sel:
+                taxas = {c: portfolio_trend(mensal, [c]) for c in sel}
+                serie = pd.concat({c: t[[m for m in ["pontualidade", "sla"] if m in t.columns]] for c, t in taxas.items()},
+                                  names=["cliente", "mes"]).reset_index()
+                fig = px.line(serie.melt(["cliente", "mes"], var_name="taxa"), x="mes", y="value", color="cliente",
+                              line_dash="taxa", markers=True)
+            else:
+                tend = portfolio_trend(mensal)
+                fig = px.line(tend.reset_index(), x="mes", y=[m for m in ["pontualidade", "sla"] if m in tend.columns], markers=True)
+            fig.update_layout(yaxis_tickformat=".0%")
+            st.plotly_chart(fig, use_container_width=True)
+
+        obr = cart["obrigacoes"]
+        if not obr.empty:
+            st.markdown("**Obrigações que mais atrasam na carteira**")
+            tot = obr.groupby("obrigacao").agg(atrasos=("atrasos", "sum"), clientes=("cliente", "nunique"))
+            st.dataframe(tot.sort_values("atrasos", ascending=False).head(30))
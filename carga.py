@@ -0,0 +1,542 @@
+import argparse
+import contextlib
+import functools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from datetime import date
+from urllib.parse import urlencode
+
+import numpy as np
+import pandas as pd
+
+# Teste de carga: N sessões simultâneas, cada uma enviando um pacote sintético de cliente, mudando os
+# parâmetros e filtros do Relatório e baixando as exportações. Mede latência por interação (percentis),
+# RSS/CPU do servidor ao longo do teste e em que etapas o tempo foi gasto.
+#
+#   python carga.py --sessoes 8 --rodadas 3 --linhas 50000            # o app.py, num processo servidor à parte
+#   python carga.py --api http://127.0.0.1:8765 --pid <pid do api.py>  # instância local do api.py
+#
+# Modo app: os pacotes são gerados aqui e um processo filho (o "servidor") roda o app.py de verdade, uma
+# sessão do streamlit.testing (AppTest) por usuário. Os caches do Streamlit e os recursos do app (pool de
+# tarefas, cache de datasets, memo das seções) são do processo, então as sessões dividem tudo como num
+# servidor real. RSS/CPU são lidos do filho. Fica de fora só o websocket até o navegador.
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+ETAPAS = ["read_many", "prepare_dataset", "quality_profile", "build_date_indexes", "resolve_companies",
+          "apply_company_ids", "enrich_entregas", "deadline_counts", "workload_intervals", "workload_curves",
+          "late_probability", "risk_queue", "resumo_analitico", "resumo_markdown", "export_workbook",
+          "resumo_por_empresa", "company_reports_zip"]
+
+# ----- pacotes sintéticos -----
+NOMES = ["Aurora", "Horizonte", "Ipê", "Jatobá", "Serra Azul", "Boa Vista", "Santa Clara", "Vale Verde",
+         "Pioneira", "Atlântica", "Bandeirantes", "Cristal", "Estrela do Sul", "Guarani", "Itapuã", "Mantiqueira",
+         "Nova Era", "Paraíso", "Primavera", "Rio Doce", "São Jorge", "Tropical", "Ouro Fino", "Planalto"]
+ATIVIDADES = ["Comércio de Alimentos", "Transportes", "Construções", "Serviços Médicos", "Auto Peças",
+              "Materiais de Construção", "Farmácia", "Tecnologia", "Padaria e Confeitaria", "Consultoria",
+              "Logística", "Indústria Têxtil", "Agropecuária", "Informática", "Restaurante", "Imobiliária"]
+CIDADES = ["Campinas", "Santos", "Londrina", "Joinville", "Uberlândia", "Sorocaba", "Maringá", "Caxias do Sul",
+           "Feira de Santana", "Juiz de Fora", "Ribeirão Preto", "Blumenau"]
+SUFIXOS = ["Ltda", "Ltda", "Ltda - ME", "EIRELI", "S/A", "ME", "EPP"]
+PRENOMES = ["Ana", "Bruno", "Carla", "Diego", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João",
+            "Larissa", "Marcos", "Natália", "Otávio", "Patrícia", "Rafael", "Sabrina", "Thiago", "Vanessa", "Wagner"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Santos", "Pereira", "Lima", "Carvalho", "Ferreira", "Almeida", "Costa"]
+
+def _cnpj(raiz: int, filial: int = 1) -> str:
+    # CNPJ formatado com os dígitos verificadores
+    base = f"{raiz:08d}{filial:04d}"
+    for pesos in ([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]):
+        resto = sum(int(d) * p for d, p in zip(base, pesos)) % 11
+        base += str(0 if resto < 2 else 11 - resto)
+    return f"{base[:2]}.{base[2:5]}.{base[5:8]}/{base[8:12]}-{base[12:]}"
+
+def empresas_sinteticas(n: int, rng) -> pd.DataFrame:
+    # nomes distintos (atividade + nome fantasia + sufixo), um CNPJ válido por empresa; ~10% têm uma filial
+    # (mesma raiz, outro nome) e cada empresa tem uma grafia alternativa, como nas exportações reais
+    combos = [f"{nome} {ativ}" for nome in NOMES for ativ in ATIVIDADES]
+    rng.shuffle(combos)
+    combos += [f"{c} de {cidade}" for cidade in CIDADES for c in combos]
+    nomes = [f"{c} {rng.choice(SUFIXOS)}" for c in combos[:n]]
+    raizes = rng.choice(np.arange(10**7, 10**8), size=n, replace=False)
+    emp = pd.DataFrame({"empresa": nomes, "cnpj": [_cnpj(int(r)) for r in raizes],
+                        "variante": [nome.upper().replace(" - ", " ").replace("/", "") for nome in nomes]})
+    com_filial = np.flatnonzero(rng.random(n) < 0.1)
+    filiais = pd.DataFrame({
+        "empresa": [f"{combos[i]} - Filial {rng.choice(CIDADES)}" for i in com_filial],
+        "cnpj": [_cnpj(int(raizes[i]), 2) for i in com_filial],
+    })
+    filiais["variante"] = filiais["empresa"]
+    return pd.concat([emp, filiais], ignore_index=True)
+
+def bundle_sintetico(linhas: int, semente: int, hoje) -> dict:
+    # {dataset: (nome, bytes)} nos layouts de exportação do Acessórias (os mesmos cabeçalhos dos templates)
+    rng = np.random.default_rng(semente)
+    hoje = pd.Timestamp(hoje)
+    emp = empresas_sinteticas(max(5, linhas // 500), rng)
+    pessoas = np.array([f"{p} {s}" for p in PRENOMES for s in SOBRENOMES])
+    pessoas = rng.choice(pessoas, min(len(pessoas), max(3, linhas // 2000)), replace=False)
+    deps = np.array(["Fiscal", "Contábil", "Pessoal", "Societário"])
+    obrig = np.array(["DCTFWeb", "EFD-Reinf", "ISS", "Folha", "ECF", "SPED Fiscal", "DIRF", "GIA"])
+
+    def datas(base, dias):
+        return (base + pd.to_timedelta(dias, unit="D")).strftime("%d/%m/%Y")
+
+    def nomes(k):
+        # 10% das linhas com a grafia alternativa (caixa alta, sem pontuação do sufixo)
+        i = rng.integers(0, len(emp), k)
+        return i, np.where(rng.random(k) < 0.1, emp["variante"].to_numpy()[i], emp["empresa"].to_numpy()[i])
+
+    venc = rng.integers(-365, 30, linhas)
+    entregue = rng.random(linhas) < np.where(venc < 0, 0.92, 0.3)
+    atraso = rng.normal(-2, 4, linhas).round().astype(int)
+    i_emp, nome_emp = nomes(linhas)
+    ent = pd.DataFrame({
+        "empresa": nome_emp,
+        "cnpj": emp["cnpj"].to_numpy()[i_emp],
+        "obrigação / tarefa": rng.choice(obrig, linhas),
+        "departamento": rng.choice(deps, linhas),
+        "responsável prazo": rng.choice(pessoas, linhas),
+        "responsável entrega": rng.choice(pessoas, linhas),
+        "competência": datas(hoje, venc - 20),
+        "vencimento": datas(hoje, venc),
+        "data entrega": np.where(entregue, datas(hoje, venc + atraso), ""),
+        "status": np.where(entregue, "Concluída", "Pendente"),
+        "protocolo": rng.integers(10**5, 10**6, linhas).astype(str),
+    })
+    n = max(10, linhas // 5)
+    abertura = rng.integers(-200, 0, n)
+    dur = rng.exponential(10, n).astype(int)
+    fechada = abertura + dur < 0
+    sol = pd.DataFrame({
+        "id da solicitação": np.arange(n), "assunto": "Envio de guias", "empresa": nomes(n)[1],
+        "status": np.where(fechada, "Concluída", "Pendente"), "prioridade": rng.choice(["Alta", "Média", "Baixa"], n),
+        "responsável": rng.choice(pessoas, n), "abertura": datas(hoje, abertura), "prazo": datas(hoje, abertura + 5),
+        "última atualização": datas(hoje, np.minimum(abertura + dur // 2, 0)),
+        "conclusão": np.where(fechada, datas(hoje, abertura + dur), ""),
+    })
+    n = max(10, linhas // 20)
+    inicio = rng.integers(-300, 0, n)
+    dur = rng.exponential(25, n).astype(int)
+    fechado = inicio + dur < 0
+    proc = pd.DataFrame({
+        "id": np.arange(n), "processo": "Implantação", "departamento": rng.choice(deps, n),
+        "empresa": nomes(n)[1], "responsável": rng.choice(pessoas, n), "inicio": datas(hoje, inicio),
+        "conclusão": np.where(fechado, datas(hoje, inicio + dur), ""),
+        "status": np.where(fechado, "Concluída", "Em andamento"), "progresso": "50%",
+    })
+    return {ds: (f"{ds}_{semente}.csv", df.to_csv(index=False, sep=";").encode("utf-8"))
+            for ds, df in [("entregas", ent), ("solicitacoes", sol), ("processos", proc)]}
+
+def parametros_aleatorios(rng: random.Random) -> dict:
+    return dict(dias_em_risco=rng.randint(0, 10), considerar_ultimos=rng.choice([7, 15, 30, 60, 90]),
+                sla_alerta=rng.randint(3, 30), sem_update_alerta=rng.randint(1, 10), proc_dias_alerta=rng.randint(7, 90))
+
+# ----- medições -----
+class Medidor:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.erros = defaultdict(int)
+        self.etapas = defaultdict(float)
+        self.pilhas = threading.local()
+
+    @classmethod
+    def carregar(cls, dados: dict) -> "Medidor":
+        m = cls()
+        m.latencias.update(dados["latencias"])
+        m.erros.update(dados["erros"])
+        m.etapas.update(dados["etapas"])
+        return m
+
+    def interacao(self, nome: str, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            with self.lock:
+                self.erros[nome] += 1
+            raise
+        finally:
+            with self.lock:
+                self.latencias[nome].append(time.perf_counter() - t0)
+
+    def cronometrar(self, modulo, nome: str):
+        # troca a função do módulo por uma versão cronometrada (vale para as chamadas internas também).
+        # Conta o tempo exclusivo: o que uma etapa passa dentro de outra etapa medida fica só com a de dentro.
+        original = getattr(modulo, nome)
+
+        @functools.wraps(original)
+        def medida(*args, **kwargs):
+            pilha = self.pilhas.__dict__.setdefault("pilha", [])
+            pilha.append(0.0)
+            t0 = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                total = time.perf_counter() - t0
+                internas = pilha.pop()
+                if pilha:
+                    pilha[-1] += total
+                with self.lock:
+                    self.etapas[nome] += total - internas
+        setattr(modulo, nome, medida)
+        return medida
+
+    def latencia(self) -> pd.DataFrame:
+        linhas = []
+        for nome, v in self.latencias.items():
+            v = np.asarray(v)
+            linhas.append({"interacao": nome, "n": len(v), "erros": self.erros[nome],
+                           **{f"p{q}": np.percentile(v, q) for q in (50, 90, 95, 99)}, "max": v.max()})
+        return pd.DataFrame(linhas).set_index("interacao").round(3)
+
+    def tempo_por_etapa(self) -> pd.DataFrame:
+        s = pd.Series(self.etapas, dtype=float).sort_values(ascending=False)
+        # o que as interações levaram além das etapas: script do app, hashing do st.cache_data, montagem
+        # da página e espera na fila do pool
+        total = sum(sum(v) for v in self.latencias.values())
+        s["(restante: script, st.cache_data, página, fila)"] = max(0.0, total - s.sum())
+        return pd.DataFrame({"segundos": s.round(2), "parcela": (s / s.sum()).round(3) if s.sum() else s})
+
+def _proc(pid: int) -> tuple:
+    # (rss em bytes, cpu em segundos) via /proc (Linux)
+    with open(f"/proc/{pid}/status") as f:
+        rss = next(int(l.split()[1]) * 1024 for l in f if l.startswith("VmRSS:"))
+    with open(f"/proc/{pid}/stat") as f:
+        campos = f.read().rsplit(")", 1)[1].split()
+    return rss, (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")
+
+class Monitor(threading.Thread):
+    # amostra RSS e CPU do servidor a cada `intervalo` segundos
+    def __init__(self, pid: int, intervalo: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid, self.intervalo = pid, intervalo
+        self.amostras = []
+        self.parar = threading.Event()
+
+    def run(self):
+        anterior = None
+        while not self.parar.is_set():
+            try:
+                agora, (rss, cpu) = time.perf_counter(), _proc(self.pid)
+            except (OSError, StopIteration):
+                return
+            if anterior is not None:
+                self.amostras.append({"t": agora, "rss_mb": rss / 2**20, "cpu_pct": 100 * (cpu - anterior[1]) / (agora - anterior[0])})
+            anterior = (agora, cpu)
+            self.parar.wait(self.intervalo)
+
+    def resumo(self) -> dict:
+        if not self.amostras:
+            return {}
+        a = pd.DataFrame(self.amostras)
+        return {"rss_mb_max": round(a["rss_mb"].max(), 1), "rss_mb_medio": round(a["rss_mb"].mean(), 1),
+                "cpu_pct_medio": round(a["cpu_pct"].mean(), 1), "cpu_pct_p95": round(a["cpu_pct"].quantile(0.95), 1)}
+
+# ----- modo app: o app.py via AppTest, no processo servidor -----
+# Os uploads entram pelo próprio st.file_uploader: o wrapper devolve os arquivos do pacote da sessão
+# (session_state["_carga_uploads"], por rótulo) e o resto do app roda sem alteração.
+SCRIPT_APP = '''
+import io, runpy, sys
+import streamlit as st
+sys.path.insert(0, {raiz!r})
+
+class _Enviado(io.BytesIO):
+    def __init__(self, nome, conteudo):
+        super().__init__(conteudo)
+        self.name, self.file_id, self.size = nome, nome, len(conteudo)
+
+_uploader = st.file_uploader
+def _file_uploader(label, *args, **kwargs):
+    _uploader(label, *args, **kwargs)
+    arquivos = st.session_state.get("_carga_uploads", {{}}).get(label.split(" (")[0], [])
+    return [_Enviado(nome, conteudo) for nome, conteudo in arquivos]
+st.file_uploader = _file_uploader
+runpy.run_path({app!r}, run_name="__main__")
+'''
+
+ROTULOS = {"entregas": "Gestão de Entregas", "solicitacoes": "Solicitações", "obrigacoes": "Obrigações",
+           "processos": "Gestão de Processos", "responsaveis": "Responsáveis & Departamentos"}
+
+PARAMETROS = {"dias_em_risco": "Entregas: 'em risco'", "considerar_ultimos": "Ranking de atrasos",
+              "sla_alerta": "Solicitações: 'aberta'", "sem_update_alerta": "Solicitações: prioridade ALTA",
+              "proc_dias_alerta": "Processos: em andamento"}
+
+class SessaoApp:
+    # um navegador: cada interação é um rerun do app.py com o widget alterado
+    def __init__(self, medidor: Medidor, bundle: dict, timeout: float):
+        from streamlit.testing.v1 import AppTest
+        self.medidor = medidor
+        self.at = AppTest.from_string(SCRIPT_APP.format(raiz=RAIZ, app=os.path.join(RAIZ, "app.py")),
+                                      default_timeout=timeout)
+        self.at.session_state["_carga_uploads"] = {ROTULOS[ds]: [arq] for ds, arq in bundle.items()}
+        self.timeout = timeout
+
+    def aguardar(self):
+        # o navegador refaz o fragmento de progresso a cada 0,5 s até a tarefa terminar; o AppTest não tem
+        # esse relógio, então a sessão roda de novo enquanto houver tarefa em andamento (botão Cancelar)
+        limite = time.monotonic() + self.timeout
+        while any(b.label == "Cancelar" for b in self.at.button):
+            if time.monotonic() > limite:
+                raise TimeoutError("tarefa em segundo plano não terminou")
+            time.sleep(0.5)
+            self.at.run()
+
+    def interagir(self, nome: str, acao):
+        def rodar():
+            acao()
+            self.aguardar()
+            if self.at.exception:
+                raise RuntimeError(self.at.exception[0].message)
+        self.medidor.interacao(nome, rodar)
+
+    def botao(self, rotulo: str):
+        return next(b for b in self.at.button if b.label == rotulo)
+
+    def numero(self, prefixo: str):
+        return next(n for n in self.at.number_input if n.label.startswith(prefixo))
+
+    def parametro(self, rng: random.Random):
+        # como um usuário: muda um parâmetro por vez (cada mudança é um rerun)
+        nome, valor = rng.choice(list(parametros_aleatorios(rng).items()))
+        self.numero(PARAMETROS[nome]).set_value(valor).run()
+
+    def filtrar_empresas(self, rng: random.Random):
+        if rng.random() < 0.5:
+            self.at.radio(key="rel_emp_modo").set_value("Todos").run()
+            return
+        self.at.radio(key="rel_emp_modo").set_value(rng.choice(["Só estes", "Todos exceto"])).run()
+        opcoes = self.at.multiselect(key="rel_emp_valores").options
+        self.at.multiselect(key="rel_emp_valores").set_value(rng.sample(opcoes, min(len(opcoes), rng.randint(1, 5)))).run()
+
+# _sessoes_paralelas mexe em partes internas do Streamlit; foi escrita e conferida contra esta versão
+# (a mesma fixada em requirements.txt)
+STREAMLIT_TESTADO = "1.66."
+
+def _conferir_streamlit():
+    # falha alto se a versão ou as partes internas usadas por _sessoes_paralelas mudaram
+    import inspect
+
+    import streamlit
+    from streamlit.runtime import Runtime
+    from streamlit.testing.v1 import app_test
+    problemas = []
+    if not streamlit.__version__.startswith(STREAMLIT_TESTADO):
+        problemas.append(f"versão {streamlit.__version__} (testada: {STREAMLIT_TESTADO}x)")
+    if "_instance" not in vars(Runtime) or not all(isinstance(vars(Runtime).get(m), classmethod) for m in ("instance", "exists")):
+        problemas.append("Runtime._instance / Runtime.instance / Runtime.exists")
+    if not callable(getattr(app_test, "patch_config_options", None)):
+        problemas.append("streamlit.testing.v1.app_test.patch_config_options")
+    fonte = inspect.getsource(app_test.AppTest._run)
+    if not all(trecho in fonte for trecho in ("Runtime._instance = None", "patch_config_options", '"global.appTest": True')):
+        problemas.append("AppTest._run (não instala/remove mais o Runtime simulado do mesmo jeito)")
+    if problemas:
+        raise RuntimeError("o modo app do teste de carga depende de partes internas do Streamlit que mudaram: "
+                           + "; ".join(problemas) + ". Revise _sessoes_paralelas antes de atualizar STREAMLIT_TESTADO.")
+
+def _sessoes_paralelas():
+    # O AppTest roda uma sessão por vez: cada execução instala um Runtime simulado e o remove no fim, e liga
+    # global.appTest só enquanto roda. Com várias sessões em paralelo no mesmo processo, o fim de uma derrubaria
+    # as outras; aqui o último Runtime instalado e a opção valem para o processo inteiro.
+    _conferir_streamlit()
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.testing.v1 import app_test
+    config.set_option("global.appTest", True)
+    app_test.patch_config_options = lambda _: contextlib.nullcontext()
+    ultimo = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            ultimo["runtime"] = cls._instance
+        if "runtime" not in ultimo:
+            raise RuntimeError("Runtime hasn't been created!")
+        return ultimo["runtime"]
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or "runtime" in ultimo)
+
+def sessao_app(medidor: Medidor, bundle: dict, rodadas: int, pausa: float, semente: int, timeout: float):
+    rng = random.Random(semente)
+    s = SessaoApp(medidor, bundle, timeout)
+    s.interagir("upload", s.at.run)
+    for _ in range(rodadas):
+        time.sleep(rng.uniform(0, pausa))
+        s.interagir("parametro", lambda: s.parametro(rng))
+        time.sleep(rng.uniform(0, pausa))
+        s.interagir("filtro", lambda: s.filtrar_empresas(rng))
+        time.sleep(rng.uniform(0, pausa))
+        s.interagir("relatorio", lambda: s.botao("Gerar relatório agora").click().run())
+        time.sleep(rng.uniform(0, pausa))
+        s.interagir("excel", lambda: s.botao("📗 Preparar planilha Excel (.xlsx)").click().run())
+        time.sleep(rng.uniform(0, pausa))
+        s.interagir("zip_empresas", lambda: s.botao("Gerar relatórios por empresa (.zip)").click().run())
+
+def servidor(args):
+    # processo filho: roda as sessões sobre os pacotes gravados em args.executor e devolve as medições em JSON
+    import diagnostico
+    with open(os.path.join(args.executor, "pacotes.json"), encoding="utf-8") as f:
+        pacotes = json.load(f)
+    bundles = []
+    for pacote in pacotes:
+        bundle = {}
+        for ds, nome in pacote.items():
+            with open(os.path.join(args.executor, nome), "rb") as f:
+                bundle[ds] = (nome, f.read())
+        bundles.append(bundle)
+    _sessoes_paralelas()
+    SessaoApp(Medidor(), {}, args.timeout).at.run()     # aquecimento: imports do app e primeiro Runtime
+    medidor = Medidor()
+    for nome in ETAPAS:
+        medidor.cronometrar(diagnostico, nome)
+    falhas = []
+
+    def rodar(i):
+        try:
+            sessao_app(medidor, bundles[i % len(bundles)], args.rodadas, args.pausa, i, args.timeout)
+        except Exception as e:
+            falhas.append(f"sessão {i}: {type(e).__name__}: {e}")
+
+    duracao = _disparar(rodar, args.sessoes, args.rampa)
+    with open(os.path.join(args.executor, "resultado.json"), "w", encoding="utf-8") as f:
+        json.dump({"duracao_s": duracao, "latencias": medidor.latencias, "erros": medidor.erros,
+                   "etapas": medidor.etapas, "falhas": falhas}, f)
+
+def rodar_app(args, bundles: list) -> tuple:
+    # grava os pacotes, sobe o servidor e mede o processo dele (não o deste)
+    _conferir_streamlit()
+    with tempfile.TemporaryDirectory(prefix="carga_") as pasta:
+        pacotes = []
+        for bundle in bundles:
+            pacotes.append({ds: nome for ds, (nome, _) in bundle.items()})
+            for nome, conteudo in bundle.values():
+                with open(os.path.join(pasta, nome), "wb") as f:
+                    f.write(conteudo)
+        with open(os.path.join(pasta, "pacotes.json"), "w", encoding="utf-8") as f:
+            json.dump(pacotes, f)
+        env = dict(os.environ, ACESSORIAS_WORKERS=str(args.workers), ACESSORIAS_CACHE_MB=str(args.cache_mb),
+                   ACESSORIAS_CACHE_DIR=os.path.join(pasta, "cache"), ACESSORIAS_CARTEIRA=os.path.join(pasta, "carteira"))
+        os.makedirs(env["ACESSORIAS_CACHE_DIR"])
+        cmd = [sys.executable, "-W", "ignore", os.path.abspath(__file__), "--executor", pasta, "--sessoes", str(args.sessoes),
+               "--rodadas", str(args.rodadas), "--pausa", str(args.pausa), "--rampa", str(args.rampa), "--timeout", str(args.timeout)]
+        log = os.path.join(pasta, "servidor.log")
+        with open(log, "wb") as saida:
+            filho = subprocess.Popen(cmd, env=env, stdout=saida, stderr=subprocess.STDOUT)
+            monitor = Monitor(filho.pid)
+            monitor.start()
+            filho.wait()
+        monitor.parar.set()
+        monitor.join()
+        resultado = os.path.join(pasta, "resultado.json")
+        if filho.returncode != 0 or not os.path.exists(resultado):
+            with open(log, encoding="utf-8", errors="replace") as f:
+                raise SystemExit(f"o servidor terminou com código {filho.returncode}:\n{f.read()[-4000:]}")
+        with open(resultado, encoding="utf-8") as f:
+            dados = json.load(f)
+    return Medidor.carregar(dados), dados["duracao_s"], dados["falhas"], monitor
+
+# ----- modo api: instância local do api.py -----
+def _http(metodo: str, url: str, corpo: bytes = None) -> bytes:
+    req = urllib.request.Request(url, data=corpo, method=metodo)
+    with urllib.request.urlopen(req, timeout=600) as r:
+        return r.read()
+
+def sessao_api(base: str, medidor: Medidor, bundle: dict, rodadas: int, pausa: float, semente: int, cliente: str):
+    rng = random.Random(semente)
+
+    def enviar():
+        for ds, (nome, conteudo) in bundle.items():
+            _http("PUT", f"{base}/clientes/{cliente}/{ds}?{urlencode({'nome': nome})}", conteudo)
+    medidor.interacao("upload", enviar)
+    medidor.interacao("primeiro_resumo", _http, "GET", f"{base}/resumo?{urlencode({'cliente': cliente})}")
+    for _ in range(rodadas):
+        time.sleep(rng.uniform(0, pausa))
+        params = parametros_aleatorios(rng)
+        medidor.interacao("resumo", _http, "GET", f"{base}/resumo?{urlencode({'cliente': cliente, **params})}")
+
+def rodar_api(args, bundles: list) -> tuple:
+    base = args.api.rstrip("/")
+    medidor = Medidor()
+    monitor = Monitor(args.pid) if args.pid else None
+    if monitor is not None:
+        monitor.start()
+    falhas = []
+
+    def rodar(i):
+        try:
+            sessao_api(base, medidor, bundles[i % len(bundles)], args.rodadas, args.pausa, i, f"carga_{i % len(bundles)}")
+        except Exception as e:
+            falhas.append(f"sessão {i}: {type(e).__name__}: {e}")
+
+    duracao = _disparar(rodar, args.sessoes, args.rampa)
+    if monitor is not None:
+        monitor.parar.set()
+        monitor.join()
+    return medidor, duracao, falhas, monitor
+
+# ----- execução -----
+def _disparar(rodar, sessoes: int, rampa: float) -> float:
+    threads = [threading.Thread(target=rodar, args=(i,), name=f"sessao-{i}") for i in range(sessoes)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+        if rampa:
+            time.sleep(rampa / sessoes)
+    for t in threads:
+        t.join()
+    return time.perf_counter() - inicio
+
+def main():
+    ap = argparse.ArgumentParser(description="Teste de carga com sessões simultâneas (app.py ou api.py).")
+    ap.add_argument("--sessoes", type=int, default=8, help="sessões simultâneas")
+    ap.add_argument("--rodadas", type=int, default=3, help="ciclos parâmetros/filtro/relatório/excel/zip por sessão")
+    ap.add_argument("--linhas", type=int, default=20000, help="linhas de Entregas por pacote sintético")
+    ap.add_argument("--clientes", type=int, default=0, help="pacotes distintos (0 = um por sessão); menos = sessões compartilham dados")
+    ap.add_argument("--pausa", type=float, default=1.0, help="tempo máximo de 'leitura' entre interações (s)")
+    ap.add_argument("--rampa", type=float, default=0.0, help="segundos para iniciar todas as sessões")
+    ap.add_argument("--workers", type=int, default=4, help="pool de tarefas do servidor (modo app)")
+    ap.add_argument("--cache-mb", type=int, default=1024, help="orçamento do cache de datasets (modo app)")
+    ap.add_argument("--timeout", type=float, default=600, help="limite por interação (s, modo app)")
+    ap.add_argument("--api", help="URL de uma instância do api.py; sem isso, sobe o app.py num processo servidor")
+    ap.add_argument("--pid", type=int, help="processo do servidor para medir RSS/CPU (modo api)")
+    ap.add_argument("--saida", help="grava latências, amostras de RSS/CPU e etapas em JSON")
+    ap.add_argument("--executor", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.executor:
+        return servidor(args)
+
+    n_bundles = args.clientes or args.sessoes
+    t0 = time.perf_counter()
+    bundles = [bundle_sintetico(args.linhas, i, date.today()) for i in range(n_bundles)]
+    print(f"{n_bundles} pacote(s) sintético(s) de {args.linhas} entregas gerados em {time.perf_counter() - t0:.1f}s")
+
+    medidor, duracao, falhas, monitor = (rodar_api if args.api else rodar_app)(args, bundles)
+
+    total = sum(len(v) for v in medidor.latencias.values())
+    print(f"\n{args.sessoes} sessões, {total} interações em {duracao:.1f}s ({total / duracao:.2f} interações/s)")
+    if total:
+        print("\nLatência por interação (s):")
+        print(medidor.latencia().to_string())
+    recursos = monitor.resumo() if monitor is not None else {}
+    if recursos:
+        print("\nServidor: " + ", ".join(f"{k}={v}" for k, v in recursos.items()))
+    if medidor.etapas:
+        print("\nTempo somado por etapa (todas as sessões/threads):")
+        print(medidor.tempo_por_etapa().to_string())
+    for f in falhas:
+        print("FALHA", f)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "duracao_s": duracao, "latencias": medidor.latencias,
+                       "erros": medidor.erros, "etapas": medidor.etapas, "recursos": recursos,
+                       "amostras": monitor.amostras if monitor is not None else [], "falhas": falhas}, f, default=str)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1972 @@
+import csv
+import functools
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+# Núcleo de cálculo (sem Streamlit) usado pelo app.py e pela API local (api.py).
+
+# ============== Leitura & normalização ==============
+# alvo -> nome sugerido na exportação do Acessórias (já em minúsculas)
+MAPAS = {
+    "entregas": {
+        "empresa": "empresa",
+        "cnpj": "cnpj",
+        "obrigacao": "obrigação / tarefa",
+        "departamento": "departamento",
+        "responsavel_prazo": "responsável prazo",
+        "responsavel_entrega": "responsável entrega",
+        "competencia": "competência",
+        "data_vencimento": "vencimento",
+        "data_entrega": "data entrega",
+        "status": "status",
+        "protocolo": "protocolo"
+    },
+    "solicitacoes": {
+        "id": "id da solicitação",
+        "assunto": "assunto",
+        "empresa": "empresa",
+        "status": "status",
+        "prioridade": "prioridade",
+        "responsavel": "responsável",
+        "abertura": "abertura",
+        "prazo": "prazo",
+        "ultima_atualizacao": "última atualização",
+        "conclusao": "conclusão"
+    },
+    "obrigacoes": {
+        "obrigacao": "obrigação",
+        "mini": "mini",
+        "departamento": "departamento",
+        "responsavel": "responsável",
+        "periodicidade": "periodicidade",
+        "prazo_mensal": "prazo",
+        "alerta_dias": "alerta"
+    },
+    "processos": {
+        "id_processo": "id",
+        "processo": "processo",
+        "departamento": "departamento",
+        "empresa": "empresa",
+        "responsavel": "responsável",
+        "inicio": "inicio",
+        "conclusao": "conclusão",
+        "status": "status",
+        "progresso": "progresso"
+    },
+    "responsaveis": {
+        "responsavel": "responsavel",
+        "departamento": "departamento",
+        "email": "email",
+        "cargo": "cargo"
+    },
+}
+
+COLUNAS_DATA = {
+    "entregas": ["data_vencimento","data_entrega","competencia"],
+    "solicitacoes": ["abertura","prazo","ultima_atualizacao","conclusao"],
+    "processos": ["inicio","conclusao"],
+}
+STATUS_CONHECIDOS = ["Concluída", "Pendente"]
+
+def _sniff_sep(uploaded_file):
+    pos = uploaded_file.tell()
+    amostra = uploaded_file.read(64 * 1024)
+    uploaded_file.seek(pos)
+    if isinstance(amostra, bytes):
+        amostra = amostra.decode("utf-8", errors="ignore")
+    try:
+        return csv.Sniffer().sniff(amostra, delimiters=";,\t|").delimiter
+    except csv.Error:
+        return None
+
+def _usecols(colunas):
+    # `colunas` são nomes já normalizados (minúsculas, sem espaços nas pontas), como no mapeamento
+    if not colunas:
+        return None
+    colunas = set(colunas)
+    return lambda c: str(c).strip().lower() in colunas
+
+def read_any_csv(uploaded_file, colunas=None) -> pd.DataFrame:
+    # separador detectado numa amostra -> parser C (rápido e solta o GIL); senão, o caminho antigo.
+    # Com `colunas`, só as colunas mapeadas são convertidas (usecols).
+    usecols = _usecols(colunas)
+    sep = _sniff_sep(uploaded_file)
+    if sep:
+        try:
+            return pd.read_csv(uploaded_file, sep=sep, usecols=usecols)
+        except Exception:
+            uploaded_file.seek(0)
+    try:
+        return pd.read_csv(uploaded_file, sep=None, engine="python", usecols=usecols)
+    except Exception:
+        uploaded_file.seek(0)
+        return pd.read_csv(uploaded_file, sep=";", engine="python", encoding="utf-8", dtype=str, usecols=usecols)
+
+def _celula_str(v):
+    # mesmo texto que read_excel(dtype=str) produziria
+    if v is None:
+        return np.nan
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+def _read_xlsx_colunas(uploaded_file, colunas) -> pd.DataFrame:
+    # openpyxl em modo streaming: guarda só as células das colunas pedidas (primeira aba)
+    from openpyxl import load_workbook
+    wb = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        linhas = wb.worksheets[0].iter_rows(values_only=True)
+        cabecalho = next(linhas, ())
+        pos = [i for i, c in enumerate(cabecalho) if c is not None and str(c).strip().lower() in colunas]
+        dados = {i: [] for i in pos}
+        for linha in linhas:
+            if not any(v is not None for v in linha):
+                continue
+            for i in pos:
+                dados[i].append(_celula_str(linha[i]) if i < len(linha) else np.nan)
+    finally:
+        wb.close()
+    return pd.DataFrame({str(cabecalho[i]): pd.Series(dados[i], dtype=str) for i in pos})
+
+def read_excel(uploaded_file, colunas=None) -> pd.DataFrame:
+    if colunas:
+        try:
+            return _read_xlsx_colunas(uploaded_file, set(colunas))
+        except Exception:
+            uploaded_file.seek(0)
+    try:
+        return pd.read_excel(uploaded_file, dtype=str, usecols=_usecols(colunas))
+    except Exception:
+        uploaded_file.seek(0)
+        return pd.read_excel(uploaded_file, engine="xlrd", dtype=str, usecols=_usecols(colunas))
+
+def read_upload(uploaded_file, name: str, colunas=None) -> pd.DataFrame:
+    if name.lower().endswith((".xls",".xlsx")):
+        return read_excel(uploaded_file, colunas)
+    return read_any_csv(uploaded_file, colunas)
+
+EXTENSOES_DADOS = (".csv", ".txt", ".xls", ".xlsx")
+
+def _abrir_membro(conteudo: bytes, membro: str):
+    # um ZipFile por leitura: cada thread tem o seu fluxo
+    return zipfile.ZipFile(io.BytesIO(conteudo)).open(membro)
+
+def open_members(nome: str, conteudo: bytes) -> list:
+    # [(nome, abrir)] dos arquivos de dados; .gz e membros de .zip são lidos como fluxo
+    # (o parser consome a descompressão aos poucos, sem uma cópia descompactada inteira em memória)
+    baixo = nome.lower()
+    if baixo.endswith(".zip"):
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as z:
+            membros = [m.filename for m in z.infolist() if not m.is_dir() and not m.filename.startswith("__MACOSX/")
+                       and m.filename.lower().endswith(EXTENSOES_DADOS)]
+        if not membros:
+            raise ValueError(f"{nome}: nenhum CSV/XLSX dentro do zip")
+        return [(f"{nome}/{m}", functools.partial(_abrir_membro, conteudo, m)) for m in sorted(membros)]
+    if baixo.endswith(".gz"):
+        return [(nome[:-3], lambda: gzip.GzipFile(fileobj=io.BytesIO(conteudo)))]
+    return [(nome, lambda: io.BytesIO(conteudo))]
+
+def read_many(arquivos, leitor=None, workers: int = None, progresso=None, colunas=None) -> pd.DataFrame:
+    # vários arquivos do mesmo dataset (ex.: 12 CSVs mensais, ou um .zip com eles): leitura em paralelo,
+    # cabeçalhos normalizados, concatenação com a coluna `arquivo_origem` e remoção de linhas repetidas.
+    # `colunas`: lê só essas (as do mapeamento); as demais nem chegam a ser convertidas.
+    leitor = leitor or (lambda buf, nome: read_upload(buf, nome, colunas))
+    def ler(item):
+        nome, abrir = item
+        with abrir() as buf:
+            return to_lower_strip(leitor(buf, nome)).assign(arquivo_origem=nome)
+    arquivos = [m for nome, conteudo in arquivos for m in open_members(nome, conteudo)]
+    partes = [None] * len(arquivos)
+    with ThreadPoolExecutor(max_workers=workers or min(8, len(arquivos))) as ex:
+        futuros = {ex.submit(ler, a): i for i, a in enumerate(arquivos)}
+        for feitos, fut in enumerate(as_completed(futuros), 1):
+            partes[futuros[fut]] = fut.result()
+            if progresso:
+                progresso(feitos, len(arquivos))
+    df = pd.concat(partes, ignore_index=True, sort=False)
+    if len(arquivos) > 1:
+        df = df.drop_duplicates(subset=[c for c in df.columns if c != "arquivo_origem"]).reset_index(drop=True)
+    return df
+
+def read_preview(arquivos, n: int = 200) -> pd.DataFrame:
+    # só as primeiras linhas de cada arquivo: basta para o mapeador de colunas
+    partes = []
+    for nome, abrir in (m for nome, conteudo in arquivos for m in open_members(nome, conteudo)):
+        with abrir() as buf:
+            if nome.lower().endswith((".xls",".xlsx")):
+                df = pd.read_excel(buf, dtype=str, nrows=n)
+            else:
+                df = pd.read_csv(buf, sep=_sniff_sep(buf), engine="python", nrows=n)
+        partes.append(to_lower_strip(df).assign(arquivo_origem=nome))
+    return pd.concat(partes, ignore_index=True, sort=False)
+
+def parse_dates(df: pd.DataFrame, cols, dayfirst: bool = True):
+    # dayfirst=True para as exportações (dd/mm/aaaa); False para arquivos já em ISO
+    for c in cols:
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c], errors="coerce", dayfirst=dayfirst)
+    return df
+
+def to_lower_strip(df: pd.DataFrame):
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    return df
+
+def _norm_status(x: str):
+    if not isinstance(x, str):
+        return x
+    s = x.strip().lower()
+    if s in ["concluido", "concluída", "concluida", "concluído", "finalizado", "feito"]:
+        return "Concluída"
+    if s in ["pendente", "em aberto", "aberto", "em andamento"]:
+        return "Pendente"
+    return x
+
+def apply_mapping(df: pd.DataFrame, mapping: dict):
+    # mapping é {alvo: coluna da planilha}; renomeia coluna -> alvo
+    return df.rename(columns={v: k for k, v in mapping.items()})
+
+def default_mapping(df: pd.DataFrame, dataset: str) -> dict:
+    # o mesmo palpite que o mapeador da UI usa quando ninguém mexe nele
+    return {k: v for k, v in MAPAS[dataset].items() if v in df.columns}
+
+def prepare_entregas(df_ent: pd.DataFrame, hoje, feriados=None, dayfirst: bool = True) -> pd.DataFrame:
+    df_ent = parse_dates(df_ent, COLUNAS_DATA["entregas"], dayfirst)
+    if "status" in df_ent.columns:
+        df_ent["status"] = df_ent["status"].map(_norm_status).fillna(df_ent["status"])
+
+    today = pd.to_datetime(hoje)
+    if "data_vencimento" in df_ent.columns and feriados is not None:
+        # modo dias úteis: vencimento em fim de semana/feriado passa para o próximo dia útil,
+        # e todas as flags abaixo comparam contra o prazo prorrogado
+        venc = df_ent["data_vencimento"]
+        df_ent["data_vencimento"] = pd.Series(roll_business_day(venc, feriados), index=df_ent.index).astype(venc.dtype)
+    if "data_vencimento" in df_ent.columns:
+        df_ent["atrasada_concluida"] = np.where(
+            (df_ent.get("status","").str.lower()=="concluída") & df_ent.get("data_entrega").notna() & (df_ent.get("data_entrega") > df_ent.get("data_vencimento")),
+            True, False
+        )
+        df_ent["atrasada_pendente"] = np.where(
+            (df_ent.get("status","").str.lower()!="concluída") & df_ent.get("data_vencimento").notna() & (today > df_ent.get("data_vencimento")),
+            True, False
+        )
+        df_ent["em_risco"] = np.where(
+            (df_ent.get("status","").str.lower()!="concluída") & df_ent.get("data_vencimento").notna() & (pd.Series(diff_days(today, df_ent.get("data_vencimento"), feriados), index=df_ent.index).between(0, PARAMETROS_PADRAO["dias_em_risco"])),
+            True, False
+        )
+        df_ent["pontual"] = np.where(
+            (df_ent.get("status","").str.lower()=="concluída") & df_ent.get("data_entrega").notna() & (df_ent.get("data_entrega") <= df_ent.get("data_vencimento")),
+            True, False
+        )
+        df_ent["dias_atraso"] = np.where(
+            (df_ent.get("status","").str.lower()=="concluída") & df_ent.get("data_entrega").notna(),
+            np.clip(diff_days(df_ent.get("data_vencimento"), df_ent.get("data_entrega"), feriados), 0, None),
+            np.where(
+                (df_ent.get("status","").str.lower()!="concluída") & df_ent.get("data_vencimento").notna(),
+                np.clip(diff_days(df_ent.get("data_vencimento"), today, feriados), 0, None),
+                np.nan
+            )
+        )
+    return df_ent
+
+def prepare_solicitacoes(dfr: pd.DataFrame, hoje, feriados=None, dayfirst: bool = True) -> pd.DataFrame:
+    dfr = parse_dates(dfr, COLUNAS_DATA["solicitacoes"], dayfirst)
+    if "status" in dfr.columns:
+        dfr["status"] = dfr["status"].map(_norm_status).fillna(dfr["status"])
+
+    today = pd.to_datetime(hoje)
+    dfr["tempo_ate_conclusao_dias"] = np.where(
+        dfr.get("conclusao").notna() & dfr.get("abertura").notna(),
+        diff_days(dfr.get("abertura"), dfr.get("conclusao"), feriados),
+        np.nan
+    )
+    dfr["aberta_ha_dias"] = np.where(
+        dfr.get("conclusao").isna() & dfr.get("abertura").notna(),
+        diff_days(dfr.get("abertura"), today, feriados),
+        np.nan
+    )
+    return dfr
+
+def prepare_processos(dfp: pd.DataFrame, dayfirst: bool = True) -> pd.DataFrame:
+    dfp = parse_dates(dfp, COLUNAS_DATA["processos"], dayfirst)
+    if "status" in dfp.columns:
+        dfp["status"] = dfp["status"].map(_norm_status).fillna(dfp["status"])
+    return dfp
+
+# ============== Qualidade dos dados ==============
+def quality_checks(df: pd.DataFrame, raw: pd.DataFrame, mapping: dict, dataset: str) -> dict:
+    # nome da checagem -> (máscara por linha, valores de exemplo); uma passada vetorizada por checagem
+    checks = {}
+    def add(nome, mask, valores):
+        mask = np.asarray(pd.Series(mask, index=df.index).fillna(False), dtype=bool)
+        checks[nome] = (mask, valores)
+
+    for c in COLUNAS_DATA.get(dataset, []):
+        origem = mapping.get(c)
+        if c in df.columns and origem in raw.columns:
+            bruto = raw[origem].astype("string").str.strip()
+            add(f"{c}: data inválida (virou vazio)", bruto.notna() & (bruto != "") & df[c].isna(), bruto)
+    if "status" in df.columns:
+        st_ = df["status"]
+        add("status não reconhecido", st_.notna() & ~st_.isin(STATUS_CONHECIDOS), st_)
+    if "empresa" in df.columns:
+        emp = df["empresa"].astype("string").str.strip()
+        add("empresa vazia", emp.isna() | (emp == ""), None)
+    if dataset == "entregas":
+        if {"data_entrega","competencia"}.issubset(df.columns):
+            add("data_entrega antes da competência", df["data_entrega"] < df["competencia"], None)
+        if "protocolo" in df.columns:
+            prot = df["protocolo"].astype("string").str.strip()
+            add("protocolo duplicado", prot.notna() & (prot != "") & prot.duplicated(keep=False), prot)
+    if dataset == "solicitacoes" and {"abertura","conclusao"}.issubset(df.columns):
+        add("conclusão antes da abertura", df["conclusao"] < df["abertura"], None)
+    if dataset == "processos" and {"inicio","conclusao"}.issubset(df.columns):
+        add("duração negativa (conclusão antes do início)", df["conclusao"] < df["inicio"], None)
+    return checks
+
+def quality_profile(df: pd.DataFrame, raw: pd.DataFrame, mapping: dict, dataset: str) -> tuple:
+    # (resumo por checagem, linhas com problema + coluna `problemas`)
+    checks = quality_checks(df, raw, mapping, dataset)
+    n = len(df)
+    resumo = []
+    problemas = pd.Series("", index=df.index, dtype=object)
+    for nome, (mask, valores) in checks.items():
+        qtd = int(mask.sum())
+        if valores is not None:
+            exemplos = ", ".join(map(str, valores[mask].value_counts().index[:3]))
+        else:
+            exemplos = ", ".join(f"linha {i}" for i in (np.flatnonzero(mask)[:3] + 2))
+        resumo.append({"checagem": nome, "linhas": qtd, "pct": round(100 * qtd / n, 2) if n else 0.0, "exemplos": exemplos})
+        if qtd:
+            problemas = problemas.where(~mask, problemas + nome + "; ")
+    resumo = pd.DataFrame(resumo, columns=["checagem","linhas","pct","exemplos"])
+    ruins = problemas != ""
+    linhas = df[ruins.to_numpy()].assign(problemas=problemas[ruins].str.rstrip("; "))
+    linhas.insert(0, "linha_planilha", np.flatnonzero(ruins.to_numpy()) + 2)
+    return resumo, linhas
+
+# ============== Dias úteis ==============
+FERIADOS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feriados", "feriados.csv")
+UFS = ["AC","AL","AM","AP","BA","CE","DF","ES","GO","MA","MG","MS","MT","PA","PB","PE","PI","PR","RJ","RN","RO","RR","RS","SC","SE","SP","TO"]
+
+@functools.lru_cache(maxsize=None)
+def load_holidays(uf: str = None, caminho: str = FERIADOS_CSV) -> np.ndarray:
+    # feriados nacionais + os da UF (gerados por feriados/gerar_feriados.py; linhas extras podem ser acrescentadas)
+    # UF fora do CSV é erro: contar só os nacionais para ela distorceria os dias úteis sem aviso
+    f = pd.read_csv(caminho, dtype=str)
+    abr = f["abrangencia"].str.strip().str.upper()
+    uf = (uf or "").strip().upper()
+    if uf and not (abr == uf).any():
+        raise ValueError(f"sem feriados para a UF {uf} em {caminho}; rode feriados/gerar_feriados.py")
+    ok = ((abr == "BR") | (abr == uf)) & f["data"].notna()
+    out = np.unique(pd.to_datetime(f.loc[ok, "data"], format="%Y-%m-%d").to_numpy().astype("datetime64[D]"))
+    out.setflags(write=False)
+    return out
+
+def _as_days(x) -> np.ndarray:
+    if isinstance(x, (pd.Series, pd.Index, np.ndarray)):
+        return pd.to_datetime(pd.Series(np.asarray(x))).to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+    return np.array(pd.Timestamp(x).to_datetime64(), dtype="datetime64[ns]").astype("datetime64[D]")
+
+def diff_days(inicio, fim, feriados=None) -> np.ndarray:
+    # fim - inicio em dias corridos, ou em dias úteis (np.busday_count) quando há calendário de feriados
+    a, b = np.broadcast_arrays(_as_days(inicio), _as_days(fim))
+    ok = ~np.isnat(a) & ~np.isnat(b)
+    out = np.full(a.shape, np.nan)
+    if feriados is None:
+        out[ok] = (b[ok] - a[ok]).astype(float)
+    else:
+        out[ok] = np.busday_count(a[ok], b[ok], holidays=feriados)
+    return out
+
+def roll_business_day(datas, feriados) -> np.ndarray:
+    # vencimentos em fim de semana/feriado vão para o próximo dia útil
+    d = _as_days(datas)
+    ok = ~np.isnat(d)
+    out = d.copy()
+    out[ok] = np.busday_offset(d[ok], 0, roll="forward", holidays=feriados)
+    return out
+
+DATASETS = {"entregas": "dfe", "solicitacoes": "dfs", "obrigacoes": "dfo", "processos": "dfp", "responsaveis": "dfr"}
+
+def load_dataset(uploaded_file, name: str, dataset: str, hoje, mapping: dict = None, feriados=None,
+                 dayfirst: bool = True) -> pd.DataFrame:
+    # leitura + mapeamento (palpite padrão se `mapping` for None) + tratamento, como nas abas
+    conteudo = uploaded_file.read()
+    if mapping is None:
+        # só o cabeçalho para o palpite; depois lê apenas as colunas mapeadas
+        mapping = default_mapping(read_preview([(name, conteudo)], n=0), dataset)
+    df = apply_mapping(read_many([(name, conteudo)], colunas=set(mapping.values()) or None), mapping)
+    return prepare_dataset(df, dataset, hoje, feriados, dayfirst)
+
+def prepare_dataset(df: pd.DataFrame, dataset: str, hoje, feriados=None, dayfirst: bool = True) -> pd.DataFrame:
+    if dataset == "entregas":
+        return prepare_entregas(df, hoje, feriados, dayfirst)
+    if dataset == "solicitacoes":
+        return prepare_solicitacoes(df, hoje, feriados, dayfirst)
+    if dataset == "processos":
+        return prepare_processos(df, dayfirst)
+    return df
+
+def ingest(arquivos, dataset: str, mapping: dict, hoje, feriados=None, leitor=None, tarefa=None) -> dict:
+    # leitura + tratamento + qualidade + índice de datas de um dataset, com progresso/cancelamento
+    reportar = tarefa.reportar if tarefa is not None else (lambda *a: None)
+    reportar(0.0, "lendo arquivos")
+    raw = read_many(arquivos, leitor, progresso=lambda i, n: reportar(0.7 * i / n, f"lendo arquivos ({i}/{n})"),
+                    colunas=set(mapping.values()) or None)
+    reportar(0.7, "tratando colunas e datas")
+    df = prepare_dataset(apply_mapping(raw, mapping), dataset, hoje, feriados)
+    reportar(0.85, "checando qualidade")
+    qualidade = quality_profile(df, raw, mapping, dataset)
+    reportar(0.95, "indexando datas")
+    idx = build_date_indexes(df)
+    reportar(1.0, "pronto")
+    return {"df": df, "idx": idx, "qualidade": qualidade}
+
+def prepare_bundle(dados: dict, hoje, unificar_empresas: bool = True, feriados=None, cliente: str = None,
+                   pasta_empresas: str = None) -> dict:
+    # dados: {"dfe": df, ...} já tratados; aplica os mesmos enriquecimentos do app.
+    # Com `cliente`, a unificação de empresas usa (e atualiza) a guardada dele
+    dados = dict(dados)
+    if unificar_empresas:
+        carregados = [k for k in ["dfe","dfs","dfp"] if isinstance(dados.get(k), pd.DataFrame)]
+        nomes = company_names([dados[k] for k in carregados])
+        if not nomes.empty:
+            resolvidos = resolve_client_companies(nomes, cliente, pasta_empresas) if cliente else resolve_companies(nomes)
+            for k in carregados:
+                dados[k] = apply_company_ids(dados[k], resolvidos)
+    if isinstance(dados.get("dfe"), pd.DataFrame) and (dados.get("dfo") is not None or dados.get("dfr") is not None):
+        dados["dfe"] = enrich_entregas(dados["dfe"], dados.get("dfo"), dados.get("dfr"))
+        if "data_vencimento" in dados["dfe"].columns:
+            dados["dfe"]["em_risco"] = flag_em_risco(dados["dfe"], pd.to_datetime(hoje), PARAMETROS_PADRAO["dias_em_risco"], feriados)
+    if isinstance(dados.get("dfp"), pd.DataFrame) and dados.get("dfr") is not None:
+        dados["dfp"] = fill_departamento(dados["dfp"].copy(), dados["dfr"], ["responsavel"])
+    return dados
+
+# ============== Índice temporal ==============
+class DateIndex:
+    # argsort de uma coluna de datas + busca binária: janelas viram fatias.
+    def __init__(self, s: pd.Series):
+        vals = pd.to_datetime(s, errors="coerce").to_numpy(dtype="datetime64[ns]")
+        pos = np.flatnonzero(~np.isnat(vals))
+        order = np.argsort(vals[pos], kind="stable")
+        self.keys = vals[pos][order]
+        self.rows = pos[order]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _bound(self, when, default):
+        if when is None:
+            return default
+        return int(np.searchsorted(self.keys, np.datetime64(pd.Timestamp(when), "ns"), side="left"))
+
+    def window(self, start=None, end=None) -> np.ndarray:
+        # posições (iloc) com start <= data < end, em ordem de data
+        lo = self._bound(start, 0)
+        hi = self._bound(end, len(self.keys))
+        return self.rows[lo:max(lo, hi)]
+
+    def mask(self, n: int, start=None, end=None) -> np.ndarray:
+        out = np.zeros(n, dtype=bool)
+        out[self.window(start, end)] = True
+        return out
+
+def period_mask(idx: DateIndex, n: int, periodo) -> np.ndarray:
+    # filtro de período (datas inclusivas); None = sem filtro. Com período, linhas sem data nunca entram,
+    # mesmo que o período cubra todo o intervalo dos dados
+    if periodo is None or idx is None:
+        return np.ones(n, dtype=bool)
+    inicio, fim = pd.Timestamp(periodo[0]), pd.Timestamp(periodo[1])
+    return idx.mask(n, inicio, fim + pd.Timedelta(days=1))
+
+def build_date_indexes(df: pd.DataFrame, cols=("data_vencimento","abertura","inicio","competencia")) -> dict:
+    return {c: DateIndex(df[c]) for c in cols if c in df.columns}
+
+def window_rows(df: pd.DataFrame, idx: dict, col: str, start=None, end=None, sel=None) -> pd.DataFrame:
+    # recorte por janela de datas; `sel` é a máscara (len(df)) dos filtros já aplicados
+    if col not in idx:
+        return df.iloc[0:0]
+    rows = idx[col].window(start, end)
+    if sel is not None:
+        rows = rows[np.asarray(sel)[rows]]
+    return df.iloc[rows]
+
+# ============== Joins (códigos de categoria) ==============
+def _norm_key(s: pd.Series) -> pd.Series:
+    return s.astype("string").str.strip().str.lower()
+
+def lookup(left: pd.Series, keys: pd.Series, values: pd.Series, normalizar: bool = True) -> pd.Series:
+    # hash join via códigos de categoria: normaliza só os valores únicos de `left`
+    # e resolve cada categoria uma vez contra as chaves (primeira ocorrência vence)
+    norm = _norm_key if normalizar else (lambda x: x.astype("string"))
+    lc = left.astype("category")
+    rk = norm(keys)
+    first = (rk.notna() & ~rk.duplicated()).to_numpy()
+    cat_pos = pd.Index(rk[first]).get_indexer(norm(pd.Series(lc.cat.categories)))
+    row_pos = np.append(cat_pos, -1)[lc.cat.codes.to_numpy()]
+    vals = values.to_numpy()[first]
+    if not len(vals):
+        return pd.Series(np.nan, index=left.index, dtype=object)
+    return pd.Series(vals[np.maximum(row_pos, 0)], index=left.index).where(row_pos >= 0)
+
+def enrich_entregas(dfe: pd.DataFrame, dfo: pd.DataFrame = None, dfr: pd.DataFrame = None) -> pd.DataFrame:
+    # Obrigações -> alerta_dias/periodicidade por obrigação; Responsáveis -> departamento faltante
+    dfe = dfe.copy()
+    if isinstance(dfo, pd.DataFrame) and "obrigacao" in dfe.columns and "obrigacao" in dfo.columns:
+        if "alerta_dias" in dfo.columns:
+            alerta = pd.to_numeric(dfo["alerta_dias"].astype("string").str.extract(r"(\d+)")[0], errors="coerce")
+            dfe["alerta_dias"] = pd.to_numeric(lookup(dfe["obrigacao"], dfo["obrigacao"], alerta), errors="coerce")
+        for c in ["periodicidade", "prazo_mensal"]:
+            if c in dfo.columns and c not in dfe.columns:
+                dfe[c] = lookup(dfe["obrigacao"], dfo["obrigacao"], dfo[c])
+    return fill_departamento(dfe, dfr, ["responsavel_entrega", "responsavel_prazo"])
+
+def fill_departamento(df: pd.DataFrame, dfr: pd.DataFrame, resp_cols) -> pd.DataFrame:
+    if not isinstance(dfr, pd.DataFrame) or not {"responsavel","departamento"}.issubset(dfr.columns):
+        return df
+    for c in resp_cols:
+        if c not in df.columns:
+            continue
+        dep = lookup(df[c], dfr["responsavel"], dfr["departamento"])
+        if "departamento" in df.columns:
+            df["departamento"] = df["departamento"].where(df["departamento"].notna(), dep)
+        else:
+            df["departamento"] = dep
+    return df
+
+def flag_em_risco(dfe: pd.DataFrame, hoje, dias_padrao, feriados=None) -> np.ndarray:
+    # em risco contra a janela de alerta da própria obrigação (ou o limite global)
+    dias = pd.Series(diff_days(hoje, dfe["data_vencimento"], feriados), index=dfe.index)
+    limite = dfe["alerta_dias"].fillna(dias_padrao) if "alerta_dias" in dfe.columns else dias_padrao
+    pend = dfe.get("status","").str.lower() != "concluída"
+    return (pend & dfe["data_vencimento"].notna() & (dias >= 0) & (dias <= limite)).to_numpy()
+
+# ============== Calendário de obrigações ==============
+PERIODICIDADE_MESES = {"mensal": 1, "bimestral": 2, "trimestral": 3, "quadrimestral": 4, "semestral": 6, "anual": 12}
+
+def _obrigacoes_calendario(dfo: pd.DataFrame) -> pd.DataFrame:
+    ob = pd.DataFrame({
+        "obrigacao": dfo["obrigacao"],
+        "_obr": _norm_key(dfo["obrigacao"]),
+        "passo": _norm_key(dfo["periodicidade"]).map(PERIODICIDADE_MESES),
+        "dia": pd.to_numeric(dfo["prazo_mensal"].astype("string").str.extract(r"(\d+)")[0], errors="coerce"),
+    })
+    # periodicidades sem mês fixo (semanal, diária, eventual) ficam de fora
+    return ob.dropna(subset=["_obr","passo","dia"]).drop_duplicates("_obr").reset_index(drop=True)
+
+def _fases(dfe: pd.DataFrame, ob: pd.DataFrame) -> tuple:
+    # mês-âncora (mês % passo) mais frequente no histórico de Entregas: por empresa × obrigação e por obrigação.
+    # Sem isso uma anual cairia sempre em janeiro e uma trimestral em jan/abr/jul/out.
+    h = pd.DataFrame({"_emp": _norm_key(dfe["empresa"]), "_obr": _norm_key(dfe["obrigacao"]),
+                      "mes": pd.to_datetime(dfe["data_vencimento"], errors="coerce").dt.to_period("M").array.asi8})
+    h = h[h["mes"] != pd.NaT.value].dropna().merge(ob[["_obr", "passo"]], on="_obr")
+    h["fase"] = h["mes"] % h["passo"].astype(int)
+    por_par = (h.groupby(["_emp", "_obr", "fase"]).size().rename("n").reset_index()
+                .sort_values(["n", "fase"], ascending=[False, True]).drop_duplicates(["_emp", "_obr"]))
+    por_obr = (h.groupby(["_obr", "fase"]).size().rename("n").reset_index()
+                .sort_values(["n", "fase"], ascending=[False, True]).drop_duplicates("_obr"))
+    return por_par[["_emp", "_obr", "fase"]], por_obr.set_index("_obr")["fase"]
+
+def expand_calendar(dfo: pd.DataFrame, dfe: pd.DataFrame, inicio, fim, todas_empresas: bool = False, feriados=None) -> pd.DataFrame:
+    # vencimentos esperados por empresa × obrigação no horizonte [inicio, fim]
+    ob = _obrigacoes_calendario(dfo)
+    inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+    emp = pd.DataFrame({"empresa": dfe["empresa"], "_emp": _norm_key(dfe["empresa"]), "_obr": _norm_key(dfe["obrigacao"])}).dropna()
+    if todas_empresas:
+        pares = emp.drop_duplicates("_emp")[["empresa","_emp"]].merge(ob[["_obr"]], how="cross")
+    else:
+        # só os pares empresa × obrigação que já aparecem no histórico de Entregas
+        pares = emp.drop_duplicates(["_emp","_obr"])
+    pares = pares.merge(ob, on="_obr")
+    por_par, por_obr = _fases(dfe, ob)
+    pares = pares.merge(por_par, on=["_emp","_obr"], how="left")
+    # par sem histórico: âncora da obrigação nas outras empresas; sem nenhuma, janeiro (mês 0)
+    pares["fase"] = pares["fase"].fillna(pares["_obr"].map(por_obr)).fillna(0).astype(int)
+
+    meses = np.arange(inicio.to_period("M").ordinal, fim.to_period("M").ordinal + 1)
+    pi = np.repeat(np.arange(len(pares)), len(meses))
+    mi = np.tile(meses, len(pares))
+    passo = pares["passo"].to_numpy(dtype=int)[pi]
+    keep = mi % passo == pares["fase"].to_numpy()[pi]
+    pi, mi = pi[keep], mi[keep]
+    ini_mes = mi.astype("datetime64[M]")
+    dias_mes = ((ini_mes + 1).astype("datetime64[D]") - ini_mes.astype("datetime64[D]")).astype(int)
+    dia = np.minimum(pares["dia"].to_numpy(dtype=int)[pi], dias_mes)
+    venc = ini_mes.astype("datetime64[D]") + (dia - 1)
+    if feriados is not None:
+        venc = np.busday_offset(venc, 0, roll="forward", holidays=feriados)
+    cal = pd.DataFrame({
+        "empresa": pares["empresa"].to_numpy()[pi],
+        "_emp": pares["_emp"].to_numpy()[pi],
+        "_obr": pares["_obr"].to_numpy()[pi],
+        "obrigacao": pares["obrigacao"].to_numpy()[pi],
+        "mes": mi,
+        "passo": pares["passo"].to_numpy(dtype=int)[pi],
+        "fase": pares["fase"].to_numpy()[pi],
+        "vencimento_previsto": pd.to_datetime(venc),
+    })
+    cal = cal[(cal["vencimento_previsto"] >= inicio) & (cal["vencimento_previsto"] <= fim)]
+    return cal.sort_values(["vencimento_previsto","empresa"]).reset_index(drop=True)
+
+def missing_deliveries(cal: pd.DataFrame, dfe: pd.DataFrame) -> pd.DataFrame:
+    # anti-join (empresa, obrigação, período) contra Entregas: uma entrega conta para o período
+    # (bloco de `passo` meses a partir do mês-âncora) do seu vencimento, mesmo fora do mês exato
+    venc = pd.to_datetime(dfe["data_vencimento"], errors="coerce")
+    ent = pd.DataFrame({"_emp": _norm_key(dfe["empresa"]), "_obr": _norm_key(dfe["obrigacao"]),
+                        "mes": venc.dt.to_period("M").array.asi8})
+    ent = ent[venc.notna().to_numpy()].merge(cal[["_emp","_obr","passo","fase"]].drop_duplicates(["_emp","_obr"]), on=["_emp","_obr"])
+    existentes = pd.MultiIndex.from_arrays([ent["_emp"], ent["_obr"], (ent["mes"] - ent["fase"]) // ent["passo"]])
+    esperadas = pd.MultiIndex.from_arrays([cal["_emp"], cal["_obr"], (cal["mes"] - cal["fase"]) // cal["passo"]])
+    faltantes = cal[~esperadas.isin(existentes)]
+    return faltantes.drop(columns=["_emp","_obr","mes","passo","fase"]).reset_index(drop=True)
+
+# ============== Carga de trabalho (sweep) ==============
+def workload_intervals(dfe: pd.DataFrame = None, dfp: pd.DataFrame = None, hoje=None) -> pd.DataFrame:
+    # intervalos de ocupação: processos [inicio, conclusão|hoje] e entregas [competência|vencimento, entrega|hoje]
+    hoje = pd.Timestamp(hoje if hoje is not None else pd.Timestamp.today().normalize())
+    partes = []
+    if isinstance(dfp, pd.DataFrame) and {"inicio","responsavel"}.issubset(dfp.columns):
+        fim = dfp["conclusao"] if "conclusao" in dfp.columns else pd.Series(pd.NaT, index=dfp.index)
+        partes.append(pd.DataFrame({
+            "responsavel": dfp["responsavel"],
+            "departamento": dfp.get("departamento"),
+            "inicio": dfp["inicio"],
+            "fim": fim.fillna(hoje),
+            "origem": "Processos",
+        }))
+    if isinstance(dfe, pd.DataFrame) and {"data_vencimento","responsavel_entrega"}.issubset(dfe.columns):
+        ini = dfe["competencia"].fillna(dfe["data_vencimento"]) if "competencia" in dfe.columns else dfe["data_vencimento"]
+        fim = dfe["data_entrega"] if "data_entrega" in dfe.columns else pd.Series(pd.NaT, index=dfe.index)
+        pend = dfe.get("status","").str.lower() != "concluída"
+        partes.append(pd.DataFrame({
+            "responsavel": dfe["responsavel_entrega"],
+            "departamento": dfe.get("departamento"),
+            "inicio": ini,
+            "fim": fim.where(fim.notna() | ~pend, hoje),
+            "origem": "Entregas",
+        }))
+    if not partes:
+        return pd.DataFrame(columns=["responsavel","departamento","inicio","fim","origem"])
+    out = pd.concat(partes, ignore_index=True)
+    return out[out["inicio"].notna() & out["fim"].notna() & (out["fim"] >= out["inicio"])].reset_index(drop=True)
+
+def workload_curves(intervals: pd.DataFrame, by: str, inicio=None, fim=None) -> pd.DataFrame:
+    # carga simultânea diária por grupo: +1 no início, -1 no dia seguinte ao fim, cumsum no eixo dos dias
+    iv = intervals[intervals[by].notna()]
+    if iv.empty:
+        return pd.DataFrame()
+    d_ini = iv["inicio"].to_numpy(dtype="datetime64[D]")
+    d_fim = iv["fim"].to_numpy(dtype="datetime64[D]")
+    d0 = np.datetime64(pd.Timestamp(inicio), "D") if inicio is not None else d_ini.min()
+    d1 = np.datetime64(pd.Timestamp(fim), "D") if fim is not None else d_fim.max()
+    n_dias = int((d1 - d0).astype(int)) + 1
+    if n_dias <= 0:
+        return pd.DataFrame()
+    codes, grupos = pd.factorize(iv[by], sort=True)
+    # intervalos que começam antes da janela entram no dia 0; os que terminam depois não saem
+    s = np.clip((d_ini - d0).astype(int), 0, n_dias)
+    e = np.clip((d_fim - d0).astype(int) + 1, 0, n_dias)
+    ok = s < e
+    ev = np.zeros((len(grupos), n_dias + 1), dtype=np.int32)
+    np.add.at(ev, (codes[ok], s[ok]), 1)
+    np.add.at(ev, (codes[ok], e[ok]), -1)
+    carga = np.cumsum(ev[:, :n_dias], axis=1)
+    return pd.DataFrame(carga.T, index=pd.date_range(pd.Timestamp(d0), periods=n_dias, freq="D"), columns=grupos)
+
+def overloaded(curves: pd.DataFrame, capacidade: int) -> pd.DataFrame:
+    if curves.empty:
+        return pd.DataFrame(columns=["grupo","pico","media","dias_acima"])
+    v = curves.to_numpy()
+    out = pd.DataFrame({
+        "grupo": curves.columns,
+        "pico": v.max(axis=0),
+        "media": v.mean(axis=0).round(1),
+        "dias_acima": (v > capacidade).sum(axis=0),
+    })
+    return out[out["dias_acima"] > 0].sort_values(["dias_acima","pico"], ascending=False).reset_index(drop=True)
+
+# ============== Calendário de prazos (contagens diárias) ==============
+METRICAS_PRAZO = ["vencem", "entregues", "atrasadas", "pendentes"]
+
+def deadline_counts(dfe: pd.DataFrame, hoje, por: str = None, inicio=None, fim=None) -> dict:
+    # {métrica: DataFrame (valores de `por` × dias)}. Cada linha vira um offset inteiro de dia e um
+    # código de categoria; as contagens saem de np.bincount sobre código * n_dias + dia.
+    if not isinstance(dfe, pd.DataFrame) or "data_vencimento" not in dfe.columns:
+        return {}
+    hoje = _as_days(hoje)
+    venc = _as_days(dfe["data_vencimento"])
+    entrega = _as_days(dfe["data_entrega"]) if "data_entrega" in dfe.columns else np.full(len(dfe), np.datetime64("NaT"), "datetime64[D]")
+    if not (~np.isnat(venc)).any():
+        return {}
+    ini = _as_days(inicio)[()] if inicio is not None else venc[~np.isnat(venc)].min()
+    fim = _as_days(fim)[()] if fim is not None else venc[~np.isnat(venc)].max()
+    n = int((fim - ini).astype(int)) + 1
+    if n <= 0:
+        return {}
+    if por and por in dfe.columns:
+        codes, nomes = pd.factorize(dfe[por].astype("string").fillna(f"(sem {por})"), sort=True)
+    else:
+        codes, nomes = np.zeros(len(dfe), dtype=np.int64), pd.Index(["Total"])
+    k = len(nomes)
+    concluida = (dfe["status"].astype("string").str.lower() == "concluída").fillna(False).to_numpy(dtype=bool) \
+        if "status" in dfe.columns else np.zeros(len(dfe), dtype=bool)
+    atrasada = np.where(concluida, ~np.isnat(entrega) & (entrega > venc), hoje > venc)
+
+    def contar(dias, filtro):
+        off = (dias - ini).astype("timedelta64[D]").astype(np.int64)
+        ok = ~np.isnat(dias) & (off >= 0) & (off < n) & filtro
+        return np.bincount(codes[ok] * n + off[ok], minlength=k * n).astype(np.int32).reshape(k, n)
+
+    tudo = np.ones(len(dfe), dtype=bool)
+    dias = pd.date_range(pd.Timestamp(ini), periods=n, freq="D")
+    matrizes = {
+        "vencem": contar(venc, tudo),
+        "entregues": contar(entrega, concluida),
+        "atrasadas": contar(venc, atrasada),
+        "pendentes": contar(venc, ~concluida),
+    }
+    return {m: pd.DataFrame(v, index=pd.Index(nomes, name=por or "total"), columns=dias) for m, v in matrizes.items()}
+
+def calendar_grid(diario: pd.Series) -> pd.DataFrame:
+    # série diária -> grade dia da semana × semana (estilo calendário), por índice inteiro
+    dias = pd.DatetimeIndex(diario.index)
+    desloc = dias[0].weekday()
+    pos = np.arange(len(dias)) + desloc
+    semanas = pos[-1] // 7 + 1
+    grade = np.full((7, semanas), np.nan)
+    grade[pos % 7, pos // 7] = diario.to_numpy(dtype=float)
+    inicio_semanas = pd.date_range(dias[0] - pd.Timedelta(days=desloc), periods=semanas, freq="7D")
+    return pd.DataFrame(grade, index=["seg", "ter", "qua", "qui", "sex", "sáb", "dom"], columns=inicio_semanas)
+
+def crunch_days(contagens: pd.DataFrame, k: int = 20) -> pd.DataFrame:
+    # os k maiores (valor de `por`, dia) da matriz, via top_k sobre a matriz achatada
+    if contagens.empty:
+        return pd.DataFrame(columns=[contagens.index.name, "dia", "itens"])
+    plano = contagens.to_numpy().ravel()
+    pos = top_k(plano, k)
+    pos = pos[plano[pos] > 0]
+    linhas, cols = np.divmod(pos, contagens.shape[1])
+    return pd.DataFrame({contagens.index.name: contagens.index[linhas], "dia": contagens.columns[cols], "itens": plano[pos]})
+
+# ============== Resolução de empresas ==============
+_SUFIXOS_EMPRESA = {"ltda", "me", "epp", "eireli", "sa", "s/a", "ss", "mei", "cia", "matriz", "filial"}
+
+def normalize_company_name(nome) -> str:
+    if not isinstance(nome, str):
+        return ""
+    s = unicodedata.normalize("NFKD", nome).encode("ascii", "ignore").decode("ascii").lower()
+    s = s.replace("s/a", " sa ")
+    s = re.sub(r"[^a-z0-9]+", " ", s)
+    return " ".join(t for t in s.split() if t not in _SUFIXOS_EMPRESA)
+
+def _cnpj_raiz(s: pd.Series) -> pd.Series:
+    # raiz (8 primeiros dígitos) agrupa matriz e filiais
+    dig = s.astype("string").str.replace(r"\D", "", regex=True)
+    # descarta CNPJs de preenchimento (00.000.000/..., 11.111.111/...)
+    # (sem retrorreferência no regex: o motor do pyarrow, usado nas colunas string, não aceita)
+    raiz = dig.str[:8]
+    repetido = (raiz == raiz.str[0].str.repeat(8)).fillna(False).astype(bool)
+    valido = (dig.str.len() == 14).fillna(False).astype(bool) & ~repetido
+    return raiz.where(valido)
+
+def _trigramas(norm: pd.Series, corte: pd.Series) -> pd.DataFrame:
+    # (linha, trigrama) únicos de " nome "; o laço é sobre as posições, não sobre os nomes.
+    # corte: trigramas que começam antes dele são os do primeiro token (iguais em todo o bloco)
+    s = " " + norm + " "
+    tam = s.str.len().to_numpy()
+    partes = []
+    for k in range(int(tam.max()) - 2):
+        linhas = np.flatnonzero(tam >= k + 3)
+        partes.append(pd.DataFrame({"i": linhas, "tri": s.iloc[linhas].str[k:k + 3].to_numpy(),
+                                    "bloco": k < corte.to_numpy()[linhas]}))
+    tri = pd.concat(partes, ignore_index=True)
+    # um trigrama do primeiro token que se repete adiante conta uma vez só, como do bloco
+    return tri.sort_values("bloco", ascending=False).drop_duplicates(["i", "tri"])
+
+def _pares_similares(u: pd.DataFrame, bloco: pd.Series, limiar: float) -> pd.DataFrame:
+    # Dice dos trigramas, só entre nomes do mesmo bloco (primeiro token + números do nome):
+    # os trigramas do primeiro token são comuns ao bloco todo, então entram na conta sem passar pelo join
+    ok = bloco.notna().to_numpy() & (u["_norm"] != "").to_numpy()
+    sub = u[ok]
+    if sub.empty:
+        return pd.DataFrame(columns=["i", "j", "peso"])
+    tri = _trigramas(sub["_norm"].reset_index(drop=True), sub["_norm"].str.split().str[0].str.len().reset_index(drop=True))
+    tri["i"] = sub.index.to_numpy()[tri["i"].to_numpy(dtype=int)]
+    total = tri.groupby("i").size()
+    comuns = tri[tri["bloco"]].groupby("i").size()
+    resto = tri.loc[~tri["bloco"], ["i", "tri"]].assign(b=lambda d: bloco.to_numpy()[d["i"].to_numpy()])
+    pares = resto.merge(resto, on=["b", "tri"], suffixes=("", "_j"))
+    pares = pares[pares["i"] < pares["i_j"]].groupby(["i", "i_j"]).size().rename("inter").reset_index()
+    if pares.empty:
+        return pd.DataFrame(columns=["i", "j", "peso"])
+    i, j = pares["i"].to_numpy(), pares["i_j"].to_numpy()
+    inter = pares["inter"].to_numpy() + comuns.reindex(i, fill_value=0).to_numpy()
+    dice = 2 * inter / (total.reindex(i).to_numpy() + total.reindex(j).to_numpy())
+    return pd.DataFrame({"i": i, "j": j, "peso": dice})[dice >= limiar]
+
+def _arestas_iguais(chave: pd.Series, peso: float) -> pd.DataFrame:
+    # liga cada nome ao primeiro com a mesma chave (estrela por grupo)
+    ok = chave.notna() & (chave != "")
+    linhas = pd.Series(chave.index[ok], index=chave.index[ok])
+    primeiro = linhas.groupby(chave[ok]).transform("first")
+    d = pd.DataFrame({"i": primeiro.to_numpy(dtype=int), "j": primeiro.index.to_numpy(), "peso": peso})
+    return d[d["i"] != d["j"]]
+
+def _componentes(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # rótulo (menor índice) da componente de cada nó: propagação de rótulos + salto de ponteiros, vetorizados
+    rot = np.arange(n)
+    while True:
+        m = np.minimum(rot[a], rot[b])
+        novo = rot.copy()
+        np.minimum.at(novo, a, m)
+        np.minimum.at(novo, b, m)
+        novo = novo[novo]
+        if np.array_equal(novo, rot):
+            return rot
+        rot = novo
+
+def _anagrama(norm: str) -> str:
+    # letras de cada token em ordem, sem o "s" do plural: pega trocas de letras ("comerico" x "comercio")
+    # e singular/plural ("transporte" x "transportes")
+    return " ".join("".join(sorted(t[:-1] if len(t) > 3 and t.endswith("s") else t)) for t in norm.split())
+
+def resolve_companies(nomes: pd.DataFrame, limiar: float = 0.85) -> pd.DataFrame:
+    # nomes: valores únicos [empresa, cnpj, n]; devolve [empresa, empresa_id, empresa_canonica]
+    u = nomes.copy()
+    u["_norm"] = u["empresa"].map(normalize_company_name)
+    u["_raiz"] = _cnpj_raiz(u["cnpj"]) if "cnpj" in u.columns else pd.NA
+    # um CNPJ por nome: o mais frequente
+    raiz_nome = (u.dropna(subset=["_raiz"]).sort_values("n", ascending=False)
+                  .drop_duplicates("empresa").set_index("empresa")["_raiz"])
+    u = u.drop_duplicates("empresa").reset_index(drop=True)
+    u["_raiz"] = u["empresa"].map(raiz_nome)
+    u["n"] = nomes.groupby("empresa")["n"].sum().reindex(u["empresa"]).to_numpy()
+
+    # ligações entre nomes: mesmo nome normalizado, mesmas letras por token, trigramas parecidos.
+    # Só dentro do bloco (primeiro token + números: "Posto Sol 1" e "Posto Sol 2" são empresas diferentes)
+    numeros = u["_norm"].str.findall(r"\b\d+\b").map(lambda t: " ".join(sorted(str(int(x)) for x in t)))
+    bloco = (u["_norm"].str.split().str[0] + "|" + numeros).where(u["_norm"] != "")
+    arestas = pd.concat([_arestas_iguais(u["_norm"], 3.0),
+                         _arestas_iguais((u["_norm"].map(_anagrama) + "|" + numeros).where(u["_norm"] != ""), 2.0),
+                         _pares_similares(u, bloco, limiar)], ignore_index=True)
+    a, b = arestas["i"].to_numpy(dtype=int), arestas["j"].to_numpy(dtype=int)
+
+    # grupos com CNPJ: a raiz. Um nome sem CNPJ entra no grupo da sua ligação mais forte com um nome que já
+    # tem raiz, em ondas (cada onda vetorizada); dois CNPJs diferentes nunca se juntam. Os que sobram formam
+    # componentes só entre si
+    raiz = u["_raiz"].to_numpy(dtype=object).copy()
+    tem = u["_raiz"].notna().to_numpy().copy()
+    while True:
+        novo = np.concatenate([np.flatnonzero(tem[a] & ~tem[b]), np.flatnonzero(~tem[a] & tem[b])])
+        if not len(novo):
+            break
+        de = np.where(tem[a[novo]], a[novo], b[novo])
+        para = np.where(tem[a[novo]], b[novo], a[novo])
+        melhor = (pd.DataFrame({"para": para, "raiz": raiz[de], "peso": arestas["peso"].to_numpy()[novo]})
+                  .sort_values("peso", ascending=False, kind="stable").drop_duplicates("para"))
+        raiz[melhor["para"].to_numpy()] = melhor["raiz"].to_numpy()
+        tem[melhor["para"].to_numpy()] = True
+    livres = ~tem[a] & ~tem[b]
+    comp = _componentes(len(u), a[livres], b[livres])
+    grupo = ("r" + pd.Series(raiz, dtype="string")).where(tem, "c" + pd.Series(comp).astype("string"))
+
+    u["empresa_id"] = pd.factorize(grupo)[0]
+    # nome canônico: o mais frequente do grupo, preferindo quem tem CNPJ
+    canon = (u.assign(_tem=u["_raiz"].notna()).sort_values(["_tem","n"], ascending=False)
+              .drop_duplicates("empresa_id").set_index("empresa_id")["empresa"])
+    u["empresa_canonica"] = u["empresa_id"].map(canon)
+    return u[["empresa","empresa_id","empresa_canonica"]]
+
+def company_names(frames) -> pd.DataFrame:
+    # tabela de nomes únicos (empresa, cnpj, contagem) de todos os datasets
+    partes = []
+    for df in frames:
+        if isinstance(df, pd.DataFrame) and "empresa" in df.columns:
+            cols = ["empresa","cnpj"] if "cnpj" in df.columns else ["empresa"]
+            partes.append(df[cols].astype("string").value_counts(dropna=False).rename("n").reset_index())
+    if not partes:
+        return pd.DataFrame(columns=["empresa","cnpj","n"])
+    out = pd.concat(partes, ignore_index=True)
+    if "cnpj" not in out.columns:
+        out["cnpj"] = pd.NA
+    out = out[out["empresa"].notna()]
+    return out.groupby(["empresa","cnpj"], dropna=False, as_index=False)["n"].sum()
+
+def resolve_client_companies(nomes: pd.DataFrame, cliente: str, pasta: str = None) -> pd.DataFrame:
+    # unificação guardada por cliente (CSV com [empresa, cnpj, n, empresa_id, empresa_canonica]): se todos os nomes
+    # já foram vistos, nada é recalculado; com nomes novos o casamento roda junto com os guardados (os novos entram
+    # nos grupos existentes) e os ids já atribuídos não mudam
+    caminho = _arquivo_cliente(pasta or EMPRESAS_PASTA, cliente, ".csv")
+    try:
+        salvo = pd.read_csv(caminho, dtype={"empresa": "string", "cnpj": "string", "empresa_canonica": "string"},
+                            keep_default_na=False, na_values=[""])
+    except (OSError, ValueError):
+        salvo = pd.DataFrame(columns=["empresa", "cnpj", "n", "empresa_id", "empresa_canonica"])
+    if len(salvo) and nomes["empresa"].isin(salvo["empresa"]).all():
+        return salvo[["empresa", "empresa_id", "empresa_canonica"]].drop_duplicates("empresa")
+    todos = pd.concat([salvo[["empresa", "cnpj", "n"]], nomes.loc[~nomes["empresa"].isin(salvo["empresa"]), ["empresa", "cnpj", "n"]]],
+                      ignore_index=True)
+    r = resolve_companies(todos)
+    # nomes guardados mantêm o id; um nome novo herda o menor id guardado do seu grupo, ou ganha um id novo
+    guardados = salvo.drop_duplicates("empresa").set_index("empresa")
+    velho = r["empresa"].map(guardados["empresa_id"])
+    do_grupo = velho.groupby(r["empresa_id"]).transform("min")
+    livres = do_grupo.isna()
+    base = int(salvo["empresa_id"].max()) + 1 if len(salvo) else 0
+    novos = pd.Series(pd.factorize(r.loc[livres, "empresa_id"])[0] + base, index=r.index[livres])
+    r["empresa_id"] = velho.fillna(do_grupo).fillna(novos).astype(int)
+    canon = salvo.drop_duplicates("empresa_id").set_index("empresa_id")["empresa_canonica"]
+    r["empresa_canonica"] = r["empresa_id"].map(canon).fillna(r["empresa_canonica"])
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    tmp = caminho + ".tmp"
+    todos.merge(r, on="empresa").to_csv(tmp, index=False)
+    os.replace(tmp, caminho)
+    return r
+
+def apply_company_ids(df: pd.DataFrame, resolvidos: pd.DataFrame) -> pd.DataFrame:
+    # difunde o id/nome canônico para todas as linhas (lookup por códigos de categoria)
+    if not isinstance(df, pd.DataFrame) or "empresa" not in df.columns:
+        return df
+    df = df.copy()
+    orig = df["empresa_original"] if "empresa_original" in df.columns else df["empresa"]
+    df["empresa_original"] = orig
+    df["empresa_id"] = pd.to_numeric(lookup(orig, resolvidos["empresa"], resolvidos["empresa_id"], normalizar=False), errors="coerce").astype("Int64")
+    df["empresa"] = lookup(orig, resolvidos["empresa"], resolvidos["empresa_canonica"], normalizar=False).fillna(orig)
+    return df
+
+# ============== Filtros ==============
+# Um filtro é None/[] (todos), uma lista (só esses valores) ou {"excluir": [...]} (todos menos esses);
+# com "todos" implícito, o widget nunca precisa carregar a lista inteira de valores.
+def _sem_acento(s: str) -> str:
+    return unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii").lower()
+
+def filters_mask(df: pd.DataFrame, filtros: dict) -> np.ndarray:
+    # {coluna: filtro} -> máscara booleana; colunas ausentes são ignoradas
+    sel = np.ones(len(df), dtype=bool)
+    for col, filtro in filtros.items():
+        if not filtro or col not in df.columns:
+            continue
+        incluir, excluir = (filtro.get("incluir"), filtro.get("excluir")) if isinstance(filtro, dict) else (filtro, None)
+        if incluir:
+            sel &= df[col].isin(incluir).to_numpy()
+        if excluir:
+            sel &= ~df[col].isin(excluir).to_numpy()
+    return sel
+
+class ValueIndex:
+    # valores distintos ordenados pela forma normalizada (sem acento, minúsculas): a busca por
+    # prefixo é uma fatia via searchsorted; se vier pouco, completa com quem contém o termo.
+    # Essa varredura é linear, então anda em blocos, para ao completar o limite e olha no máximo `varredura` chaves
+    BLOCO = 20_000
+
+    def __init__(self, s: pd.Series):
+        valores = pd.unique(s.dropna().astype(str))
+        chaves = np.array([_sem_acento(v) for v in valores], dtype=str)
+        ordem = np.argsort(chaves, kind="stable")
+        self.chaves = chaves[ordem]
+        self.valores = np.asarray(valores, dtype=object)[ordem]
+
+    def __len__(self):
+        return len(self.valores)
+
+    def buscar(self, termo: str = "", limite: int = 50, varredura: int = 200_000) -> list:
+        t = _sem_acento(termo or "").strip()
+        if not t:
+            return self.valores[:limite].tolist()
+        lo = int(np.searchsorted(self.chaves, t, side="left"))
+        hi = int(np.searchsorted(self.chaves, t + "\uffff", side="left"))
+        achados = list(range(lo, min(hi, lo + limite)))
+        for ini in range(0, min(len(self.chaves), varredura), self.BLOCO):
+            if len(achados) >= limite:
+                break
+            bloco = self.chaves[ini:min(ini + self.BLOCO, varredura)]
+            contem = ini + np.flatnonzero(np.char.find(bloco, t) > 0)
+            achados += contem[:limite - len(achados)].tolist()
+        return self.valores[achados].tolist()
+
+# ============== Resumo Analítico ==============
+PARAMETROS_PADRAO = {
+    "dias_em_risco": 2,
+    "considerar_ultimos": 30,
+    "sla_alerta": 14,
+    "sem_update_alerta": 3,
+    "proc_dias_alerta": 30,
+}
+
+def _marcar_entregas(dfe: pd.DataFrame, hoje, dias_em_risco, feriados=None) -> pd.DataFrame:
+    # recomputa flags com parâmetros (in place)
+    dfe["em_risco"] = flag_em_risco(dfe, hoje, dias_em_risco, feriados)
+    dfe["atrasada_pendente"] = np.where(
+        (dfe.get("status","").str.lower()!="concluída") & dfe.get("data_vencimento").notna() & (hoje > dfe.get("data_vencimento")),
+        True, False
+    )
+    dfe["atrasada_concluida"] = np.where(
+        (dfe.get("status","").str.lower()=="concluída") & dfe.get("data_entrega").notna() & (dfe.get("data_entrega") > dfe.get("data_vencimento")),
+        True, False
+    )
+    return dfe
+
+def _marcar_solicitacoes(dfs: pd.DataFrame, hoje, sla_alerta, sem_update_alerta, feriados=None) -> tuple:
+    # máscaras (abertas há muito tempo, prioridade alta sem atualização)
+    long_open = np.zeros(len(dfs), dtype=bool)
+    sem_upd = np.zeros(len(dfs), dtype=bool)
+    if {"conclusao","abertura"}.issubset(dfs.columns):
+        aberta = dfs["aberta_ha_dias"] if "aberta_ha_dias" in dfs.columns else pd.Series(
+            np.where(dfs["conclusao"].isna() & dfs["abertura"].notna(), diff_days(dfs["abertura"], hoje, feriados), np.nan), index=dfs.index)
+        long_open = ((dfs["conclusao"].isna()) & (aberta >= sla_alerta)).to_numpy()
+    if {"prioridade","ultima_atualizacao","conclusao"}.issubset(dfs.columns):
+        sem_upd = ((dfs["conclusao"].isna()) & (dfs["prioridade"].str.contains("alta", case=False, na=False)) & (diff_days(dfs["ultima_atualizacao"], hoje, feriados) >= sem_update_alerta)).to_numpy()
+    return long_open, sem_upd
+
+def _marcar_processos(dfp: pd.DataFrame, hoje, proc_dias_alerta, feriados=None) -> np.ndarray:
+    # duracao_dias (in place) + máscara dos críticos
+    dfp["duracao_dias"] = diff_days(dfp["inicio"], dfp["conclusao"].fillna(hoje), feriados)
+    return ((dfp.get("status","").str.lower()!="concluída") & (dfp["duracao_dias"] >= proc_dias_alerta)).to_numpy()
+
+def resumo_entregas(dfe_full: pd.DataFrame, hoje, dias_em_risco=2, considerar_ultimos=30,
+                    empresas=None, departamentos=None, responsaveis=None, periodo=None, idx=None, feriados=None) -> dict:
+    if not isinstance(dfe_full, pd.DataFrame) or "data_vencimento" not in dfe_full.columns:
+        return None
+    hoje = pd.to_datetime(hoje)
+    idx = idx if idx is not None else build_date_indexes(dfe_full, ["data_vencimento"])
+    # aplica filtros (máscara sobre o dataset completo, alinhada ao índice de datas)
+    sel = filters_mask(dfe_full, {"empresa": empresas, "departamento": departamentos, "responsavel_entrega": responsaveis})
+    sel &= period_mask(idx.get("data_vencimento"), len(dfe_full), periodo)
+    dfe = _marcar_entregas(dfe_full[sel].copy(), hoje, dias_em_risco, feriados)
+    total = len(dfe)
+    concluidas = int((dfe.get("status","").str.lower()=="concluída").sum())
+    # ranking últimos N dias
+    cutoff = hoje - pd.Timedelta(days=considerar_ultimos)
+    recent = dfe.loc[window_rows(dfe_full, idx, "data_vencimento", start=cutoff, sel=sel).index]
+    rank_emp = pd.DataFrame(columns=["empresa","atrasos"])
+    if not recent.empty:
+        late_recent = recent[(recent["atrasada_concluida"]) | (recent["atrasada_pendente"])]
+        if not late_recent.empty and "empresa" in late_recent.columns:
+            rank_emp = late_recent.groupby("empresa").size().reset_index(name="atrasos").sort_values("atrasos", ascending=False).head(5)
+    return {
+        "total": total,
+        "concluidas": concluidas,
+        "pendentes": total - concluidas,
+        "atrasadas": int((dfe["atrasada_concluida"] | dfe["atrasada_pendente"]).sum()),
+        "em_risco": int(dfe["em_risco"].sum()),
+        "alerta_por_obrigacao": "alerta_dias" in dfe.columns,
+        "top_atrasos": rank_emp.reset_index(drop=True),
+        "atrasadas_detalhe": dfe[dfe["atrasada_concluida"] | dfe["atrasada_pendente"]],
+    }
+
+def resumo_solicitacoes(dfs: pd.DataFrame, hoje, sla_alerta=14, sem_update_alerta=3,
+                        empresas=None, responsaveis=None, feriados=None) -> dict:
+    if not isinstance(dfs, pd.DataFrame):
+        return None
+    hoje = pd.to_datetime(hoje)
+    dfs = dfs[filters_mask(dfs, {"empresa": empresas, "responsavel": responsaveis})]
+    m_long, m_upd = _marcar_solicitacoes(dfs, hoje, sla_alerta, sem_update_alerta, feriados)
+    long_open, sem_upd = dfs[m_long], dfs[m_upd]
+    return {
+        "total": len(dfs),
+        "abertas": int(dfs.get("conclusao").isna().sum()) if "conclusao" in dfs.columns else 0,
+        "abertas_longas": len(long_open),
+        "alta_sem_atualizacao": len(sem_upd),
+        "criticas": pd.concat([long_open.assign(_flag=f"ABERTA ≥{sla_alerta} dias"),
+                               sem_upd.assign(_flag=f"PRIORIDADE ALTA sem atualização ≥{sem_update_alerta} dias")], ignore_index=True),
+    }
+
+def resumo_processos(dfp: pd.DataFrame, hoje, proc_dias_alerta=30,
+                     empresas=None, departamentos=None, responsaveis=None, feriados=None) -> dict:
+    if not isinstance(dfp, pd.DataFrame) or not {"inicio","conclusao","status"}.issubset(dfp.columns):
+        return None
+    hoje = pd.to_datetime(hoje)
+    dfp = dfp[filters_mask(dfp, {"empresa": empresas, "departamento": departamentos, "responsavel": responsaveis})].copy()
+    crit = dfp[_marcar_processos(dfp, hoje, proc_dias_alerta, feriados)]
+    return {
+        "total": len(dfp),
+        "criticos_qtd": len(crit),
+        "criticos": crit.sort_values("duracao_dias", ascending=False),
+    }
+
+class LRU:
+    def __init__(self, capacidade: int):
+        self.capacidade = capacidade
+        self.itens = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, chave):
+        with self.lock:
+            if chave not in self.itens:
+                return None
+            self.itens.move_to_end(chave)
+            return self.itens[chave]
+
+    def put(self, chave, valor):
+        with self.lock:
+            self.itens[chave] = valor
+            self.itens.move_to_end(chave)
+            while len(self.itens) > self.capacidade:
+                self.itens.popitem(last=False)
+
+# ----- filtro com busca (widget dos apps) -----
+# Os dois apps usam estes; o streamlit só é importado quando o widget é desenhado.
+_INDICES_VALORES = LRU(64)
+MODOS_FILTRO = {"Todos": None, "Só estes": "incluir", "Todos exceto": "excluir"}
+
+def indice_valores(df: pd.DataFrame, versao, coluna: str):
+    # um índice ordenado por versão dos dados (não por sessão), compartilhado pelo processo
+    if coluna not in df.columns:
+        return None
+    indice = _INDICES_VALORES.get((versao, coluna))
+    if indice is None:
+        indice = ValueIndex(df[coluna])
+        _INDICES_VALORES.put((versao, coluna), indice)
+    return indice
+
+def filtro_busca(rotulo: str, indice, key: str):
+    # "todos" é implícito: o widget só recebe o resultado da busca + o que já foi escolhido,
+    # então o payload não cresce com o número de empresas
+    import streamlit as st
+    modo = st.radio(rotulo, list(MODOS_FILTRO), horizontal=True, key=f"{key}_modo")
+    if MODOS_FILTRO[modo] is None or not indice:
+        return None
+    escolhidos = st.session_state.get(f"{key}_valores", [])
+    termo = st.text_input(f"Buscar {rotulo.lower()}", key=f"{key}_busca",
+                          placeholder=f"digite para buscar entre {len(indice):,} valores".replace(",", "."))
+    opcoes = escolhidos + [v for v in indice.buscar(termo, 50) if v not in escolhidos]
+    valores = st.multiselect(f"{rotulo} — {modo.lower()}", opcoes, key=f"{key}_valores")
+    if not valores:
+        return None
+    return valores if MODOS_FILTRO[modo] == "incluir" else {"excluir": valores}
+
+def dataset_fingerprint(df: pd.DataFrame) -> str:
+    # hash do conteúdo (valores + nomes de coluna); usado quando quem chama não tem uma versão pronta
+    h = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    h.update(repr(list(df.columns)).encode("utf-8"))
+    return h.hexdigest()
+
+def resumo_analitico(dfe=None, dfs=None, dfp=None, hoje=None, params=None, filtros=None, idx=None, feriados=None,
+                     memo: LRU = None, versoes: dict = None) -> dict:
+    # números do "Resumo Analítico" da aba Relatórios, como dados.
+    # Com `memo`, cada seção é guardada sob (versão do seu dataset, data, calendário, seus limites, seus filtros):
+    # revisitar uma combinação não recalcula nada, e mudar um dataset só invalida a seção dele.
+    # `versoes` ({"dfe": ..., "dfs": ..., "dfp": ...}) evita o hash do conteúdo quando a versão já é conhecida.
+    p = {**PARAMETROS_PADRAO, **(params or {})}
+    f = filtros or {}
+    hoje = pd.to_datetime(hoje if hoje is not None else pd.Timestamp.today().normalize())
+    secoes = {
+        "entregas": ("dfe", dfe, ["dias_em_risco", "considerar_ultimos"], ["empresas", "departamentos", "responsaveis", "periodo"],
+                     lambda: resumo_entregas(dfe, hoje, p["dias_em_risco"], p["considerar_ultimos"], f.get("empresas"),
+                                             f.get("departamentos"), f.get("responsaveis"), f.get("periodo"), idx, feriados)),
+        "solicitacoes": ("dfs", dfs, ["sla_alerta", "sem_update_alerta"], ["empresas", "responsaveis"],
+                         lambda: resumo_solicitacoes(dfs, hoje, p["sla_alerta"], p["sem_update_alerta"],
+                                                     f.get("empresas"), f.get("responsaveis"), feriados)),
+        "processos": ("dfp", dfp, ["proc_dias_alerta"], ["empresas", "departamentos", "responsaveis"],
+                      lambda: resumo_processos(dfp, hoje, p["proc_dias_alerta"], f.get("empresas"),
+                                               f.get("departamentos"), f.get("responsaveis"), feriados)),
+    }
+    calendario = None if feriados is None else hashlib.sha1(np.asarray(feriados).tobytes()).hexdigest()
+    out = {"hoje": hoje, "parametros": p}
+    for nome, (ds, df, limites, chaves_filtro, calcular) in secoes.items():
+        if memo is None or not isinstance(df, pd.DataFrame):
+            out[nome] = calcular()
+            continue
+        versao = (versoes or {}).get(ds) or dataset_fingerprint(df)
+        chave = (nome, versao, hoje, calendario, tuple(p[k] for k in limites), repr([f.get(k) for k in chaves_filtro]))
+        out[nome] = memo.get(chave)
+        if out[nome] is None:
+            out[nome] = calcular()
+            memo.put(chave, out[nome])
+    out["dias_uteis"] = feriados is not None
+    return out
+
+def resumo_markdown(res: dict) -> str:
+    p = res["parametros"]
+    linhas = []
+    e = res.get("entregas")
+    if e:
+        dias_em_risco, considerar_ultimos = p["dias_em_risco"], p["considerar_ultimos"]
+        linhas += [
+            f"### Entregas",
+            f"- Total: **{e['total']}** | Concluídas: **{e['concluidas']}** | Pendentes: **{e['pendentes']}**",
+            f"- Atrasadas (inclui pendentes vencidas): **{e['atrasadas']}**",
+            f"- Em risco (vencem dentro do alerta da obrigação; padrão ≤ {dias_em_risco} dias): **{e['em_risco']}**" if e["alerta_por_obrigacao"] else f"- Em risco (vencem em ≤ {dias_em_risco} dias): **{e['em_risco']}**",
+        ]
+        rank = e["top_atrasos"]
+        if not rank.empty:
+            top_lines = "\n".join("  - " + rank["empresa"].astype(str) + ": " + rank["atrasos"].astype(int).astype(str) + " atrasos")
+            linhas += [f"- TOP atrasos (últimos {considerar_ultimos} dias):\n{top_lines}"]
+    s = res.get("solicitacoes")
+    if s:
+        linhas += [
+            f"### Solicitações",
+            f"- Total: **{s['total']}** | Abertas: **{s['abertas']}**",
+            f"- Críticas: Abertas ≥ {p['sla_alerta']} dias: **{s['abertas_longas']}** | Alta sem atualização ≥ {p['sem_update_alerta']} dias: **{s['alta_sem_atualizacao']}**",
+        ]
+    pr = res.get("processos")
+    if pr:
+        linhas += [
+            f"### Processos",
+            f"- Total: **{pr['total']}**",
+            f"- Em andamento ≥ {p['proc_dias_alerta']} dias: **{pr['criticos_qtd']}**",
+        ]
+    if not linhas:
+        return ""
+    unidade = " · prazos em dias úteis" if res.get("dias_uteis") else ""
+    return f"# Resumo Analítico\n\n_Data de referência: {res['hoje']:%d/%m/%Y}{unidade}_\n\n" + "\n".join(linhas)
+
+def resumo_json(res: dict, limite: int = 200) -> dict:
+    # versão serializável (datas ISO, tabelas como listas de registros)
+    def tabela(df):
+        df = df.head(limite).drop(columns=[c for c in df.columns if c.startswith("_") and c != "_flag"])
+        return df.astype(object).where(df.notna(), None).map(
+            lambda v: v.isoformat() if isinstance(v, (pd.Timestamp, np.datetime64)) else (v.item() if isinstance(v, np.generic) else v)
+        ).to_dict("records")
+    out = {"hoje": res["hoje"].date().isoformat(), "parametros": res["parametros"], "dias_uteis": res.get("dias_uteis", False)}
+    for sec in ["entregas","solicitacoes","processos"]:
+        d = res.get(sec)
+        out[sec] = None if d is None else {k: (tabela(v) if isinstance(v, pd.DataFrame) else v) for k, v in d.items()}
+    return out
+
+def _secao_vazia(hoje, p, feriados) -> dict:
+    return {"hoje": hoje, "parametros": p, "entregas": None, "solicitacoes": None, "processos": None,
+            "dias_uteis": feriados is not None}
+
+def resumo_por_empresa(dfe=None, dfs=None, dfp=None, hoje=None, params=None, filtros=None, idx=None, feriados=None) -> dict:
+    # {empresa: res} com a mesma estrutura de resumo_analitico, numa passada agrupada por dataset:
+    # as linhas são marcadas uma vez, os contadores saem de um groupby e os detalhes são fatiados
+    # pelos índices dos grupos (nada de um relatório completo por empresa). Linhas sem empresa ficam de fora.
+    p = {**PARAMETROS_PADRAO, **(params or {})}
+    f = filtros or {}
+    hoje = pd.to_datetime(hoje if hoje is not None else pd.Timestamp.today().normalize())
+    out = {}
+    def secao(emp):
+        if emp not in out:
+            out[emp] = _secao_vazia(hoje, p, feriados)
+        return out[emp]
+
+    if isinstance(dfe, pd.DataFrame) and {"data_vencimento","empresa"}.issubset(dfe.columns):
+        idx = idx if idx is not None else build_date_indexes(dfe, ["data_vencimento"])
+        sel = filters_mask(dfe, {"empresa": f.get("empresas"), "departamento": f.get("departamentos"),
+                                 "responsavel_entrega": f.get("responsaveis")})
+        sel &= period_mask(idx.get("data_vencimento"), len(dfe), f.get("periodo"))
+        recente = idx["data_vencimento"].mask(len(dfe), hoje - pd.Timedelta(days=p["considerar_ultimos"]))[sel]
+        d = _marcar_entregas(dfe[sel].copy(), hoje, p["dias_em_risco"], feriados)
+        atrasada = (d["atrasada_concluida"] | d["atrasada_pendente"]).to_numpy()
+        agg = pd.DataFrame({
+            "empresa": d["empresa"].to_numpy(),
+            "concluidas": (d.get("status","").str.lower()=="concluída").to_numpy(),
+            "atrasadas": atrasada,
+            "em_risco": d["em_risco"].to_numpy(dtype=bool),
+            "atrasos": atrasada & recente,
+        }).groupby("empresa", sort=True).agg(["size", "sum"])
+        detalhe = d[atrasada]
+        grupos = detalhe.groupby("empresa").indices
+        for emp, total, concl, atr, risco, rec in zip(agg.index, agg[("concluidas","size")].to_numpy(),
+                                                      agg[("concluidas","sum")].to_numpy(), agg[("atrasadas","sum")].to_numpy(),
+                                                      agg[("em_risco","sum")].to_numpy(), agg[("atrasos","sum")].to_numpy()):
+            secao(emp)["entregas"] = {
+                "total": int(total), "concluidas": int(concl), "pendentes": int(total - concl),
+                "atrasadas": int(atr), "em_risco": int(risco), "alerta_por_obrigacao": "alerta_dias" in d.columns,
+                "top_atrasos": pd.DataFrame({"empresa": [emp] if rec else [], "atrasos": [int(rec)] if rec else []}),
+                "atrasadas_detalhe": detalhe.iloc[grupos.get(emp, [])],
+            }
+
+    if isinstance(dfs, pd.DataFrame) and "empresa" in dfs.columns:
+        d = dfs[filters_mask(dfs, {"empresa": f.get("empresas"), "responsavel": f.get("responsaveis")})]
+        m_long, m_upd = _marcar_solicitacoes(d, hoje, p["sla_alerta"], p["sem_update_alerta"], feriados)
+        aberta = d["conclusao"].isna().to_numpy() if "conclusao" in d.columns else np.zeros(len(d), dtype=bool)
+        agg = pd.DataFrame({"empresa": d["empresa"].to_numpy(), "abertas": aberta, "longas": m_long, "sem_upd": m_upd}) \
+            .groupby("empresa", sort=True).agg(["size", "sum"])
+        criticas = pd.concat([d[m_long].assign(_flag=f"ABERTA ≥{p['sla_alerta']} dias"),
+                              d[m_upd].assign(_flag=f"PRIORIDADE ALTA sem atualização ≥{p['sem_update_alerta']} dias")], ignore_index=True)
+        grupos = criticas.groupby("empresa").indices
+        for emp, total, abertas, longas, upd in zip(agg.index, agg[("abertas","size")].to_numpy(), agg[("abertas","sum")].to_numpy(),
+                                                    agg[("longas","sum")].to_numpy(), agg[("sem_upd","sum")].to_numpy()):
+            secao(emp)["solicitacoes"] = {
+                "total": int(total), "abertas": int(abertas), "abertas_longas": int(longas), "alta_sem_atualizacao": int(upd),
+                "criticas": criticas.iloc[grupos.get(emp, [])],
+            }
+
+    if isinstance(dfp, pd.DataFrame) and {"inicio","conclusao","status","empresa"}.issubset(dfp.columns):
+        d = dfp[filters_mask(dfp, {"empresa": f.get("empresas"), "departamento": f.get("departamentos"),
+                                   "responsavel": f.get("responsaveis")})].copy()
+        crit = _marcar_processos(d, hoje, p["proc_dias_alerta"], feriados)
+        agg = pd.DataFrame({"empresa": d["empresa"].to_numpy(), "crit": crit}).groupby("empresa", sort=True).agg(["size", "sum"])
+        criticos = d[crit].sort_values("duracao_dias", ascending=False)
+        grupos = criticos.groupby("empresa").indices
+        for emp, total, n_crit in zip(agg.index, agg[("crit","size")].to_numpy(), agg[("crit","sum")].to_numpy()):
+            secao(emp)["processos"] = {"total": int(total), "criticos_qtd": int(n_crit), "criticos": criticos.iloc[grupos.get(emp, [])]}
+    return dict(sorted(out.items()))
+
+def _nome_arquivo(nome: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", unicodedata.normalize("NFKD", str(nome)).encode("ascii", "ignore").decode("ascii")).strip("_") or "empresa"
+
+def company_reports_zip(resumos: dict, destino, formato: str = "md", tarefa=None):
+    # um arquivo por empresa (Markdown ou planilha) dentro de um zip
+    usados = {}
+    with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as z:
+        for i, (emp, res) in enumerate(resumos.items()):
+            if tarefa is not None:
+                tarefa.reportar(i / max(len(resumos), 1), f"{i}/{len(resumos)} empresas")
+            base = _nome_arquivo(emp)
+            usados[base] = usados.get(base, 0) + 1
+            if usados[base] > 1:
+                base = f"{base}_{usados[base]}"
+            if formato == "xlsx":
+                buf = io.BytesIO()
+                export_workbook(res, buf)
+                z.writestr(f"{base}.xlsx", buf.getvalue())
+            else:
+                z.writestr(f"{base}.md", resumo_markdown(res).replace("# Resumo Analítico", f"# Resumo Analítico — {emp}", 1))
+    return destino
+
+# ============== Planilha Excel (xlsxwriter) ==============
+LIMITE_LINHAS_XLSX = 1_048_575  # linhas de dados por aba (a 1ª é o cabeçalho)
+
+def _valores_xlsx(s: pd.Series) -> list:
+    # tipos nativos para o xlsxwriter: datas como datetime, ausentes como None (célula vazia)
+    if pd.api.types.is_datetime64_any_dtype(s):
+        s = pd.Series(s.dt.to_pydatetime(), index=s.index, dtype=object)
+    else:
+        s = s.astype(object)
+    return s.where(s.notna(), None).tolist()
+
+def _aba_tabela(wb, nome: str, df: pd.DataFrame, formatos: dict, reportar=None, bloco: int = 50_000):
+    ws = wb.add_worksheet(nome)
+    df = df.drop(columns=[c for c in df.columns if str(c).startswith("_") and c != "_flag"]).rename(columns={"_flag": "motivo"})
+    n = min(len(df), LIMITE_LINHAS_XLSX)
+    # larguras e formatos de coluna antes das linhas: no modo constant_memory só se escreve para a frente
+    for j, c in enumerate(df.columns):
+        fmt = formatos["data"] if pd.api.types.is_datetime64_any_dtype(df[c]) else None
+        ws.set_column(j, j, min(max(len(str(c)) + 2, 12), 45), fmt)
+    ws.write_row(0, 0, [str(c) for c in df.columns], formatos["cabecalho"])
+    ws.freeze_panes(1, 0)
+    if len(df.columns):
+        ws.autofilter(0, 0, max(n, 1), len(df.columns) - 1)
+    # em blocos: cada bloco vira listas por coluna (sem iterrows) e as linhas saem em ordem
+    for ini in range(0, n, bloco):
+        parte = df.iloc[ini:min(ini + bloco, n)]
+        colunas = [_valores_xlsx(parte[c]) for c in parte.columns]
+        for i, linha in enumerate(zip(*colunas), start=ini + 1):
+            ws.write_row(i, 0, linha)
+        if reportar:
+            reportar(min(ini + bloco, n))
+    if len(df) > n:
+        ws.write(n + 1, 0, f"... {len(df) - n} linhas não couberam na aba (limite do Excel)", formatos["nota"])
+
+def export_workbook(res: dict, destino, tarefa=None):
+    # Resumo + ranking + detalhes em abas formatadas; constant_memory grava linha a linha em
+    # arquivos temporários, então a memória não cresce com o tamanho do cliente.
+    import xlsxwriter
+    e, s, p = res.get("entregas"), res.get("solicitacoes"), res.get("processos")
+    abas = [("Ranking atrasos", e and e["top_atrasos"]), ("Entregas atrasadas", e and e["atrasadas_detalhe"]),
+            ("Solicitações críticas", s and s["criticas"]), ("Processos críticos", p and p["criticos"])]
+    abas = [(nome, df) for nome, df in abas if isinstance(df, pd.DataFrame)]
+    total = sum(len(df) for _, df in abas) or 1
+
+    wb = xlsxwriter.Workbook(destino, {"constant_memory": True, "default_date_format": "dd/mm/yyyy",
+                                       "strings_to_numbers": False, "strings_to_formulas": False, "strings_to_urls": False})
+    formatos = {
+        "cabecalho": wb.add_format({"bold": True, "bg_color": "#DDEBF7", "border": 1}),
+        "titulo": wb.add_format({"bold": True, "font_size": 14}),
+        "secao": wb.add_format({"bold": True, "bg_color": "#F2F2F2"}),
+        "numero": wb.add_format({"num_format": "#,##0"}),
+        "data": wb.add_format({"num_format": "dd/mm/yyyy"}),
+        "nota": wb.add_format({"italic": True, "font_color": "#7F7F7F"}),
+    }
+    pr = res["parametros"]
+    ws = wb.add_worksheet("Resumo")
+    ws.set_column(0, 0, 55)
+    ws.set_column(1, 1, 14)
+    linhas = [("Resumo Analítico", None, "titulo"),
+              ("Data de referência", res["hoje"].to_pydatetime(), "data"),
+              ("Prazos em", "dias úteis" if res.get("dias_uteis") else "dias corridos", None)]
+    if e:
+        linhas += [("Entregas", None, "secao"), ("Total", e["total"], "numero"), ("Concluídas", e["concluidas"], "numero"),
+                   ("Pendentes", e["pendentes"], "numero"), ("Atrasadas (inclui pendentes vencidas)", e["atrasadas"], "numero"),
+                   (f"Em risco (≤ {pr['dias_em_risco']} dias)", e["em_risco"], "numero")]
+    if s:
+        linhas += [("Solicitações", None, "secao"), ("Total", s["total"], "numero"), ("Abertas", s["abertas"], "numero"),
+                   (f"Abertas ≥ {pr['sla_alerta']} dias", s["abertas_longas"], "numero"),
+                   (f"Alta sem atualização ≥ {pr['sem_update_alerta']} dias", s["alta_sem_atualizacao"], "numero")]
+    if p:
+        linhas += [("Processos", None, "secao"), ("Total", p["total"], "numero"),
+                   (f"Em andamento ≥ {pr['proc_dias_alerta']} dias", p["criticos_qtd"], "numero")]
+    for i, (rotulo, valor, fmt) in enumerate(linhas):
+        if valor is None:
+            ws.write(i, 0, rotulo, formatos.get(fmt))
+        else:
+            ws.write(i, 0, rotulo)
+            ws.write(i, 1, valor, formatos.get(fmt))
+
+    feitas = 0
+    for nome, df in abas:
+        reportar = None
+        if tarefa is not None:
+            reportar = lambda linhas, antes=feitas, nome=nome: tarefa.reportar(min((antes + linhas) / total, 1.0), f"escrevendo '{nome}'")
+        _aba_tabela(wb, nome, df, formatos, reportar)
+        feitas += len(df)
+    wb.close()
+    return destino
+
+# ============== Carteira de clientes (resumos compactos) ==============
+# Cada diagnóstico vira um JSON pequeno (KPIs, série mensal, obrigações que mais atrasam) numa pasta local;
+# a visão de carteira compara clientes só a partir desses resumos, sem reabrir nenhuma exportação.
+# padrão ao lado deste módulo (como o feriados.csv), não na pasta de onde o app foi iniciado
+CARTEIRA_PASTA = os.environ.get("ACESSORIAS_CARTEIRA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "carteira"))
+# unificação de empresas guardada por cliente (resolve_client_companies); fora dos .json, então não entra na carteira
+EMPRESAS_PASTA = os.environ.get("ACESSORIAS_EMPRESAS", os.path.join(CARTEIRA_PASTA, "empresas"))
+
+def _por_mes(datas: pd.Series, colunas: dict) -> pd.DataFrame:
+    # soma de cada máscara/valor por mês de `datas` (códigos de período + bincount)
+    ok = datas.notna().to_numpy()
+    codes, meses = pd.factorize(datas[ok].dt.to_period("M"), sort=True)
+    return pd.DataFrame({k: np.bincount(codes, weights=np.asarray(v, dtype=float)[ok], minlength=len(meses)).astype(int)
+                         for k, v in colunas.items()}, index=meses.astype(str))
+
+def client_summary(dfe=None, dfs=None, dfp=None, hoje=None, params=None, feriados=None, top: int = 10) -> dict:
+    # KPIs, série mensal e obrigações que mais atrasam de um diagnóstico (sem filtros), só números
+    p = {**PARAMETROS_PADRAO, **(params or {})}
+    hoje = pd.to_datetime(hoje if hoje is not None else pd.Timestamp.today().normalize())
+    kpis, mensal, obrigacoes = {}, [], []
+    if isinstance(dfe, pd.DataFrame) and {"data_vencimento", "status"}.issubset(dfe.columns):
+        cols = [c for c in ["data_vencimento", "data_entrega", "status", "obrigacao", "alerta_dias"] if c in dfe.columns]
+        e = _marcar_entregas(dfe[cols].copy(), hoje, p["dias_em_risco"], feriados)
+        concl = (e["status"].str.lower() == "concluída").fillna(False).to_numpy(dtype=bool)
+        atrasada = (e["atrasada_concluida"] | e["atrasada_pendente"]).to_numpy()
+        pontual = concl & ~e["atrasada_concluida"].to_numpy()
+        kpis.update(entregas=len(e), concluidas=int(concl.sum()), pendentes=int((~concl).sum()),
+                    atrasadas=int(atrasada.sum()), atrasadas_pendentes=int(e["atrasada_pendente"].sum()),
+                    em_risco=int(e["em_risco"].sum()), pontualidade=float(pontual.sum() / concl.sum()) if concl.any() else None)
+        mensal.append(_por_mes(e["data_vencimento"], {"vencem": np.ones(len(e)), "concluidas": concl,
+                                                      "pontuais": pontual, "atrasadas": atrasada}))
+        if "obrigacao" in e.columns and atrasada.any():
+            cont = e.loc[atrasada, "obrigacao"].value_counts()
+            obrigacoes = [{"obrigacao": str(k), "atrasos": int(v)} for k, v in cont.head(top).items()]
+    if isinstance(dfs, pd.DataFrame) and {"abertura", "conclusao"}.issubset(dfs.columns):
+        tempo = dfs["tempo_ate_conclusao_dias"] if "tempo_ate_conclusao_dias" in dfs.columns else pd.Series(
+            np.where(dfs["conclusao"].notna() & dfs["abertura"].notna(), diff_days(dfs["abertura"], dfs["conclusao"], feriados), np.nan),
+            index=dfs.index)
+        resolvidas = tempo.notna().to_numpy()
+        no_sla = (tempo <= p["sla_alerta"]).to_numpy()
+        longas, _ = _marcar_solicitacoes(dfs, hoje, p["sla_alerta"], p["sem_update_alerta"], feriados)
+        kpis.update(solicitacoes=len(dfs), solicitacoes_abertas=int(dfs["conclusao"].isna().sum()),
+                    solicitacoes_abertas_longas=int(longas.sum()),
+                    sla=float(no_sla.sum() / resolvidas.sum()) if resolvidas.any() else None)
+        mensal.append(_por_mes(dfs["abertura"], {"solicitacoes": np.ones(len(dfs)), "solicitacoes_resolvidas": resolvidas,
+                                                 "solicitacoes_no_sla": no_sla}))
+    if isinstance(dfp, pd.DataFrame) and {"inicio", "conclusao", "status"}.issubset(dfp.columns):
+        crit = _marcar_processos(dfp[["inicio", "conclusao", "status"]].copy(), hoje, p["proc_dias_alerta"], feriados)
+        kpis.update(processos=len(dfp), processos_criticos=int(crit.sum()))
+    mensal = pd.concat(mensal, axis=1).fillna(0).astype(int).sort_index() if mensal else pd.DataFrame()
+    return {"hoje": str(hoje.date()), "parametros": p, "kpis": kpis,
+            "mensal": {"mes": mensal.index.tolist(), **{c: mensal[c].tolist() for c in mensal.columns}},
+            "obrigacoes": obrigacoes}
+
+def _arquivo_cliente(pasta: str, cliente: str, ext: str = ".json") -> str:
+    # nome legível + hash do nome exato: "Cliente/B" e "Cliente B" viram o mesmo texto, mas não o mesmo arquivo
+    return os.path.join(pasta, f"{_nome_arquivo(cliente)}_{hashlib.sha1(cliente.encode('utf-8')).hexdigest()[:10]}{ext}")
+
+def save_client_summary(resumo: dict, cliente: str, pasta: str = CARTEIRA_PASTA) -> str:
+    # um arquivo por cliente; o diagnóstico mais recente substitui o anterior (escrita atômica)
+    os.makedirs(pasta, exist_ok=True)
+    caminho = _arquivo_cliente(pasta, cliente)
+    tmp = caminho + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"cliente": cliente, **resumo}, f, ensure_ascii=False)
+    os.replace(tmp, caminho)
+    # arquivo do formato antigo (só o nome legível) deste mesmo cliente: o novo o substitui
+    antigo = os.path.join(pasta, _nome_arquivo(cliente) + ".json")
+    if os.path.exists(antigo) and (_ler_resumo(antigo) or {}).get("cliente") == cliente:
+        os.remove(antigo)
+    return caminho
+
+def _ler_resumo(caminho: str):
+    # resumo guardado, ou None se o arquivo não abre, não é JSON ou não tem o cliente (ex.: gravação interrompida)
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            r = json.load(f)
+    except (OSError, UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    return r if isinstance(r, dict) and isinstance(r.get("cliente"), str) else None
+
+def load_portfolio(pasta: str = CARTEIRA_PASTA) -> dict:
+    # {"kpis": cliente × KPI, "mensal": (cliente, mes) × contagens, "obrigacoes": (cliente, obrigacao, atrasos),
+    #  "ignorados": arquivos que não puderam ser lidos}
+    kpis, mensal, obrigacoes, ignorados = [], [], [], []
+    nomes = sorted(n for n in os.listdir(pasta) if n.endswith(".json")) if os.path.isdir(pasta) else []
+    for nome in nomes:
+        r = _ler_resumo(os.path.join(pasta, nome))
+        if r is None:
+            ignorados.append(nome)
+            continue
+        kpis.append({"cliente": r["cliente"], "hoje": r.get("hoje"), **r.get("kpis", {})})
+        if r.get("mensal", {}).get("mes"):
+            mensal.append(pd.DataFrame(r["mensal"]).assign(cliente=r["cliente"]))
+        obrigacoes += [{"cliente": r["cliente"], **o} for o in r.get("obrigacoes", [])]
+    kpis = pd.DataFrame(kpis).set_index("cliente") if kpis else pd.DataFrame()
+    mensal = pd.concat(mensal, ignore_index=True).fillna(0) if mensal else pd.DataFrame(columns=["cliente", "mes"])
+    return {"kpis": kpis, "mensal": mensal, "obrigacoes": pd.DataFrame(obrigacoes, columns=["cliente", "obrigacao", "atrasos"]),
+            "ignorados": ignorados}
+
+def portfolio_trend(mensal: pd.DataFrame, clientes=None) -> pd.DataFrame:
+    # série mensal da carteira (ou de alguns clientes): somas e taxas recalculadas a partir das somas
+    if clientes:
+        mensal = mensal[mensal["cliente"].isin(clientes)]
+    tot = mensal.drop(columns="cliente").groupby("mes").sum().sort_index()
+    if {"pontuais", "concluidas"}.issubset(tot.columns):
+        tot["pontualidade"] = tot["pontuais"] / tot["concluidas"].where(tot["concluidas"] > 0)
+    if {"solicitacoes_no_sla", "solicitacoes_resolvidas"}.issubset(tot.columns):
+        tot["sla"] = tot["solicitacoes_no_sla"] / tot["solicitacoes_resolvidas"].where(tot["solicitacoes_resolvidas"] > 0)
+    return tot
+
+# ============== Score de risco (fila de ação) ==============
+PESOS_RISCO = {"atraso": 3.0, "urgencia": 2.0, "prioridade": 1.0, "parado": 1.0, "hist_resp": 1.0, "hist_emp": 1.0}
+
+def top_k(score, k: int) -> np.ndarray:
+    # posições dos k maiores scores (argpartition + ordena só os k)
+    score = np.nan_to_num(np.asarray(score, dtype=float), nan=-np.inf)
+    k = min(k, len(score))
+    if k <= 0:
+        return np.array([], dtype=int)
+    parte = np.argpartition(-score, k - 1)[:k]
+    return parte[np.argsort(-score[parte], kind="stable")]
+
+def late_rates(dfe: pd.DataFrame, col: str, suavizacao: float = 5.0) -> tuple:
+    # taxa histórica de atraso por chave, suavizada para a taxa global (bincount sobre códigos)
+    concl = dfe.get("status","").str.lower() == "concluída"
+    base = dfe[concl & dfe[col].notna()] if col in dfe.columns else dfe.iloc[0:0]
+    if base.empty or "atrasada_concluida" not in base.columns:
+        return pd.Series(dtype=float), 0.0
+    codes, chaves = pd.factorize(base[col])
+    atraso = base["atrasada_concluida"].to_numpy(dtype=float)
+    global_ = atraso.mean()
+    n = np.bincount(codes, minlength=len(chaves))
+    late = np.bincount(codes, weights=atraso, minlength=len(chaves))
+    return pd.Series((late + suavizacao * global_) / (n + suavizacao), index=chaves), float(global_)
+
+def _taxa(valores: pd.Series, taxas: tuple) -> np.ndarray:
+    serie, global_ = taxas
+    if valores is None:
+        return global_      # coluna não mapeada: escalar, soma com qualquer número de linhas
+    if serie.empty:
+        return np.full(len(valores), global_)
+    return pd.to_numeric(lookup(valores, pd.Series(serie.index), pd.Series(serie.to_numpy()), normalizar=False),
+                         errors="coerce").fillna(global_).to_numpy(dtype=float)
+
+# Previsão de atraso: faixas de "dias até o vencimento" (limite inferior de cada faixa)
+FAIXAS_PRAZO = [0, 1, 3, 7, 15, 30, 60]
+
+def _logit(p):
+    p = np.clip(p, 1e-4, 1 - 1e-4)
+    return np.log(p / (1 - p))
+
+def late_probability(dfe: pd.DataFrame, hoje, suavizacao: float = 5.0,
+                     chaves=("responsavel_entrega", "obrigacao", "empresa")) -> pd.Series:
+    # P(entregar atrasado) para cada entrega pendente; NaN nas concluídas.
+    # Base: na faixa de prazo da tarefa, a fração do histórico que ainda estava em aberto naquele ponto
+    # (entrega >= vencimento - faixa) e acabou atrasando. Cada chave (responsável, obrigação, empresa)
+    # desloca essa base em log-odds pela diferença entre a sua taxa suavizada e a taxa global.
+    out = pd.Series(np.nan, index=dfe.index, dtype=float)
+    if not {"data_vencimento", "status"}.issubset(dfe.columns):
+        return out
+    hoje = pd.to_datetime(hoje)
+    venc = dfe["data_vencimento"]
+    st_codes, st_uniq = pd.factorize(dfe["status"])      # lower() só nos poucos status distintos
+    concl = np.append(pd.Index(st_uniq).astype(str).str.lower() == "concluída", False)[st_codes]
+    pend = ~concl & venc.notna().to_numpy()
+    if not pend.any():
+        return out
+    # histórico: entrega - vencimento (dias) das concluídas com as duas datas
+    x = (dfe["data_entrega"] - venc).dt.days.to_numpy(dtype=float) if "data_entrega" in dfe.columns else np.full(len(dfe), np.nan)
+    hist = concl & ~np.isnan(x)
+    xs = np.sort(x[hist])
+    tardias = len(xs) - np.searchsorted(xs, 0, side="right")
+    global_ = tardias / len(xs) if len(xs) else 0.5
+    faixas = np.asarray(FAIXAS_PRAZO, dtype=float)
+    em_aberto = len(xs) - np.searchsorted(xs, -faixas, side="left")      # ainda abertas a `faixa` dias do vencimento
+    base_faixa = (tardias + suavizacao * global_) / (em_aberto + suavizacao)
+    dias = _dias(venc[pend], hoje)
+    faixa = np.clip(np.searchsorted(faixas, np.nan_to_num(dias, nan=0.0), side="right") - 1, 0, len(faixas) - 1)
+    logit = _logit(base_faixa[faixa])
+    for col in chaves:
+        if col not in dfe.columns or not len(xs):
+            continue
+        # taxa suavizada por chave (bincount sobre códigos da coluna inteira), lida direto nas pendentes
+        codes, uniq = pd.factorize(dfe[col])
+        ok = hist & (codes >= 0)
+        n = np.bincount(codes[ok], minlength=len(uniq) + 1)
+        late = np.bincount(codes[ok], weights=(x[ok] > 0), minlength=len(uniq) + 1)
+        taxa = (late + suavizacao * global_) / (n + suavizacao)      # código -1 (vazio) cai no último = global
+        logit = logit + _logit(taxa[codes[pend]]) - _logit(global_)
+    prob = 1 / (1 + np.exp(-logit))
+    out.iloc[np.flatnonzero(pend)] = np.where(dias < 0, 1.0, prob)
+    return out
+
+def _prioridade(s) -> np.ndarray:
+    if s is None:
+        return 0.0
+    p = s.astype("string").str.lower()
+    return np.select([p.str.contains("alta|urgente", na=False), p.str.contains("m[ée]dia|normal", na=False)], [1.0, 0.5], 0.0)
+
+def _dias(serie, hoje) -> np.ndarray:
+    return (pd.to_datetime(serie) - hoje).dt.days.to_numpy(dtype=float)
+
+def _score(dias_para_vencer, prioridade, dias_parado, hist_resp, hist_emp, pesos) -> np.ndarray:
+    d = np.asarray(dias_para_vencer, dtype=float)
+    atraso = np.where(d < 0, 1 - np.exp(d / 15.0), 0.0)
+    urgencia = np.where(d < 0, 1.0, np.exp(-np.nan_to_num(d, nan=np.inf) / 3.0))
+    parado = 1 - np.exp(-np.clip(np.nan_to_num(dias_parado, nan=0.0), 0, None) / 7.0)
+    return (pesos["atraso"] * np.nan_to_num(atraso) + pesos["urgencia"] * urgencia + pesos["prioridade"] * prioridade
+            + pesos["parado"] * parado + pesos["hist_resp"] * hist_resp + pesos["hist_emp"] * hist_emp)
+
+def risk_scores(dfe=None, dfs=None, dfp=None, hoje=None, params=None, pesos=None) -> pd.DataFrame:
+    # um score por item pendente (Entregas, Solicitações, Processos), tudo vetorizado;
+    # `linha` é o rótulo da linha no dataset de origem
+    p = {**PARAMETROS_PADRAO, **(params or {})}
+    w = {**PESOS_RISCO, **(pesos or {})}
+    hoje = pd.to_datetime(hoje if hoje is not None else pd.Timestamp.today().normalize())
+    tem_hist = isinstance(dfe, pd.DataFrame) and "atrasada_concluida" in dfe.columns
+    t_resp = late_rates(dfe, "responsavel_entrega") if tem_hist else (pd.Series(dtype=float), 0.0)
+    t_emp = late_rates(dfe, "empresa") if tem_hist else (pd.Series(dtype=float), 0.0)
+    partes = []
+
+    if isinstance(dfe, pd.DataFrame) and "data_vencimento" in dfe.columns:
+        e = dfe[(dfe.get("status","").str.lower() != "concluída") & dfe["data_vencimento"].notna()]
+        d = _dias(e["data_vencimento"], hoje)
+        partes.append(pd.DataFrame({
+            "origem": "Entregas",
+            "linha": e.index,
+            "item": e.get("obrigacao"),
+            "empresa": e.get("empresa"),
+            "responsavel": e.get("responsavel_entrega"),
+            "referencia": e["data_vencimento"],
+            "dias_para_vencer": d,
+            "score": _score(d, 0.0, np.nan, _taxa(e.get("responsavel_entrega"), t_resp), _taxa(e.get("empresa"), t_emp), w),
+        }))
+
+    if isinstance(dfs, pd.DataFrame) and "conclusao" in dfs.columns:
+        s = dfs[dfs["conclusao"].isna()]
+        # sem prazo, a referência é o SLA a partir da abertura
+        ref = s["prazo"] if "prazo" in s.columns else pd.Series(pd.NaT, index=s.index)
+        if "abertura" in s.columns:
+            ref = ref.fillna(s["abertura"] + pd.Timedelta(days=p["sla_alerta"]))
+        d = _dias(ref, hoje)
+        parado = -_dias(s["ultima_atualizacao"], hoje) if "ultima_atualizacao" in s.columns else np.nan
+        partes.append(pd.DataFrame({
+            "origem": "Solicitações",
+            "linha": s.index,
+            "item": s.get("assunto"),
+            "empresa": s.get("empresa"),
+            "responsavel": s.get("responsavel"),
+            "referencia": ref,
+            "dias_para_vencer": d,
+            "score": _score(d, _prioridade(s.get("prioridade")), parado, _taxa(s.get("responsavel"), t_resp), _taxa(s.get("empresa"), t_emp), w),
+        }))
+
+    if isinstance(dfp, pd.DataFrame) and {"inicio","status"}.issubset(dfp.columns):
+        pr = dfp[(dfp["status"].str.lower() != "concluída") & dfp["inicio"].notna()]
+        ref = pr["inicio"] + pd.Timedelta(days=p["proc_dias_alerta"])
+        d = _dias(ref, hoje)
+        partes.append(pd.DataFrame({
+            "origem": "Processos",
+            "linha": pr.index,
+            "item": pr.get("processo"),
+            "empresa": pr.get("empresa"),
+            "responsavel": pr.get("responsavel"),
+            "referencia": ref,
+            "dias_para_vencer": d,
+            "score": _score(d, 0.0, np.nan, _taxa(pr.get("responsavel"), t_resp), _taxa(pr.get("empresa"), t_emp), w),
+        }))
+
+    if not partes:
+        return pd.DataFrame(columns=["origem","linha","item","empresa","responsavel","referencia","dias_para_vencer","score"])
+    return pd.concat(partes, ignore_index=True)
+
+def risk_queue(dfe=None, dfs=None, dfp=None, hoje=None, k: int = 200, params=None, pesos=None) -> pd.DataFrame:
+    scores = risk_scores(dfe, dfs, dfp, hoje, params, pesos)
+    out = scores.iloc[top_k(scores["score"].to_numpy(), k)].reset_index(drop=True)
+    out["score"] = out["score"].round(2)
+    return out
+
+# ============== Tarefas em segundo plano ==============
+class Cancelada(Exception):
+    pass
+
+class Tarefa:
+    def __init__(self):
+        self.progresso = 0.0
+        self.mensagem = "na fila"
+        self.future = None
+        self.interessados = set()     # sessões acompanhando; a tarefa só é cancelada quando todas desistem
+        self._cancelar = threading.Event()
+
+    def reportar(self, progresso: float, mensagem: str = ""):
+        # ponto de checagem: o cancelamento interrompe a tarefa aqui
+        if self._cancelar.is_set():
+            raise Cancelada()
+        self.progresso, self.mensagem = progresso, mensagem
+
+    def cancelar(self):
+        self._cancelar.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    @property
+    def cancelada(self) -> bool:
+        return self._cancelar.is_set()
+
+    @property
+    def pronta(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    @property
+    def falhou(self) -> bool:
+        return self.pronta and not self.future.cancelled() and self.future.exception() is not None
+
+    def resultado(self):
+        return self.future.result()
+
+class GerenciadorTarefas:
+    # pool do processo inteiro: sessões diferentes não se bloqueiam, e a mesma chave
+    # (mesmo conteúdo + parâmetros) reaproveita a tarefa em andamento ou já concluída
+    def __init__(self, workers: int = 4, guardar: int = 64):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tarefa")
+        self.tarefas = OrderedDict()
+        self.guardar = guardar
+        self.lock = threading.Lock()
+
+    def obter(self, chave):
+        with self.lock:
+            t = self.tarefas.get(chave)
+            if t is not None:
+                self.tarefas.move_to_end(chave)
+            return t
+
+    def submeter(self, chave, fn, *args, sessao=None, **kwargs) -> Tarefa:
+        # `sessao` registra quem acompanha a tarefa (ver `desistir`)
+        with self.lock:
+            t = self.tarefas.get(chave)
+            if t is not None and not t.cancelada:
+                self.tarefas.move_to_end(chave)
+                if sessao is not None:
+                    t.interessados.add(sessao)
+                return t
+            t = Tarefa()
+            if sessao is not None:
+                t.interessados.add(sessao)
+            t.future = self.pool.submit(fn, *args, tarefa=t, **kwargs)
+            self.tarefas[chave] = t
+            # descarta as mais antigas já terminadas
+            antigas = [k for k, v in self.tarefas.items() if v.pronta]
+            for k in antigas[:max(0, len(self.tarefas) - self.guardar)]:
+                del self.tarefas[k]
+            return t
+
+    def desistir(self, chave, sessao) -> bool:
+        # a sessão para de acompanhar; a tarefa só é cancelada se ninguém mais espera por ela
+        with self.lock:
+            t = self.tarefas.get(chave)
+            if t is None:
+                return False
+            t.interessados.discard(sessao)
+            if t.interessados or t.pronta:
+                return False
+            del self.tarefas[chave]
+        t.cancelar()
+        return True
+
+    def descartar(self, chave):
+        # remove a tarefa (cancelando se ainda roda): para refazer uma que falhou ou trocar por outra
+        with self.lock:
+            t = self.tarefas.pop(chave, None)
+        if t is not None:
+            t.cancelar()
+
+# ============== Cache compartilhado de datasets ==============
+# Um cache por processo, indexado pelo hash do conteúdo: todas as sessões recebem o mesmo objeto
+# (tratado como somente leitura; quem precisa alterar faz .copy()). Acima do orçamento de memória,
+# as entradas menos usadas vão para o disco num formato colunar (.npz) e voltam sob demanda.
+def _tamanho(valor) -> int:
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True, index=True).sum())
+    if isinstance(valor, DateIndex):
+        return valor.keys.nbytes + valor.rows.nbytes
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes
+    if isinstance(valor, dict):
+        return sum(_tamanho(v) for v in valor.values())
+    if isinstance(valor, (tuple, list)):
+        return sum(_tamanho(v) for v in valor)
+    return 0
+
+def _mapear_frames(valor, fn):
+    # aplica fn em cada DataFrame/DateIndex dentro de dicts/tuplas/listas, preservando a estrutura
+    # (no despejo, os índices de datas também vão para o disco: nada da entrada fica na memória sem ser contado)
+    if isinstance(valor, (pd.DataFrame, DateIndex)):
+        return fn(valor)
+    if isinstance(valor, dict):
+        return {k: _mapear_frames(v, fn) for k, v in valor.items()}
+    if isinstance(valor, (tuple, list)):
+        return type(valor)(_mapear_frames(v, fn) for v in valor)
+    return valor
+
+def save_columnar(df: pd.DataFrame, caminho: str):
+    # uma matriz por coluna; textos viram códigos int32 + categorias (cada valor distinto gravado uma vez),
+    # em unicode de largura fixa. Sem pickle: categorias que não são texto vão como JSON (tipos fora do JSON
+    # voltam como texto)
+    arrays, meta = {}, []
+    colunas = [("__index__", df.index.to_series(index=range(len(df))))] + [(c, df[c]) for c in df.columns]
+    for i, (nome, s) in enumerate(colunas):
+        dtype = s.dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+            arrays[f"v{i}"] = s.to_numpy()
+            meta.append([nome, "valores", str(dtype)])
+        elif pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+            # nullable (Int64, boolean, Float64): valores + máscara de ausentes
+            arrays[f"v{i}"] = s.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+            arrays[f"m{i}"] = s.isna().to_numpy()
+            meta.append([nome, "mascarado", str(dtype)])
+        else:
+            codes, cats = pd.factorize(s, use_na_sentinel=True)
+            arrays[f"v{i}"] = codes.astype(np.int32)
+            if pd.api.types.infer_dtype(cats, skipna=True) in ("string", "empty"):
+                arrays[f"c{i}"] = np.asarray(cats, dtype=str)
+                meta.append([nome, "codificado", str(dtype)])
+            else:
+                arrays[f"c{i}"] = np.array(json.dumps(list(cats), default=str))
+                meta.append([nome, "codificado_json", str(dtype)])
+    arrays["__meta__"] = np.array(json.dumps(meta))
+    with open(caminho, "wb") as f:
+        np.savez(f, **arrays)
+
+def load_columnar(caminho: str) -> pd.DataFrame:
+    with np.load(caminho, allow_pickle=False) as z:
+        meta = json.loads(str(z["__meta__"]))
+        cols = {}
+        for i, (nome, tipo, dtype) in enumerate(meta):
+            if tipo == "valores":
+                s = pd.Series(z[f"v{i}"])
+            elif tipo == "mascarado":
+                s = pd.Series(z[f"v{i}"]).astype(dtype).mask(z[f"m{i}"])
+            else:
+                cats = z[f"c{i}"].astype(object) if tipo == "codificado" else json.loads(str(z[f"c{i}"]))
+                cat = pd.Categorical.from_codes(z[f"v{i}"], pd.Index(cats))
+                s = pd.Series(cat)
+                if dtype != "category":
+                    s = s.astype(object).where(s.notna(), np.nan).astype(dtype)
+            cols[nome] = s
+    indice = cols.pop("__index__")
+    df = pd.DataFrame(cols)
+    df.index = pd.Index(indice.to_numpy())
+    return df
+
+def save_date_index(idx: DateIndex, caminho: str):
+    with open(caminho, "wb") as f:
+        np.savez(f, keys=idx.keys, rows=idx.rows)
+
+def load_date_index(caminho: str) -> DateIndex:
+    idx = DateIndex.__new__(DateIndex)
+    with np.load(caminho, allow_pickle=False) as z:
+        idx.keys, idx.rows = z["keys"], z["rows"]
+    return idx
+
+class _NoDisco:
+    def __init__(self, caminho: str, indice: bool = False):
+        self.caminho = caminho
+        self.indice = indice
+
+class CacheDatasets:
+    def __init__(self, memoria_mb: int = 1024, disco_mb: int = 8192, pasta: str = None):
+        self.memoria = memoria_mb * 2**20
+        self.disco = disco_mb * 2**20
+        self.pasta = pasta or os.path.join(tempfile.gettempdir(), "acessorias_cache")
+        os.makedirs(self.pasta, exist_ok=True)
+        self.em_memoria = OrderedDict()   # chave -> (valor, bytes)
+        self.em_disco = OrderedDict()     # chave -> (estrutura com _NoDisco, bytes_em_disco)
+        self.usado = 0
+        self.usado_disco = 0
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _nome(chave) -> str:
+        return hashlib.sha1(repr(chave).encode("utf-8")).hexdigest()
+
+    def get(self, chave):
+        with self.lock:
+            if chave in self.em_memoria:
+                self.em_memoria.move_to_end(chave)
+                return self.em_memoria[chave][0]
+            if chave not in self.em_disco:
+                return None
+            self.em_disco.move_to_end(chave)
+            valor = _mapear_frames_disco(self.em_disco[chave][0])
+            self._guardar(chave, valor)
+            return valor
+
+    def put(self, chave, valor):
+        with self.lock:
+            if chave in self.em_memoria:
+                self.usado -= self.em_memoria.pop(chave)[1]
+            self._guardar(chave, valor)
+        return valor
+
+    def _guardar(self, chave, valor):
+        tamanho = _tamanho(valor)
+        self.em_memoria[chave] = (valor, tamanho)
+        self.usado += tamanho
+        while self.usado > self.memoria and self.em_memoria:
+            antiga, (v, t) = self.em_memoria.popitem(last=False)
+            self.usado -= t
+            self._despejar(antiga, v)
+
+    def _despejar(self, chave, valor):
+        # a versão em disco é imutável: se já existe, basta soltar a cópia em memória
+        if chave in self.em_disco:
+            return
+        base, n = self._nome(chave), [0]
+        def gravar(v):
+            caminho = os.path.join(self.pasta, f"{base}_{n[0]}.npz")
+            n[0] += 1
+            if isinstance(v, DateIndex):
+                save_date_index(v, caminho)
+                return _NoDisco(caminho, indice=True)
+            save_columnar(v, caminho)
+            return _NoDisco(caminho)
+        estrutura = _mapear_frames(valor, gravar)
+        tamanho = sum(os.path.getsize(os.path.join(self.pasta, f"{base}_{i}.npz")) for i in range(n[0]))
+        self.em_disco[chave] = (estrutura, tamanho)
+        self.usado_disco += tamanho
+        while self.usado_disco > self.disco and len(self.em_disco) > 1:
+            antiga, (est, t) = self.em_disco.popitem(last=False)
+            self.usado_disco -= t
+            _mapear_frames_disco(est, apagar=True)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"memoria_mb": round(self.usado / 2**20, 1), "itens_memoria": len(self.em_memoria),
+                    "disco_mb": round(self.usado_disco / 2**20, 1), "itens_disco": len(self.em_disco)}
+
+def _mapear_frames_disco(valor, apagar: bool = False):
+    # inverso do despejo: troca cada _NoDisco pelo DataFrame/DateIndex lido (ou apaga o arquivo)
+    if isinstance(valor, _NoDisco):
+        if apagar:
+            if os.path.exists(valor.caminho):
+                os.remove(valor.caminho)
+            return None
+        return load_date_index(valor.caminho) if valor.indice else load_columnar(valor.caminho)
+    if isinstance(valor, dict):
+        return {k: _mapear_frames_disco(v, apagar) for k, v in valor.items()}
+    if isinstance(valor, (tuple, list)):
+        return type(valor)(_mapear_frames_disco(v, apagar) for v in valor)
+    return valor
@@ -3,6 +3,7 @@ import io
 import os
 import csv
 import sqlite3
+import sys
 from datetime import date, datetime
 
 import numpy as np
@@ -10,6 +11,9 @@ import pandas as pd
 import plotly.express as px
 import streamlit as st
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from diagnostico import filters_mask, filtro_busca, indice_valores
+
 st.set_page_config(page_title="Acessórias — Diagnóstico Unificado", layout="wide")
 
 st.title("📊 Acessórias — Diagnóstico Unificado por Cliente")
@@ -71,7 +75,8 @@ def map_columns_ui(title, df: pd.DataFrame, required_map: dict, key_prefix: str)
     return picked
 
 def apply_mapping(df: pd.DataFrame, mapping: dict):
-    return df.rename(columns=mapping)
+    # mapping é {alvo: coluna da planilha}; renomeia coluna -> alvo
+    return df.rename(columns={v: k for k, v in mapping.items()})
 
 # ===================== Sidebar: Upload =====================
 
@@ -83,6 +88,8 @@ with st.sidebar:
     up_obrig = st.file_uploader("Obrigações (XLSX/CSV)", type=["xlsx","csv"])
     up_proc = st.file_uploader("Gestão de Processos (XLSX/CSV)", type=["xlsx","csv"])
     up_resp = st.file_uploader("Responsáveis & Departamentos (XLS/XLSX/CSV)", type=["xls","xlsx","csv"])
+    data_ref = st.date_input("📆 Data de referência", value=date.today(), format="DD/MM/YYYY",
+                             help="Flags e idades são calculadas nesta data (use uma data passada para reproduzir um diagnóstico).")
 
     st.markdown("---")
     st.caption("Dica: você pode salvar um **preset** de mapeamentos por cliente (aba Exportações).")
@@ -118,7 +125,7 @@ with tabs[0]:
         if "status" in df_ent.columns:
             df_ent["status"] = df_ent["status"].map(_norm_status).fillna(df_ent["status"])
         # business logic
-        today = pd.to_datetime(date.today())
+        today = pd.to_datetime(data_ref)
         if "data_vencimento" in df_ent.columns:
             df_ent["atrasada_concluida"] = np.where(
                 (df_ent.get("status","").str.lower()=="concluída") & df_ent.get("data_entrega").notna() & (df_ent.get("data_entrega") > df_ent.get("data_vencimento")),
@@ -143,20 +150,15 @@ with tabs[0]:
             )
         # filters
         st.markdown("##### Filtros")
-        emp = sorted(df_ent.get("empresa", pd.Series(dtype=str)).dropna().unique().tolist())
-        dep = sorted(df_ent.get("departamento", pd.Series(dtype=str)).dropna().unique().tolist())
-        res = sorted(df_ent.get("responsavel_entrega", pd.Series(dtype=str)).dropna().unique().tolist())
+        versao = (up_entregas.file_id, tuple(sorted(mapping.items())))
         c1, c2, c3 = st.columns(3)
         with c1:
-            emp_sel = st.multiselect("Empresas", emp, default=emp)
+            emp_sel = filtro_busca("Empresas", indice_valores(df_ent, versao, "empresa"), "ent_emp")
         with c2:
-            dep_sel = st.multiselect("Departamentos", dep, default=dep)
+            dep_sel = filtro_busca("Departamentos", indice_valores(df_ent, versao, "departamento"), "ent_dep")
         with c3:
-            res_sel = st.multiselect("Responsáveis (entrega)", res, default=res)
-        mask = pd.Series(True, index=df_ent.index)
-        if emp: mask &= df_ent["empresa"].isin(emp_sel)
-        if dep: mask &= df_ent["departamento"].isin(dep_sel)
-        if res: mask &= df_ent["responsavel_entrega"].isin(res_sel)
+            res_sel = filtro_busca("Responsáveis (entrega)", indice_valores(df_ent, versao, "responsavel_entrega"), "ent_res")
+        mask = filters_mask(df_ent, {"empresa": emp_sel, "departamento": dep_sel, "responsavel_entrega": res_sel})
         dfe = df_ent[mask].copy()
 
         # KPIs
@@ -240,16 +242,13 @@ with tabs[1]:
             dfr["status"] = dfr["status"].map(_norm_status).fillna(dfr["status"])
 
         st.markdown("##### Filtros")
-        emp = sorted(dfr.get("empresa", pd.Series(dtype=str)).dropna().unique().tolist())
-        res = sorted(dfr.get("responsavel", pd.Series(dtype=str)).dropna().unique().tolist())
+        versao = (up_solic.file_id, tuple(sorted(mapping.items())))
         c1, c2 = st.columns(2)
         with c1:
-            emp_sel = st.multiselect("Empresas", emp, default=emp)
+            emp_sel = filtro_busca("Empresas", indice_valores(dfr, versao, "empresa"), "sol_emp")
         with c2:
-            res_sel = st.multiselect("Responsáveis", res, default=res)
-        mask = pd.Series(True, index=dfr.index)
-        if emp: mask &= dfr["empresa"].isin(emp_sel)
-        if res: mask &= dfr["responsavel"].isin(res_sel)
+            res_sel = filtro_busca("Responsáveis", indice_valores(dfr, versao, "responsavel"), "sol_res")
+        mask = filters_mask(dfr, {"empresa": emp_sel, "responsavel": res_sel})
         dfs = dfr[mask].copy()
 
         # SLA simples
@@ -260,7 +259,7 @@ with tabs[1]:
         )
         dfs["aberta_ha_dias"] = np.where(
             dfs.get("conclusao").isna() & dfs.get("abertura").notna(),
-            (pd.to_datetime(date.today()) - dfs.get("abertura")).dt.days,
+            (pd.to_datetime(data_ref) - dfs.get("abertura")).dt.days,
             np.nan
         )
 
@@ -329,20 +328,15 @@ with tabs[3]:
             dfp["status"] = dfp["status"].map(_norm_status).fillna(dfp["status"])
 
         st.markdown("##### Filtros")
-        emp = sorted(dfp.get("empresa", pd.Series(dtype=str)).dropna().unique().tolist())
-        dep = sorted(dfp.get("departamento", pd.Series(dtype=str)).dropna().unique().tolist())
-        res = sorted(dfp.get("responsavel", pd.Series(dtype=str)).dropna().unique().tolist())
+        versao = (up_proc.file_id, tuple(sorted(mapping.items())))
         c1, c2, c3 = st.columns(3)
         with c1:
-            emp_sel = st.multiselect("Empresas", emp, default=emp)
+            emp_sel = filtro_busca("Empresas", indice_valores(dfp, versao, "empresa"), "pro_emp")
         with c2:
-            dep_sel = st.multiselect("Departamentos", dep, default=dep)
+            dep_sel = filtro_busca("Departamentos", indice_valores(dfp, versao, "departamento"), "pro_dep")
         with c3:
-            res_sel = st.multiselect("Responsáveis", res, default=res)
-        mask = pd.Series(True, index=dfp.index)
-        if emp: mask &= dfp["empresa"].isin(emp_sel)
-        if dep: mask &= dfp["departamento"].isin(dep_sel)
-        if res: mask &= dfp["responsavel"].isin(res_sel)
+            res_sel = filtro_busca("Responsáveis", indice_valores(dfp, versao, "responsavel"), "pro_res")
+        mask = filters_mask(dfp, {"empresa": emp_sel, "departamento": dep_sel, "responsavel": res_sel})
         dfp = dfp[mask].copy()
 
         total = len(dfp)
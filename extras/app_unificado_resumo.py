@@ -1,6 +1,7 @@
 
 import io
 import os
+import sys
 from datetime import date, datetime, timedelta
 
 import numpy as np
@@ -8,6 +9,9 @@ import pandas as pd
 import plotly.express as px
 import streamlit as st
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from diagnostico import build_date_indexes, risk_scores, top_k
+
 st.set_page_config(page_title="Acessórias — Diagnóstico Unificado (com Resumo)", layout="wide")
 
 st.title("📊 Acessórias — Diagnóstico Unificado por Cliente")
@@ -71,7 +75,8 @@ def map_columns_ui(title, df: pd.DataFrame, required_map: dict, key_prefix: str)
     return picked
 
 def apply_mapping(df: pd.DataFrame, mapping: dict):
-    return df.rename(columns=mapping)
+    # mapping é {alvo: coluna da planilha}; renomeia coluna -> alvo
+    return df.rename(columns={v: k for k, v in mapping.items()})
 
 # ============== Sidebar uploads ==============
 
@@ -82,6 +87,8 @@ with st.sidebar:
     up_obrig = st.file_uploader("Obrigações (XLSX/CSV)", type=["xlsx","csv"])
     up_proc = st.file_uploader("Gestão de Processos (XLSX/CSV)", type=["xlsx","csv"])
     up_resp = st.file_uploader("Responsáveis & Departamentos (XLS/XLSX/CSV)", type=["xls","xlsx","csv"])
+    data_ref = st.date_input("📆 Data de referência", value=date.today(), format="DD/MM/YYYY",
+                             help="Flags e idades são calculadas nesta data (use uma data passada para reproduzir um diagnóstico).")
     st.markdown("---")
     st.caption("Dica: mapeie colunas nas abas; o **Resumo** usa o que estiver carregado.")
 
@@ -93,6 +100,8 @@ tabs = st.tabs(["🏠 Resumo", "🧾 Entregas", "📨 Solicitações", "📅 Obr
 for key in ["dfe","dfs","dfo","dfp","dfr"]:
     if key not in st.session_state:
         st.session_state[key] = None
+    if f"{key}_idx" not in st.session_state:
+        st.session_state[f"{key}_idx"] = {}
 
 # ---------- 🧾 Entregas ----------
 with tabs[1]:
@@ -118,20 +127,17 @@ with tabs[1]:
         if "status" in df_ent.columns:
             df_ent["status"] = df_ent["status"].map(_norm_status).fillna(df_ent["status"])
 
-        today = pd.to_datetime(date.today())
+        today = pd.to_datetime(data_ref)
+        # índices de datas antes das flags: pendentes vencidas e em risco são fatias do índice de vencimento
+        idx_ent = build_date_indexes(df_ent)
         if "data_vencimento" in df_ent.columns:
+            pendente = (df_ent.get("status","").str.lower()!="concluída").to_numpy(dtype=bool)
             df_ent["atrasada_concluida"] = np.where(
                 (df_ent.get("status","").str.lower()=="concluída") & df_ent.get("data_entrega").notna() & (df_ent.get("data_entrega") > df_ent.get("data_vencimento")),
                 True, False
             )
-            df_ent["atrasada_pendente"] = np.where(
-                (df_ent.get("status","").str.lower()!="concluída") & df_ent.get("data_vencimento").notna() & (today > df_ent.get("data_vencimento")),
-                True, False
-            )
-            df_ent["em_risco"] = np.where(
-                (df_ent.get("status","").str.lower()!="concluída") & df_ent.get("data_vencimento").notna() & ((df_ent.get("data_vencimento") - today).dt.days.between(0,2)),
-                True, False
-            )
+            df_ent["atrasada_pendente"] = pendente & idx_ent["data_vencimento"].mask(len(df_ent), None, today)
+            df_ent["em_risco"] = pendente & idx_ent["data_vencimento"].mask(len(df_ent), today, today + pd.Timedelta(days=3))
             df_ent["pontual"] = np.where(
                 (df_ent.get("status","").str.lower()=="concluída") & df_ent.get("data_entrega").notna() & (df_ent.get("data_entrega") <= df_ent.get("data_vencimento")),
                 True, False
@@ -147,6 +153,7 @@ with tabs[1]:
             )
         # Save to session
         st.session_state["dfe"] = df_ent
+        st.session_state["dfe_idx"] = idx_ent
         st.success("Entregas carregadas e mapeadas.")
     else:
         st.info("Envie a planilha de **Gestão de Entregas** na barra lateral.")
@@ -174,7 +181,7 @@ with tabs[2]:
         if "status" in dfr.columns:
             dfr["status"] = dfr["status"].map(_norm_status).fillna(dfr["status"])
         # Enrich
-        today = pd.to_datetime(date.today())
+        today = pd.to_datetime(data_ref)
         dfr["tempo_ate_conclusao_dias"] = np.where(
             dfr.get("conclusao").notna() & dfr.get("abertura").notna(),
             (dfr.get("conclusao") - dfr.get("abertura")).dt.days,
@@ -187,6 +194,7 @@ with tabs[2]:
         )
         # Save
         st.session_state["dfs"] = dfr
+        st.session_state["dfs_idx"] = build_date_indexes(dfr)
         st.success("Solicitações carregadas e mapeadas.")
     else:
         st.info("Envie a planilha de **Solicitações** na barra lateral.")
@@ -238,6 +246,7 @@ with tabs[4]:
         if "status" in dfp.columns:
             dfp["status"] = dfp["status"].map(_norm_status).fillna(dfp["status"])
         st.session_state["dfp"] = dfp
+        st.session_state["dfp_idx"] = build_date_indexes(dfp, ("inicio", "conclusao"))
         st.success("Processos carregados e mapeados.")
         st.dataframe(dfp.head(50))
     else:
@@ -299,20 +308,33 @@ with tabs[0]:
     st.markdown("---")
     st.subheader("🚨 Dados perigosos (prioridades de ação)")
 
+    # score de risco único (prazo, atraso, prioridade, tempo parado, histórico de atraso de responsável/empresa)
+    scores = risk_scores(st.session_state.get("dfe"), st.session_state.get("dfs"), st.session_state.get("dfp"), data_ref)
+    if not scores.empty:
+        st.markdown("**🎯 Fila única de ação (TOP 200 por score de risco)**")
+        fila = scores.iloc[top_k(scores["score"].to_numpy(), 200)].drop(columns=["linha"])
+        st.dataframe(fila.assign(score=fila["score"].round(2)), hide_index=True)
+        st.markdown("---")
+    score_por = {o: g.set_index("linha")["score"] for o, g in scores.groupby("origem")}
+
     # 1) Entregas em risco (vencem em até 2 dias) e pendentes vencidas
     if isinstance(st.session_state.get("dfe"), pd.DataFrame):
         dfe = st.session_state["dfe"]
-        hoje = pd.to_datetime(date.today())
+        hoje = pd.to_datetime(data_ref)
         perigosas = pd.DataFrame()
         if {"empresa","obrigacao","data_vencimento","status"}.issubset(dfe.columns):
-            em_risco = dfe[(dfe.get("status","").str.lower()!="concluída") & (dfe.get("data_vencimento").notna()) & ((dfe.get("data_vencimento") - hoje).dt.days.between(0,2))]
-            vencidas = dfe[(dfe.get("status","").str.lower()!="concluída") & (dfe.get("data_vencimento").notna()) & (hoje > dfe.get("data_vencimento"))]
+            idx_venc = st.session_state["dfe_idx"]["data_vencimento"]
+            em_risco = dfe.iloc[idx_venc.window(hoje, hoje + pd.Timedelta(days=3))]
+            em_risco = em_risco[em_risco["status"].str.lower()!="concluída"]
+            vencidas = dfe.iloc[idx_venc.window(None, hoje)]
+            vencidas = vencidas[vencidas["status"].str.lower()!="concluída"]
             perigosas = pd.concat([em_risco.assign(_flag="EM RISCO (≤2 dias)"),
-                                   vencidas.assign(_flag="PENDENTE VENCIDA")], ignore_index=True)
+                                   vencidas.assign(_flag="PENDENTE VENCIDA")])
+            perigosas["score"] = score_por.get("Entregas", pd.Series(dtype=float)).reindex(perigosas.index).round(2).to_numpy()
         if not perigosas.empty:
             st.markdown("**Entregas críticas (seleção)**")
-            show_cols = [c for c in ["_flag","empresa","obrigacao","departamento","responsavel_entrega","competencia","data_vencimento","status","dias_atraso","protocolo"] if c in perigosas.columns]
-            st.dataframe(perigosas.sort_values(["_flag","data_vencimento"]).head(200)[show_cols])
+            show_cols = [c for c in ["score","_flag","empresa","obrigacao","departamento","responsavel_entrega","competencia","data_vencimento","status","dias_atraso","protocolo"] if c in perigosas.columns]
+            st.dataframe(perigosas.iloc[top_k(perigosas["score"].to_numpy(), 200)][show_cols])
         else:
             st.info("Sem entregas críticas identificadas.")
     else:
@@ -322,9 +344,9 @@ with tabs[0]:
 
     # 2) Empresas com maior volume de atrasos (últimos 30 dias)
     if isinstance(st.session_state.get("dfe"), pd.DataFrame) and "data_vencimento" in st.session_state["dfe"].columns:
-        dfe = st.session_state["dfe"].copy()
-        cutoff = pd.to_datetime(date.today()) - pd.Timedelta(days=30)
-        recent = dfe[dfe["data_vencimento"] >= cutoff]
+        dfe = st.session_state["dfe"]
+        cutoff = pd.to_datetime(data_ref) - pd.Timedelta(days=30)
+        recent = dfe.iloc[st.session_state["dfe_idx"]["data_vencimento"].window(cutoff)]
         if not recent.empty:
             late_recent = recent[(recent.get("atrasada_concluida", False)) | (recent.get("atrasada_pendente", False))]
             if not late_recent.empty and "empresa" in late_recent.columns:
@@ -341,18 +363,21 @@ with tabs[0]:
     # 3) Solicitações abertas há muito tempo / prioridade alta sem atualização
     if isinstance(st.session_state.get("dfs"), pd.DataFrame):
         dfs = st.session_state["dfs"]
-        hoje = pd.to_datetime(date.today())
+        hoje = pd.to_datetime(data_ref)
         perigos_solic = pd.DataFrame()
-        if "aberta_ha_dias" in dfs.columns:
-            long_open = dfs[(dfs["conclusao"].isna()) & (dfs["aberta_ha_dias"] >= 14)]
+        if "aberta_ha_dias" in dfs.columns and "abertura" in st.session_state["dfs_idx"]:
+            # candidatas pelo índice de abertura (abertas até 13 dias atrás); o critério exato só nessa fatia
+            long_open = dfs.iloc[st.session_state["dfs_idx"]["abertura"].window(None, hoje - pd.Timedelta(days=13))]
+            long_open = long_open[(long_open["conclusao"].isna()) & (long_open["aberta_ha_dias"] >= 14)]
             perigos_solic = pd.concat([perigos_solic, long_open.assign(_flag="ABERTA ≥14 dias")])
         if {"prioridade","ultima_atualizacao"}.issubset(dfs.columns):
             sem_upd = dfs[(dfs["conclusao"].isna()) & (dfs["prioridade"].str.contains("alta", case=False, na=False)) & ((hoje - dfs["ultima_atualizacao"]).dt.days >= 3)]
             perigos_solic = pd.concat([perigos_solic, sem_upd.assign(_flag="PRIORIDADE ALTA sem atualização ≥3 dias")])
         if not perigos_solic.empty:
+            perigos_solic["score"] = score_por.get("Solicitações", pd.Series(dtype=float)).reindex(perigos_solic.index).round(2).to_numpy()
             st.markdown("**Solicitações críticas (seleção)**")
-            show_cols = [c for c in ["_flag","id","assunto","empresa","prioridade","responsavel","abertura","prazo","ultima_atualizacao","status","aberta_ha_dias","tempo_ate_conclusao_dias"] if c in perigos_solic.columns]
-            st.dataframe(perigos_solic.sort_values(["_flag","abertura"]).head(200)[show_cols])
+            show_cols = [c for c in ["score","_flag","id","assunto","empresa","prioridade","responsavel","abertura","prazo","ultima_atualizacao","status","aberta_ha_dias","tempo_ate_conclusao_dias"] if c in perigos_solic.columns]
+            st.dataframe(perigos_solic.iloc[top_k(perigos_solic["score"].to_numpy(), 200)][show_cols])
         else:
             st.info("Sem solicitações críticas identificadas.")
     else:
@@ -363,12 +388,15 @@ with tabs[0]:
     # 4) Processos estourando prazo (p.ex. >30 dias em andamento)
     if isinstance(st.session_state.get("dfp"), pd.DataFrame):
         dfp = st.session_state["dfp"]
-        hoje = pd.to_datetime(date.today())
+        hoje = pd.to_datetime(data_ref)
         if {"inicio","conclusao","status"}.issubset(dfp.columns):
-            dur = np.where(dfp["conclusao"].notna(), (dfp["conclusao"] - dfp["inicio"]).dt.days,
-                          (hoje - dfp["inicio"]).dt.days)
-            dfp2 = dfp.copy()
-            dfp2["duracao_dias"] = dur
+            # ≥30 dias exige início até 29 dias atrás, salvo conclusão marcada no futuro: só essas linhas são medidas
+            idx_proc = st.session_state["dfp_idx"]
+            linhas = np.union1d(idx_proc["inicio"].window(None, hoje - pd.Timedelta(days=29)),
+                                idx_proc["conclusao"].window(hoje + pd.Timedelta(days=1)))
+            dfp2 = dfp.iloc[linhas].copy()
+            dfp2["duracao_dias"] = np.where(dfp2["conclusao"].notna(), (dfp2["conclusao"] - dfp2["inicio"]).dt.days,
+                                            (hoje - dfp2["inicio"]).dt.days)
             crit = dfp2[(dfp2.get("status","").str.lower()!="concluída") & (dfp2["duracao_dias"] >= 30)]
             if not crit.empty:
                 st.markdown("**Processos críticos (em andamento ≥30 dias)**")
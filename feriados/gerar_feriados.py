@@ -0,0 +1,116 @@
+import argparse
+import csv
+import os
+from datetime import date, timedelta
+
+# Gera feriados.csv (data, nome, abrangencia) offline: nacionais (fixos + móveis da Páscoa)
+# e estaduais fixos. Feriados municipais ou pontos facultativos extras podem ser
+# acrescentados à mão no CSV, com a UF (ou o código que preferir) em `abrangencia`.
+# Toda UF aparece no CSV: as que não têm feriado estadual em dia útil ganham uma linha sem data,
+# e o app recusa uma UF que não esteja lá (em vez de tratá-la, calado, como só feriados nacionais).
+
+NACIONAIS_FIXOS = [
+    ((1, 1), "Confraternização Universal"),
+    ((4, 21), "Tiradentes"),
+    ((5, 1), "Dia do Trabalho"),
+    ((9, 7), "Independência do Brasil"),
+    ((10, 12), "Nossa Senhora Aparecida"),
+    ((11, 2), "Finados"),
+    ((11, 15), "Proclamação da República"),
+    ((12, 25), "Natal"),
+]
+
+UFS = ["AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA", "PB", "PE", "PI", "PR",
+       "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO"]
+
+# Consciência Negra (20/11) era feriado estadual nestas UFs antes de virar nacional (Lei 14.759/2023)
+CONSCIENCIA_NEGRA_ESTADUAL = {"AL", "AM", "AP", "MT", "RJ"}
+
+ESTADUAIS_FIXOS = {
+    "AC": [((1, 23), "Dia do Evangélico"), ((6, 15), "Aniversário do Acre"), ((9, 5), "Dia da Amazônia"), ((11, 17), "Tratado de Petrópolis")],
+    "AL": [((6, 24), "São João"), ((6, 29), "São Pedro"), ((9, 16), "Emancipação Política de Alagoas")],
+    "AM": [((9, 5), "Elevação do Amazonas à Categoria de Província")],
+    "AP": [((3, 19), "São José"), ((9, 13), "Criação do Território do Amapá")],
+    "BA": [((7, 2), "Independência da Bahia")],
+    "CE": [((3, 19), "São José"), ((3, 25), "Data Magna do Ceará")],
+    "DF": [((11, 30), "Dia do Evangélico")],
+    # ES: Nossa Senhora da Penha é municipal (Vitória, Vila Velha); sem feriado estadual
+    "ES": [],
+    # GO: sem feriado estadual (o 24/10 é de Goiânia)
+    "GO": [],
+    "MA": [((7, 28), "Adesão do Maranhão à Independência")],
+    # MG: a Data Magna (21/04) coincide com Tiradentes
+    "MG": [],
+    "MS": [((10, 11), "Criação do Estado")],
+    # MT: só a Consciência Negra (ver CONSCIENCIA_NEGRA_ESTADUAL)
+    "MT": [],
+    "PA": [((8, 15), "Adesão do Grão-Pará à Independência")],
+    "PB": [((8, 5), "Fundação do Estado")],
+    "PE": [((3, 6), "Revolução Pernambucana")],
+    "PI": [((10, 19), "Dia do Piauí")],
+    "PR": [((12, 19), "Emancipação Política do Paraná")],
+    "RJ": [((4, 23), "Dia de São Jorge")],
+    "RN": [((10, 3), "Mártires de Cunhaú e Uruaçu")],
+    "RO": [((1, 4), "Criação do Estado"), ((6, 18), "Dia do Evangélico")],
+    "RR": [((10, 5), "Criação de Roraima")],
+    "RS": [((9, 20), "Revolução Farroupilha")],
+    # SC: a Data Magna (11/08) e Santa Catarina (25/11) são comemoradas no domingo seguinte
+    "SC": [],
+    "SE": [((7, 8), "Emancipação Política de Sergipe")],
+    "SP": [((7, 9), "Revolução Constitucionalista")],
+    "TO": [((9, 8), "Nossa Senhora da Natividade"), ((10, 5), "Criação do Estado")],
+}
+assert sorted(ESTADUAIS_FIXOS) == sorted(UFS), "toda UF precisa de uma entrada (lista vazia = sem feriado estadual)"
+
+def pascoa(ano: int) -> date:
+    # algoritmo de Meeus/Jones/Butcher (calendário gregoriano)
+    a, b, c = ano % 19, ano // 100, ano % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes = (h + l - 7 * m + 114) // 31
+    dia = (h + l - 7 * m + 114) % 31 + 1
+    return date(ano, mes, dia)
+
+def feriados(ano: int):
+    for (m, d), nome in NACIONAIS_FIXOS:
+        yield date(ano, m, d), nome, "BR"
+    if ano >= 2024:
+        yield date(ano, 11, 20), "Dia Nacional de Zumbi e da Consciência Negra", "BR"
+    p = pascoa(ano)
+    # Carnaval e Corpus Christi são pontos facultativos, mas na prática contábil não são dias úteis
+    yield p - timedelta(days=48), "Carnaval (segunda-feira)", "BR"
+    yield p - timedelta(days=47), "Carnaval (terça-feira)", "BR"
+    yield p - timedelta(days=2), "Sexta-feira Santa", "BR"
+    yield p + timedelta(days=60), "Corpus Christi", "BR"
+    for uf, lista in ESTADUAIS_FIXOS.items():
+        for (m, d), nome in lista:
+            yield date(ano, m, d), nome, uf
+        if uf in CONSCIENCIA_NEGRA_ESTADUAL and ano < 2024:
+            yield date(ano, 11, 20), "Dia da Consciência Negra", uf
+
+def main():
+    ap = argparse.ArgumentParser(description="Gera o calendário de feriados usado no modo dias úteis.")
+    ap.add_argument("--inicio", type=int, default=2015)
+    ap.add_argument("--fim", type=int, default=2035)
+    ap.add_argument("--saida", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "feriados.csv"))
+    args = ap.parse_args()
+    linhas = sorted(set(f for ano in range(args.inicio, args.fim + 1) for f in feriados(ano)))
+    with open(args.saida, "w", newline="", encoding="utf-8") as fh:
+        w = csv.writer(fh)
+        w.writerow(["data", "nome", "abrangencia"])
+        for d, nome, abr in linhas:
+            w.writerow([d.isoformat(), nome, abr])
+        # UFs sem nenhum feriado estadual gerado: linha sem data, só para registrar que foram consideradas
+        com_feriado = {abr for _, _, abr in linhas}
+        for uf in UFS:
+            if uf not in com_feriado:
+                w.writerow(["", "(sem feriado estadual)", uf])
+    print(f"{len(linhas)} feriados gravados em {args.saida}")
+
+if __name__ == "__main__":
+    main()
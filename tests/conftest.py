@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+from diagnostico import load_dataset
+
+AMOSTRA = os.path.join(RAIZ, "samples", "entregas_sample.csv")
+
+@pytest.fixture(scope="session")
+def hoje():
+    return "2025-07-20"
+
+@pytest.fixture(scope="session")
+def dfe(hoje):
+    # a amostra já vem em ISO (aaaa-mm-dd); quem altera o DataFrame trabalha numa cópia
+    with open(AMOSTRA, "rb") as f:
+        return load_dataset(f, "entregas_sample.csv", "entregas", hoje, dayfirst=False)
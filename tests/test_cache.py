@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+from diagnostico import CacheDatasets, DateIndex, build_date_indexes, load_columnar, save_columnar
+
+def test_colunar_ida_e_volta_sem_pickle(tmp_path):
+    df = pd.DataFrame({"empresa": ["A", None, "B"], "n": pd.array([1, None, 3], dtype="Int64"),
+                       "data_vencimento": pd.to_datetime(["2025-01-01", None, "2025-02-01"]),
+                       "misto": np.array([1, "z", np.nan], dtype=object)}, index=[10, 11, 12])
+    caminho = str(tmp_path / "df.npz")
+    save_columnar(df, caminho)
+    with np.load(caminho, allow_pickle=False) as z:
+        assert all(z[k].dtype != object for k in z.files)
+    volta = load_columnar(caminho)
+    pd.testing.assert_frame_equal(volta, df)
+
+def test_despejo_leva_os_indices_de_datas_para_o_disco(tmp_path):
+    df = pd.DataFrame({"data_vencimento": pd.to_datetime(["2025-01-01", "2025-03-01", None])})
+    cache = CacheDatasets(memoria_mb=0, pasta=str(tmp_path))
+    cache.put("a", {"dfe": df, "idx": build_date_indexes(df)})
+    estrutura, _ = cache.em_disco["a"]
+    assert not isinstance(estrutura["idx"]["data_vencimento"], DateIndex)
+    idx = cache.get("a")["idx"]["data_vencimento"]
+    assert idx.window(pd.Timestamp("2025-02-01")).tolist() == [1]
@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+from diagnostico import UFS, expand_calendar, load_holidays, missing_deliveries
+
+OBRIGACOES = pd.DataFrame({"obrigacao": ["ECF", "GIA", "DCTFWeb"], "periodicidade": ["Anual", "Trimestral", "Mensal"],
+                           "prazo_mensal": ["Dia 31", "Dia 15", "Dia 20"]})
+
+def _faltantes(linhas, inicio="2024-01-01", fim="2025-12-31"):
+    dfe = pd.DataFrame(linhas, columns=["empresa", "obrigacao", "data_vencimento"])
+    dfe["data_vencimento"] = pd.to_datetime(dfe["data_vencimento"])
+    cal = expand_calendar(OBRIGACOES, dfe, inicio, fim)
+    return cal, missing_deliveries(cal, dfe)
+
+def test_anual_usa_o_mes_do_historico():
+    cal, faltantes = _faltantes([("Acme", "ECF", "2024-07-31"), ("Acme", "ECF", "2025-07-31")])
+    assert cal["vencimento_previsto"].dt.strftime("%Y-%m-%d").tolist() == ["2024-07-31", "2025-07-31"]
+    assert faltantes.empty
+
+def test_trimestral_ancorado_no_historico():
+    cal, faltantes = _faltantes([("Acme", "GIA", "2025-02-15"), ("Acme", "GIA", "2025-05-15")], "2025-01-01", "2025-12-31")
+    assert cal["vencimento_previsto"].dt.month.tolist() == [2, 5, 8, 11]
+    assert faltantes["vencimento_previsto"].dt.month.tolist() == [8, 11]
+
+def test_entrega_fora_do_mes_exato_conta_para_o_periodo():
+    # GIA de fevereiro com vencimento lançado em março: mesmo trimestre, não é faltante
+    _, faltantes = _faltantes([("Acme", "GIA", "2025-02-15"), ("Acme", "GIA", "2025-06-15")], "2025-01-01", "2025-06-30")
+    assert faltantes.empty
+
+def test_empresa_sem_historico_usa_a_ancora_da_obrigacao():
+    cal, _ = _faltantes([("Acme", "ECF", "2025-07-31"), ("Beta", "ECF", None)], "2025-01-01", "2025-12-31")
+    assert sorted(cal["empresa"] + "@" + cal["vencimento_previsto"].dt.strftime("%m")) == ["Acme@07", "Beta@07"]
+
+def test_todas_as_ufs_tem_feriados():
+    nacionais = set(load_holidays())
+    for uf in UFS:
+        assert nacionais <= set(load_holidays(uf))
+    assert pd.Timestamp("2023-11-20").to_datetime64().astype("datetime64[D]") in load_holidays("MT")
+
+def test_uf_sem_dados_falha():
+    with pytest.raises(ValueError, match="XX"):
+        load_holidays("XX")
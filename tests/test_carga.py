@@ -0,0 +1,13 @@
+import pytest
+import streamlit
+
+import carga
+
+def test_partes_internas_do_streamlit_conferem():
+    # se falhar, o modo app do teste de carga precisa ser revisto para a versão instalada
+    carga._conferir_streamlit()
+
+def test_outra_versao_do_streamlit_falha(monkeypatch):
+    monkeypatch.setattr(streamlit, "__version__", "9.0.0")
+    with pytest.raises(RuntimeError, match="9.0.0"):
+        carga._conferir_streamlit()
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from diagnostico import overloaded, workload_curves, workload_intervals
+
+def test_intervalos_abertos_vao_ate_hoje(hoje):
+    dfp = pd.DataFrame({"responsavel": ["Ana", "Bia"], "inicio": pd.to_datetime(["2025-07-01", "2025-07-10"]),
+                        "conclusao": pd.to_datetime(["2025-07-05", None])})
+    dfe = pd.DataFrame({"responsavel_entrega": ["Ana", "Ana"], "competencia": pd.to_datetime(["2025-07-15", None]),
+                        "data_vencimento": pd.to_datetime(["2025-07-25", "2025-07-30"]),
+                        "data_entrega": pd.to_datetime([None, None]), "status": ["Pendente", "Concluída"]})
+    iv = workload_intervals(dfe, dfp, hoje)
+    # processo e entrega pendentes ficam abertos até hoje; a concluída sem data de entrega não tem fim
+    assert iv["origem"].tolist() == ["Processos", "Processos", "Entregas"]
+    assert iv["fim"].dt.strftime("%d").tolist() == ["05", "20", "20"]
+
+def test_curva_conta_sobreposicao_por_dia():
+    iv = pd.DataFrame({"responsavel": ["Ana", "Ana", "Bia"],
+                       "inicio": pd.to_datetime(["2025-07-01", "2025-07-03", "2025-07-02"]),
+                       "fim": pd.to_datetime(["2025-07-03", "2025-07-04", "2025-07-02"])})
+    c = workload_curves(iv, "responsavel")
+    assert c["Ana"].tolist() == [1, 1, 2, 1]
+    assert c["Bia"].tolist() == [0, 1, 0, 0]
+    # janela recortada: o intervalo que começou antes entra no primeiro dia
+    assert workload_curves(iv, "responsavel", "2025-07-02", "2025-07-03")["Ana"].tolist() == [1, 2]
+    pico = overloaded(c, 1).set_index("grupo")
+    assert pico.loc["Ana", "pico"] == 2 and pico.loc["Ana", "dias_acima"] == 1
@@ -0,0 +1,39 @@
+import json
+import os
+
+from diagnostico import load_portfolio, save_client_summary
+
+RESUMO = {"hoje": "2025-07-20", "parametros": {}, "kpis": {"entregas": 1}, "mensal": {"mes": []}, "obrigacoes": []}
+
+def test_clientes_com_o_mesmo_nome_de_arquivo_nao_se_sobrescrevem(tmp_path):
+    a = save_client_summary(RESUMO, "Cliente/B", str(tmp_path))
+    b = save_client_summary(RESUMO, "Cliente B", str(tmp_path))
+    assert a != b
+    assert sorted(load_portfolio(str(tmp_path))["kpis"].index) == ["Cliente B", "Cliente/B"]
+
+def test_guardar_de_novo_substitui_o_resumo(tmp_path):
+    save_client_summary(RESUMO, "Acme", str(tmp_path))
+    save_client_summary({**RESUMO, "kpis": {"entregas": 2}}, "Acme", str(tmp_path))
+    kpis = load_portfolio(str(tmp_path))["kpis"]
+    assert list(kpis.index) == ["Acme"] and kpis.loc["Acme", "entregas"] == 2
+
+def test_arquivo_do_formato_antigo_e_substituido(tmp_path):
+    with open(tmp_path / "Acme.json", "w", encoding="utf-8") as f:
+        json.dump({"cliente": "Acme", **RESUMO}, f)
+    save_client_summary(RESUMO, "Acme", str(tmp_path))
+    assert list(load_portfolio(str(tmp_path))["kpis"].index) == ["Acme"]
+
+def test_resumo_ilegivel_e_ignorado(tmp_path):
+    save_client_summary(RESUMO, "Acme", str(tmp_path))
+    (tmp_path / "Quebrado.json").write_text('{"cliente": "Que', encoding="utf-8")
+    (tmp_path / "Lista.json").write_text("[1, 2]", encoding="utf-8")
+    # o arquivo antigo de mesmo nome está corrompido: fica onde está, e o novo é gravado mesmo assim
+    save_client_summary(RESUMO, "Quebrado", str(tmp_path))
+    cart = load_portfolio(str(tmp_path))
+    assert sorted(cart["kpis"].index) == ["Acme", "Quebrado"]
+    assert cart["ignorados"] == ["Lista.json", "Quebrado.json"]
+
+def test_pasta_padrao_ao_lado_do_modulo():
+    import diagnostico
+    if "ACESSORIAS_CARTEIRA" not in os.environ:
+        assert diagnostico.CARTEIRA_PASTA == os.path.join(os.path.dirname(os.path.abspath(diagnostico.__file__)), "carteira")
@@ -0,0 +1,54 @@
+import pandas as pd
+
+from diagnostico import resolve_client_companies, resolve_companies
+
+def _ids(linhas):
+    r = resolve_companies(pd.DataFrame(linhas, columns=["empresa", "cnpj", "n"]))
+    return dict(zip(r["empresa"], r["empresa_id"]))
+
+def test_numeros_diferentes_nao_juntam():
+    ids = _ids([("Posto Sol 1", None, 3), ("Posto Sol 2", None, 2), ("Loja 01 Comercio", None, 1),
+                ("Loja 02 Comercio", None, 1)] + [(f"Empresa 1-{i}", None, 1) for i in range(6)])
+    assert len(set(ids.values())) == len(ids)
+
+def test_cnpjs_diferentes_nao_juntam_pelo_nome():
+    ids = _ids([("Padaria Central Ltda", "11.222.333/0001-81", 5), ("PADARIA CENTRAL LTDA.", "55.666.777/0001-10", 2)])
+    assert ids["Padaria Central Ltda"] != ids["PADARIA CENTRAL LTDA."]
+
+def test_variacoes_do_mesmo_nome_juntam():
+    ids = _ids([("Alpha Comércio Ltda", "11.222.333/0001-81", 5), ("ALPHA COMERCIO LTDA.", None, 2),
+                ("Alpha Comercio", "11.222.333/0002-62", 1), ("Alpha Comerico Ltda", None, 1)])
+    assert len(set(ids.values())) == 1
+
+def test_cnpj_de_preenchimento_nao_junta():
+    ids = _ids([("Beta Servicos", "00.000.000/0001-00", 3), ("Gama Transportes", "00.000.000/0001-00", 3)])
+    assert ids["Beta Servicos"] != ids["Gama Transportes"]
+
+def test_plural_e_troca_de_letras_juntam_nomes_parecidos_nao():
+    ids = _ids([("Transportes Silva", None, 2), ("Transporte Silva Ltda", None, 1), ("Padaria Central", None, 1),
+                ("Padaria Centro", None, 1), ("Padaria Centrla", None, 1)])
+    assert ids["Transportes Silva"] == ids["Transporte Silva Ltda"]
+    assert ids["Padaria Central"] == ids["Padaria Centrla"] != ids["Padaria Centro"]
+
+def test_nome_sem_cnpj_vai_para_o_grupo_da_ligacao_mais_forte():
+    ids = _ids([("Alpha Comercio de Alimentos de Santos", "11.222.333/0001-81", 3),
+                ("Alpha Comercio de Alimentos de Sorocaba", "55.666.777/0001-10", 3),
+                ("ALPHA COMERCIO DE ALIMENTOS DE SANTOS", None, 1), ("ALPHA COMERCIO DE ALIMENTOS DE SOROCABA", None, 1)])
+    assert ids["ALPHA COMERCIO DE ALIMENTOS DE SANTOS"] == ids["Alpha Comercio de Alimentos de Santos"]
+    assert ids["ALPHA COMERCIO DE ALIMENTOS DE SOROCABA"] == ids["Alpha Comercio de Alimentos de Sorocaba"]
+
+def test_unificacao_guardada_por_cliente(tmp_path):
+    mes1 = pd.DataFrame([("Alpha Comercio Ltda", "11.222.333/0001-81", 5), ("Beta Servicos", None, 2)],
+                        columns=["empresa", "cnpj", "n"])
+    r1 = resolve_client_companies(mes1, "acme", str(tmp_path)).set_index("empresa")
+    mes2 = pd.DataFrame([("Gama Transportes", None, 4), ("ALPHA COMERCIO", None, 1), ("Beta Servicos", None, 1)],
+                        columns=["empresa", "cnpj", "n"])
+    r2 = resolve_client_companies(mes2, "acme", str(tmp_path)).set_index("empresa")
+    # ids do primeiro mês não mudam; o nome novo entra no grupo existente; empresa nova ganha id novo
+    assert r2.loc["Alpha Comercio Ltda", "empresa_id"] == r1.loc["Alpha Comercio Ltda", "empresa_id"]
+    assert r2.loc["Beta Servicos", "empresa_id"] == r1.loc["Beta Servicos", "empresa_id"]
+    assert r2.loc["ALPHA COMERCIO", "empresa_canonica"] == "Alpha Comercio Ltda"
+    assert r2.loc["Gama Transportes", "empresa_id"] not in set(r1["empresa_id"])
+    # outro cliente não enxerga a unificação deste
+    r3 = resolve_client_companies(mes2, "outro", str(tmp_path)).set_index("empresa")
+    assert r3.loc["ALPHA COMERCIO", "empresa_canonica"] == "ALPHA COMERCIO"
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from diagnostico import enrich_entregas, flag_em_risco, lookup
+
+def test_lookup_normaliza_e_primeira_chave_vence():
+    out = lookup(pd.Series([" ECF", "gia", "Folha", None]), pd.Series(["ecf", "GIA", "ECF"]), pd.Series([1, 2, 3]))
+    assert out.tolist()[:2] == [1, 2]
+    assert out.iloc[2:].isna().all()
+
+def test_enriquece_alerta_e_departamento_faltante():
+    dfe = pd.DataFrame({"obrigacao": ["ECF", "GIA", "Folha"], "responsavel_entrega": ["Ana", "Bia", "Ana"],
+                        "departamento": [None, "Fiscal", None]})
+    dfo = pd.DataFrame({"obrigacao": ["ecf", "GIA"], "alerta_dias": ["10 dias", "2"], "periodicidade": ["Anual", "Mensal"]})
+    dfr = pd.DataFrame({"responsavel": ["ana", "Bia"], "departamento": ["Contábil", "Pessoal"]})
+    out = enrich_entregas(dfe, dfo, dfr)
+    assert out["alerta_dias"].tolist()[:2] == [10, 2] and np.isnan(out["alerta_dias"].iloc[2])
+    assert out["periodicidade"].tolist()[:2] == ["Anual", "Mensal"]
+    assert out["departamento"].tolist() == ["Contábil", "Fiscal", "Contábil"]
+    assert dfe["departamento"].isna().sum() == 2
+
+def test_em_risco_usa_a_janela_da_obrigacao(hoje):
+    dfe = pd.DataFrame({"data_vencimento": pd.to_datetime(["2025-07-28", "2025-07-28", "2025-07-22", "2025-07-19"]),
+                        "status": ["Pendente", "Pendente", "Pendente", "Pendente"],
+                        "alerta_dias": [10, np.nan, np.nan, 10]})
+    # 8 dias: dentro da janela de 10, fora do limite global de 3; vencida não está "em risco"
+    assert flag_em_risco(dfe, pd.Timestamp(hoje), 3).tolist() == [True, False, True, False]
+    assert flag_em_risco(dfe.assign(status="Concluída"), pd.Timestamp(hoje), 3).tolist() == [False] * 4
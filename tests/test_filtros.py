@@ -0,0 +1,17 @@
+import pandas as pd
+
+from diagnostico import ValueIndex, indice_valores
+
+def test_busca_prefixo_depois_contem_sem_acento():
+    vi = ValueIndex(pd.Series(["Ômega Ltda", "Alpha Omega", "Beta", "omega sul", None]))
+    assert vi.buscar("omega", 10) == ["Ômega Ltda", "omega sul", "Alpha Omega"]
+
+def test_varredura_do_contem_tem_teto():
+    vi = ValueIndex(pd.Series([f"a{i:05d}" for i in range(1000)] + ["zz alvo"]))
+    assert vi.buscar("alvo", 5, varredura=500) == []
+    assert vi.buscar("alvo", 5) == ["zz alvo"]
+
+def test_indice_por_versao():
+    df = pd.DataFrame({"empresa": ["A", "B"]})
+    assert indice_valores(df, ("v1",), "empresa") is indice_valores(df, ("v1",), "empresa")
+    assert indice_valores(df, ("v1",), "inexistente") is None
@@ -0,0 +1,54 @@
+import gzip
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+
+from diagnostico import open_members, read_many
+
+JAN = "Empresa;Status\nAcme;Pendente\nBeta;Concluída\n".encode()
+FEV = "empresa ;STATUS\nBeta;Concluída\nGama;Pendente\n".encode()
+
+def test_varios_arquivos_juntam_em_ordem_sem_repetidas():
+    chamadas = []
+    df = read_many([("jan.csv", JAN), ("fev.csv", FEV)], workers=2, progresso=lambda i, n: chamadas.append((i, n)))
+    # cabeçalhos normalizados; a linha repetida entre os meses fica só uma vez (a do primeiro arquivo)
+    assert df[["empresa", "status"]].values.tolist() == [["Acme", "Pendente"], ["Beta", "Concluída"], ["Gama", "Pendente"]]
+    assert df["arquivo_origem"].tolist() == ["jan.csv", "jan.csv", "fev.csv"]
+    assert chamadas == [(1, 2), (2, 2)]
+
+def test_um_arquivo_mantem_linhas_repetidas():
+    df = read_many([("jan.csv", JAN + "Acme;Pendente\n".encode())])
+    assert len(df) == 3
+
+def _zip(membros):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        for nome, conteudo in membros.items():
+            z.writestr(nome, conteudo)
+    return buf.getvalue()
+
+def test_gz_e_zip_leem_como_os_csvs_soltos():
+    soltos = read_many([("jan.csv", JAN), ("fev.csv", FEV)])
+    compactados = read_many([("jan.csv.gz", gzip.compress(JAN)),
+                             ("meses.zip", _zip({"fev.csv": FEV, "leiame.md": b"x", "__MACOSX/fev.csv": b"x"}))])
+    assert compactados[["empresa", "status"]].equals(soltos[["empresa", "status"]])
+    assert compactados["arquivo_origem"].unique().tolist() == ["jan.csv", "meses.zip/fev.csv"]
+
+def test_zip_sem_dados_falha():
+    with pytest.raises(ValueError, match="vazio.zip"):
+        open_members("vazio.zip", _zip({"leiame.md": b"x"}))
+
+def test_so_as_colunas_mapeadas_sao_lidas():
+    df = read_many([("jan.csv", JAN)], colunas={"empresa"})
+    assert list(df.columns) == ["empresa", "arquivo_origem"]
+
+def test_xlsx_por_colunas_igual_ao_read_excel():
+    buf = io.BytesIO()
+    pd.DataFrame({"Empresa": ["Acme", None, "Beta"], "CNPJ": [1.0, 2.0, None], "Status": ["a", "b", "c"]}).to_excel(buf, index=False)
+    conteudo = buf.getvalue()
+    parcial = read_many([("jan.xlsx", conteudo)], colunas={"empresa", "cnpj"})
+    inteiro = read_many([("jan.xlsx", conteudo)])
+    assert list(parcial.columns) == ["empresa", "cnpj", "arquivo_origem"]
+    pd.testing.assert_frame_equal(parcial, inteiro[parcial.columns])
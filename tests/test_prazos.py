@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from diagnostico import calendar_grid, crunch_days, deadline_counts
+
+def test_contagens_batem_com_groupby(dfe, hoje):
+    c = deadline_counts(dfe, hoje, por="responsavel_entrega")
+    venc = dfe.dropna(subset=["data_vencimento"])
+    esperado = venc.groupby(["responsavel_entrega", "data_vencimento"]).size()
+    obtido = c["vencem"].stack()
+    assert obtido[obtido > 0].to_dict() == esperado.to_dict()
+    pendentes = venc[venc["status"].str.lower() != "concluída"].groupby("responsavel_entrega").size()
+    assert c["pendentes"].sum(axis=1)[pendentes.index].tolist() == pendentes.tolist()
+    assert (c["atrasadas"] <= c["vencem"]).all().all()
+
+def test_janela_corta_e_sem_grupo_vira_total(hoje):
+    dfe = pd.DataFrame({"data_vencimento": pd.to_datetime(["2025-07-10", "2025-07-10", "2025-07-25"]),
+                        "data_entrega": pd.to_datetime(["2025-07-12", None, None]),
+                        "status": ["Concluída", "Pendente", "Pendente"]})
+    c = deadline_counts(dfe, hoje, inicio="2025-07-10", fim="2025-07-12")
+    assert list(c["vencem"].index) == ["Total"] and c["vencem"].shape == (1, 3)
+    assert c["vencem"].iloc[0].tolist() == [2, 0, 0]
+    assert c["entregues"].iloc[0].tolist() == [0, 0, 1]
+    assert c["atrasadas"].iloc[0].tolist() == [2, 0, 0]
+
+def test_grade_e_dias_de_pico():
+    diario = pd.Series([1, 0, 5], index=pd.date_range("2025-07-06", periods=3))  # domingo a terça
+    grade = calendar_grid(diario)
+    assert grade.shape == (7, 2) and grade.loc["dom"].iloc[0] == 1 and grade.loc["ter"].iloc[1] == 5
+    assert np.isnan(grade.loc["seg"].iloc[0])
+    pico = crunch_days(pd.DataFrame([[1, 0, 5]], index=pd.Index(["Ana"], name="resp"), columns=diario.index), k=5)
+    assert pico["itens"].tolist() == [5, 1]
@@ -0,0 +1,27 @@
+import pandas as pd
+
+from diagnostico import apply_mapping, prepare_dataset, quality_profile
+
+def test_perfil_aponta_linhas_e_exemplos(hoje):
+    raw = pd.DataFrame({"empresa": ["Acme", "", "Beta"], "vencimento": ["10/07/2025", "31/02/2025", "15/07/2025"],
+                        "entrega": ["09/07/2025", None, None], "status": ["Concluída", "Em revisão", "Pendente"],
+                        "protocolo": ["P-1", "P-1", "P-2"]})
+    mapping = {"empresa": "empresa", "data_vencimento": "vencimento", "data_entrega": "entrega", "status": "status",
+               "protocolo": "protocolo"}
+    df = prepare_dataset(apply_mapping(raw.copy(), mapping), "entregas", hoje)
+    resumo, linhas = quality_profile(df, raw, mapping, "entregas")
+    resumo = resumo.set_index("checagem")
+    assert resumo.loc["data_vencimento: data inválida (virou vazio)", "exemplos"] == "31/02/2025"
+    assert resumo.loc["status não reconhecido", "linhas"] == 1
+    assert resumo.loc["empresa vazia", "exemplos"] == "linha 3"
+    assert resumo.loc["protocolo duplicado", "pct"] == round(200 / 3, 2)
+    # a linha 3 da planilha junta os quatro problemas
+    assert linhas["linha_planilha"].tolist() == [2, 3]
+    assert linhas.iloc[1]["problemas"].count(";") == 3
+
+def test_perfil_sem_problemas_nao_lista_linhas(hoje):
+    raw = pd.DataFrame({"inicio": ["01/07/2025"], "conclusao": ["05/07/2025"]})
+    mapping = {"inicio": "inicio", "conclusao": "conclusao"}
+    df = prepare_dataset(apply_mapping(raw.copy(), mapping), "processos", hoje)
+    resumo, linhas = quality_profile(df, raw, mapping, "processos")
+    assert resumo["linhas"].sum() == 0 and linhas.empty
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+import diagnostico
+from diagnostico import LRU, build_date_indexes, load_holidays, prepare_dataset, resumo_analitico, resumo_por_empresa
+
+@pytest.fixture(scope="module")
+def dfe(dfe):
+    # a amostra com algumas entregas sem vencimento
+    df = dfe.copy()
+    df.loc[df.index[:5], "data_vencimento"] = pd.NaT
+    return df
+
+def test_sem_periodo_mantem_sem_vencimento(dfe, hoje):
+    idx = build_date_indexes(dfe)
+    res = resumo_analitico(dfe, hoje=hoje, filtros={"periodo": None}, idx=idx)
+    assert res["entregas"]["total"] == len(dfe)
+    por_emp = resumo_por_empresa(dfe, hoje=hoje, filtros={}, idx=idx)
+    assert sum(r["entregas"]["total"] for r in por_emp.values()) == int(dfe["empresa"].notna().sum())
+
+def test_periodo_inteiro_tira_sem_vencimento(dfe, hoje):
+    idx = build_date_indexes(dfe)
+    datas = dfe["data_vencimento"].dropna()
+    periodo = (datas.min().date(), datas.max().date())
+    res = resumo_analitico(dfe, hoje=hoje, filtros={"periodo": periodo}, idx=idx)
+    assert res["entregas"]["total"] == len(datas)
+    por_emp = resumo_por_empresa(dfe, hoje=hoje, filtros={"periodo": periodo}, idx=idx)
+    assert sum(r["entregas"]["total"] for r in por_emp.values()) == int(dfe.loc[datas.index, "empresa"].notna().sum())
+
+def test_periodo_estreito_filtra(dfe, hoje):
+    idx = build_date_indexes(dfe)
+    dia = dfe["data_vencimento"].dropna().min().date()
+    res = resumo_analitico(dfe, hoje=hoje, filtros={"periodo": (dia, dia)}, idx=idx)
+    assert res["entregas"]["total"] == int((dfe["data_vencimento"].dt.date == dia).sum())
+
+def test_dias_uteis_prorroga_vencimento_em_fim_de_semana():
+    # 2025-07-19 é sábado: prazo vai para segunda 21/07, entrega na segunda não é atraso
+    df = pd.DataFrame({"data_vencimento": ["19/07/2025", "19/07/2025"], "data_entrega": ["21/07/2025", "22/07/2025"],
+                       "status": ["Concluída", "Concluída"]})
+    out = prepare_dataset(df, "entregas", "2025-07-31", feriados=load_holidays("SP"))
+    assert out["data_vencimento"].dt.strftime("%Y-%m-%d").tolist() == ["2025-07-21", "2025-07-21"]
+    assert out["atrasada_concluida"].tolist() == [False, True]
+    assert out["dias_atraso"].tolist() == [0, 1]
+
+def test_memo_recalcula_so_a_secao_que_mudou(dfe, hoje, monkeypatch):
+    chamadas = []
+    for nome in ["resumo_entregas", "resumo_solicitacoes"]:
+        original = getattr(diagnostico, nome)
+        monkeypatch.setattr(diagnostico, nome, lambda *a, _o=original, _n=nome: chamadas.append(_n) or _o(*a))
+    dfs = pd.DataFrame({"abertura": pd.to_datetime(["2025-07-01"]), "conclusao": pd.to_datetime([None]),
+                        "aberta_ha_dias": [19.0], "tempo_ate_conclusao_dias": [float("nan")]})
+    memo = LRU(8)
+    rodar = lambda dfs, versao_dfs, **params: resumo_analitico(dfe, dfs, hoje=hoje, params=params, memo=memo,
+                                                               versoes={"dfe": "e1", "dfs": versao_dfs})
+    primeiro = rodar(dfs, "s1")
+    assert rodar(dfs, "s1")["entregas"] is primeiro["entregas"]
+    assert chamadas == ["resumo_entregas", "resumo_solicitacoes"]
+    # outro limite recalcula só Entregas; outra versão das Solicitações recalcula só elas
+    rodar(dfs, "s1", dias_em_risco=5)
+    rodar(dfs.iloc[:0], "s2")
+    assert chamadas[2:] == ["resumo_entregas", "resumo_solicitacoes"]
+
+def test_lru_descarta_o_menos_usado():
+    lru = LRU(2)
+    lru.put("a", 1), lru.put("b", 2), lru.get("a"), lru.put("c", 3)
+    assert (lru.get("a"), lru.get("b"), lru.get("c")) == (1, None, 3)
@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+
+from diagnostico import late_probability, prepare_dataset, risk_queue
+
+@pytest.mark.parametrize("faltando", [["empresa"], ["responsavel_entrega"], ["empresa", "responsavel_entrega"]])
+def test_fila_sem_colunas_opcionais_entregas(dfe, hoje, faltando):
+    fila = risk_queue(dfe.drop(columns=faltando), hoje=hoje)
+    assert len(fila) == int((dfe["status"].str.lower() != "concluída").sum())
+
+def test_fila_sem_colunas_opcionais_solicitacoes_processos(hoje):
+    dfs = prepare_dataset(pd.DataFrame({"abertura": ["01/07/2025", "10/07/2025"], "conclusao": [None, None],
+                                        "prioridade": ["Alta", "Baixa"]}), "solicitacoes", hoje)
+    dfp = prepare_dataset(pd.DataFrame({"inicio": ["01/06/2025"], "conclusao": [None], "status": ["Em andamento"]}),
+                          "processos", hoje)
+    fila = risk_queue(dfs=dfs, dfp=dfp, hoje=hoje)
+    assert len(fila) == 3
+
+def test_probabilidade_de_atraso(hoje):
+    venc = pd.to_datetime(["2025-07-01"] * 8 + ["2025-07-25", "2025-07-25", "2025-07-10"])
+    entrega = pd.to_datetime(["2025-07-05"] * 4 + ["2025-06-30"] * 4 + [None] * 3)
+    dfe = pd.DataFrame({"data_vencimento": venc, "data_entrega": entrega,
+                        "status": ["Concluída"] * 8 + ["Pendente"] * 3,
+                        "responsavel_entrega": ["Ana"] * 4 + ["Bia"] * 4 + ["Ana", "Bia", "Bia"]})
+    p = late_probability(dfe, hoje)
+    assert p.iloc[:8].isna().all()
+    # quem sempre atrasou fica acima de quem nunca atrasou; a já vencida é certa
+    assert 0 < p.iloc[9] < p.iloc[8] < 1
+    assert p.iloc[10] == 1.0
+    assert late_probability(dfe.assign(status="Concluída"), hoje).isna().all()
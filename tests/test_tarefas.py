@@ -0,0 +1,37 @@
+import threading
+
+from diagnostico import GerenciadorTarefas
+
+def _espera(liberar, tarefa=None):
+    while not liberar.wait(0.01):
+        tarefa.reportar(0.5)
+    return "ok"
+
+def test_cancelar_de_uma_sessao_nao_afeta_as_outras():
+    g, liberar = GerenciadorTarefas(workers=1), threading.Event()
+    t = g.submeter("k", _espera, liberar, sessao="a")
+    assert g.submeter("k", _espera, liberar, sessao="b") is t
+    assert not g.desistir("k", "a")
+    liberar.set()
+    assert t.resultado() == "ok"
+
+def test_cancelar_de_todas_as_sessoes_interrompe():
+    g, liberar = GerenciadorTarefas(workers=1), threading.Event()
+    t = g.submeter("k", _espera, liberar, sessao="a")
+    g.submeter("k", _espera, liberar, sessao="b")
+    assert not g.desistir("k", "a")
+    assert g.desistir("k", "b")
+    assert t.cancelada and g.obter("k") is None
+
+def test_tarefa_com_erro_pode_ser_refeita():
+    g, tentativas = GerenciadorTarefas(workers=1), []
+    def falha_uma_vez(tarefa=None):
+        tentativas.append(1)
+        if len(tentativas) == 1:
+            raise ValueError("arquivo corrompido")
+        return "ok"
+    t = g.submeter("k", falha_uma_vez, sessao="a")
+    t.future.exception()
+    assert t.falhou and g.submeter("k", falha_uma_vez, sessao="a") is t
+    g.descartar("k")
+    assert g.submeter("k", falha_uma_vez, sessao="a").resultado() == "ok"